@@ -14,6 +14,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from celery.schedules import crontab
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -115,6 +116,9 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT', '5432'),
     }
 }
+# Separate database on the same server for benchmark_leaderboards' synthetic users (core/benchmarks.py)
+if os.getenv('BENCHMARK_DB_NAME'):
+    DATABASES['benchmark'] = {**DATABASES['default'], 'NAME': os.getenv('BENCHMARK_DB_NAME')}
 
 
 # Password validation
@@ -241,3 +245,41 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'rebuild-leaderboards': {
+        'task': 'core.tasks.rebuild_leaderboards_task',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'snapshot-weekly-leaderboards': {
+        'task': 'core.tasks.snapshot_leaderboards_task',
+        'schedule': crontab(hour=0, minute=30, day_of_week='monday'),
+        'args': ('week',),
+    },
+    'snapshot-monthly-leaderboards': {
+        'task': 'core.tasks.snapshot_leaderboards_task',
+        'schedule': crontab(hour=0, minute=45, day_of_month=1),
+        'args': ('month',),
+    },
+}
+
+
+# Garmin Sync Configuration (the async engine in garminconnect/engine.py)
+# Garmin requests in flight at once across all users of a bulk sync
+GARMIN_SYNC_CONCURRENCY = int(os.getenv('GARMIN_SYNC_CONCURRENCY', 32))
+
+
+# Cache Configuration (chart payloads and other per-user computed data)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_CACHE_URL', 'redis://redis:6379/1'),
+    }
+}
+CHART_CACHE_TIMEOUT = 60 * 60  # Seconds; entries are also invalidated on sync and friendship changes
+CHART_STREAM_MIN_POINTS = 200000  # Chart payloads with at least this many points are streamed, not cached
+
+# Leaderboard sorted sets (see core/leaderboards.py); the views use SQL until `rebuild_leaderboards` has run
+LEADERBOARD_REDIS_URL = os.getenv('LEADERBOARD_REDIS_URL', 'redis://redis:6379/2')
+LEADERBOARD_STREAM_TIMEOUT = int(os.getenv('LEADERBOARD_STREAM_TIMEOUT', 300))  # Seconds a live leaderboard stream stays open before the browser reconnects
+LEADERBOARD_BENCHMARK_REDIS_URL = os.getenv('LEADERBOARD_BENCHMARK_REDIS_URL', 'redis://redis:6379/3')  # Redis database benchmark_leaderboards writes its synthetic boards to
+LEADERBOARD_BENCHMARK_DATABASE = os.getenv('LEADERBOARD_BENCHMARK_DATABASE', 'benchmark')  # Database alias benchmark_leaderboards seeds its synthetic users into
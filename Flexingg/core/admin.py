@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.apps import apps
 from django.contrib.admin.sites import AlreadyRegistered, AdminSite
+from .models import SweatScoreWeights
 
 
 # class CustomModelAdmin(admin.ModelAdmin): #For use with non unfold admin
@@ -26,4 +27,12 @@ for model in app_models:
     try:
         admin.site.register(model, admin.ModelAdmin) 
     except AlreadyRegistered:
-        pass
\ No newline at end of file
+        pass
+
+
+@admin.register(SweatScoreWeights)
+class SweatScoreWeightsAdmin(admin.ModelAdmin):
+    # Saving a weight queues a background recompute of every stored activity sweat score
+    list_display = ('zone', 'name', 'perceived_effort', 'weight')
+    list_editable = ('weight',)
+    ordering = ('zone',)
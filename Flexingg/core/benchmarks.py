@@ -0,0 +1,375 @@
+import logging
+import math
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+import redis
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Min
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from garminconnect.models import GarminActivity, GarminDailySteps, UserDailyMetrics
+from social.models import Friendship as SocialFriendship, Group, GroupMembership
+from . import leaderboards
+from .leaderboards import READY_KEY, get_redis, rebuild_leaderboards
+from .models import DailyEarnings, Friendship, Transaction, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Synthetic users are named bench_0000000, bench_0000001, ...; the first one is the
+# user the pages are requested as, and gets the friends and the group
+BENCHMARK_PREFIX = 'bench_'
+BENCHMARK_GROUP_NAME = 'Leaderboard benchmark'
+
+# Pages timed by the benchmark: the parameters each one is requested with
+LEADERBOARD_VIEW_PARAMS = {
+    'metrics': ['steps', 'calories', 'sweatscore', 'cardiocoins', 'gymgems'],
+    'periods': ['all', 'week', 'month'],
+    'scopes': ['global', 'friends', 'group'],
+}
+SOCIAL_MAIN_PARAMS = {
+    'metrics': ['steps', 'calories', 'sweat', 'coins', 'gems'],
+    'periods': ['All Time', 'Weekly', 'Monthly'],
+    'scopes': ['Global', 'friends', 'group'],
+}
+
+
+def _username(index):
+    return f'{BENCHMARK_PREFIX}{index:07d}'
+
+
+def _user_days(rng, days, today):
+    """One user's synthetic history: per-day steps, and an activity every few days."""
+    history = []
+    step_level = rng.randint(2000, 14000)
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        activity = None
+        if rng.random() < 0.35:
+            duration = rng.randint(900, 5400)
+            activity = {
+                'duration_seconds': float(duration),
+                'calories': round(duration / 60 * rng.uniform(6, 12), 1),
+                'sweat_score': round(duration / 60 * rng.uniform(1, 4), 1),
+                'cardio_coins': Decimal(duration // 60) / 10,
+                'gym_gems': Decimal(rng.randint(0, 5)),
+            }
+        history.append((day, max(0, int(rng.gauss(step_level, 2500))), activity))
+    return history
+
+
+def _next_activity_id():
+    # Synthetic activities count down from -1 so they never collide with Garmin's IDs
+    lowest = GarminActivity.objects.filter(activity_id__lt=0).aggregate(lowest=Min('activity_id'))['lowest']
+    return (lowest or 0) - 1
+
+
+def _seed_batch(indexes, days, today, activity_id):
+    """Create one batch of synthetic users with their raw rows, rollups and ledger."""
+    password = make_password(None)
+    histories = {index: _user_days(random.Random(index), days, today) for index in indexes}
+    users = []
+    for index, history in histories.items():
+        activities = [activity for _, _, activity in history if activity]
+        users.append(UserProfile(
+            username=_username(index),
+            password=password,
+            cardio_coins=sum((activity['cardio_coins'] for activity in activities), Decimal(0)),
+            gym_gems=sum((activity['gym_gems'] for activity in activities), Decimal(0)),
+        ))
+
+    with transaction.atomic(using=router.db_for_write(UserProfile)):
+        users = UserProfile.objects.bulk_create(users)
+        steps, activities, transactions, metrics, earnings = [], [], [], [], []
+        for user, history in zip(users, histories.values()):
+            for day, day_steps, activity in history:
+                steps.append(GarminDailySteps(user=user, date=day, steps=day_steps))
+                day_metrics = UserDailyMetrics(user=user, date=day, steps=day_steps)
+                if activity:
+                    garmin_activity = GarminActivity(
+                        user=user,
+                        activity_id=activity_id,
+                        name='Benchmark run',
+                        activity_type='running',
+                        start_time_utc=timezone.make_aware(datetime.combine(day, dt_time(12))),
+                        duration_seconds=activity['duration_seconds'],
+                        calories=activity['calories'],
+                        sweat_score=activity['sweat_score'],
+                    )
+                    activity_id -= 1
+                    activities.append(garmin_activity)
+                    day_metrics.calories = activity['calories']
+                    day_metrics.sweat_score = activity['sweat_score']
+                    day_metrics.activity_count = 1
+                    day_metrics.active_seconds = activity['duration_seconds']
+                    for currency_type in ('cardio_coins', 'gym_gems'):
+                        if activity[currency_type]:
+                            # created_at is auto_now_add; the ledger carries the day
+                            transactions.append(Transaction(
+                                user=user,
+                                currency_type=currency_type,
+                                amount=activity[currency_type],
+                                garmin_activity=garmin_activity,
+                            ))
+                            earnings.append(DailyEarnings(
+                                user=user,
+                                date=day,
+                                currency_type=currency_type,
+                                amount=activity[currency_type],
+                            ))
+                metrics.append(day_metrics)
+        GarminDailySteps.objects.bulk_create(steps, batch_size=5000)
+        GarminActivity.objects.bulk_create(activities, batch_size=5000)
+        Transaction.objects.bulk_create(transactions, batch_size=5000)
+        UserDailyMetrics.objects.bulk_create(metrics, batch_size=5000)
+        DailyEarnings.objects.bulk_create(earnings, batch_size=5000)
+    return activity_id
+
+
+def _seed_relations(requester, friends, group_size):
+    """Give the requesting user accepted friends (both friendship models) and a group."""
+    others = list(UserProfile.objects.filter(
+        username__startswith=BENCHMARK_PREFIX
+    ).exclude(id=requester.id).order_by('username').values_list('id', flat=True)[:max(friends, group_size)])
+
+    with transaction.atomic(using=router.db_for_write(UserProfile)):
+        for model in (Friendship, SocialFriendship):
+            model.objects.bulk_create([
+                model(from_user=requester, to_user_id=user_id, status='accepted')
+                for user_id in others[:friends]
+            ], ignore_conflicts=True)
+
+        group, _ = Group.objects.get_or_create(
+            name=BENCHMARK_GROUP_NAME,
+            defaults={'creator': requester, 'description': 'Synthetic users for the leaderboard benchmark.'}
+        )
+        member_ids = set(GroupMembership.objects.filter(group=group).values_list('user_id', flat=True))
+        GroupMembership.objects.bulk_create([
+            GroupMembership(user_id=user_id, group=group, role='admin' if user_id == requester.id else 'member')
+            for user_id in [requester.id] + others[:group_size - 1]
+            if user_id not in member_ids
+        ], batch_size=5000)
+    return group
+
+
+def seed_benchmark_data(users, days=35, friends=50, group_size=1000, batch_size=1000):
+    """
+    Add synthetic users until there are `users` of them, each with `days` of steps,
+    activities, transactions, daily rollups and earnings, written directly in bulk
+    (no per-row signals). Returns the requesting user and the benchmark group.
+    """
+    today = timezone.localdate()
+    existing = UserProfile.objects.filter(username__startswith=BENCHMARK_PREFIX).count()
+    activity_id = _next_activity_id()
+    for start in range(existing, users, batch_size):
+        activity_id = _seed_batch(range(start, min(start + batch_size, users)), days, today, activity_id)
+        logger.info(f"Seeded benchmark users {start}-{min(start + batch_size, users) - 1}")
+
+    requester = UserProfile.objects.get(username=_username(0))
+    group = _seed_relations(requester, friends, group_size)
+    return requester, group
+
+
+def clear_benchmark_data(database=None):
+    """Delete the synthetic users (their rows cascade) and the benchmark group from the benchmark database."""
+    with benchmark_database(database):
+        Group.objects.filter(name=BENCHMARK_GROUP_NAME).delete()
+        deleted, _ = UserProfile.objects.filter(username__startswith=BENCHMARK_PREFIX).delete()
+    return deleted
+
+
+class BenchmarkRouter:
+    """Database router sending every read and write to one database alias."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def db_for_read(self, model, **hints):
+        return self.alias
+
+    def db_for_write(self, model, **hints):
+        return self.alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def database_target(alias):
+    """(engine, host, port, name) a database alias connects to, for telling two aliases to the same database apart."""
+    config = settings.DATABASES[alias]
+    return config['ENGINE'], config.get('HOST') or '', str(config.get('PORT') or ''), str(config['NAME'])
+
+
+def targets_live_database(alias):
+    """Whether a database alias is the live 'default' database, or another alias for it."""
+    return database_target(alias) == database_target(DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def benchmark_database(alias):
+    """
+    Route every ORM query to the database `alias` (default LEADERBOARD_BENCHMARK_DATABASE)
+    for the duration, so the synthetic users and their rows are written to, and the
+    timed pages read from, that database instead of the live one.
+    """
+    routers = router.routers
+    router.routers = [BenchmarkRouter(alias or settings.LEADERBOARD_BENCHMARK_DATABASE)]
+    try:
+        yield
+    finally:
+        router.routers = routers
+
+
+def redis_target(url):
+    """(host, port, db) a Redis URL connects to, for telling two URLs to the same database apart."""
+    kwargs = redis.Redis.from_url(url).connection_pool.connection_kwargs
+    return kwargs.get('host', kwargs.get('path')), kwargs.get('port', 6379), int(kwargs.get('db') or 0)
+
+
+def targets_live_leaderboards(url):
+    """Whether a Redis URL points at the database the live leaderboards use (LEADERBOARD_REDIS_URL)."""
+    return redis_target(url) == redis_target(settings.LEADERBOARD_REDIS_URL)
+
+
+@contextmanager
+def benchmark_redis(url):
+    """
+    Point the leaderboard code at the Redis database at `url` (default
+    LEADERBOARD_BENCHMARK_REDIS_URL) for the duration, so the synthetic boards, the
+    rebuilds and the hidden ready marker never touch the live leaderboard sets.
+    """
+    live_client = leaderboards._client
+    leaderboards._client = redis.Redis.from_url(url or settings.LEADERBOARD_BENCHMARK_REDIS_URL)
+    try:
+        yield
+    finally:
+        leaderboards._client.close()
+        leaderboards._client = live_client
+
+
+@contextmanager
+def leaderboard_path(path):
+    """
+    Route the leaderboard pages through 'redis' (rebuilding the sets) or 'sql' (hiding
+    the ready marker for the duration, then restoring it).
+    """
+    if path == 'redis':
+        rebuild_leaderboards(timezone.localdate())
+        yield
+        return
+    try:
+        ready = get_redis().get(READY_KEY)
+        get_redis().delete(READY_KEY)
+    except redis.RedisError:
+        # Without Redis the pages are on the SQL path already
+        ready = None
+    try:
+        yield
+    finally:
+        if ready is not None:
+            get_redis().set(READY_KEY, ready)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _leaderboard_view_request(factory, user, metric, period, params):
+    from .views import LeaderboardView
+    request = factory.get(reverse('fitness:leaderboards', kwargs={'metric': metric, 'period': period}), params)
+    request.user = user
+    return lambda: LeaderboardView.as_view()(request, metric=metric, period=period).render()
+
+
+def _social_main_request(factory, user, metric, period, params):
+    from social.views import social_main
+    request = factory.get(reverse('social:main'), {'category': metric, 'history': period, **params})
+    request.user = user
+    return lambda: social_main(request)
+
+
+BENCHMARK_PAGES = {
+    'leaderboards': (LEADERBOARD_VIEW_PARAMS, _leaderboard_view_request),
+    'social_main': (SOCIAL_MAIN_PARAMS, _social_main_request),
+}
+
+
+def time_page(call, repeat):
+    """
+    Run one page request: a first pass under tracemalloc for the query count and peak
+    memory (which also warms the period boards), then `repeat` timed passes.
+    """
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connections[router.db_for_read(UserProfile)]) as queries:
+            call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50_ms': _percentile(timings, 0.5),
+        'p95_ms': _percentile(timings, 0.95),
+        'queries': len(queries.captured_queries),
+        'peak_kib': peak / 1024,
+    }
+
+
+def benchmark_leaderboards(user, group, repeat=20, pages=None):
+    """Time every metric, period and scope of the leaderboard pages. Yields one result dict per page."""
+    factory = RequestFactory()
+    for page in pages or BENCHMARK_PAGES:
+        page_params, build_request = BENCHMARK_PAGES[page]
+        for metric in page_params['metrics']:
+            for period in page_params['periods']:
+                for scope in page_params['scopes']:
+                    params = {'scope': scope}
+                    if scope == 'group':
+                        params['group_id'] = group.id
+                    call = build_request(factory, user, metric, period, params)
+                    yield {
+                        'page': page,
+                        'metric': metric,
+                        'period': period,
+                        'scope': scope,
+                        **time_page(call, repeat),
+                    }
+
+
+def run_benchmark(scales, paths=('sql', 'redis'), repeat=20, pages=None, redis_url=None, database=None,
+                  **seed_options):
+    """
+    Seed each scale in turn (smallest first, each adding to the last) and benchmark
+    the pages over each leaderboard path, on the database alias `database` (see
+    benchmark_database) and the Redis database at `redis_url` (see benchmark_redis).
+    Yields result dicts tagged with users and path.
+    """
+    with benchmark_database(database), benchmark_redis(redis_url):
+        yield from _run_scales(scales, paths, repeat, pages, seed_options)
+
+
+def _run_scales(scales, paths, repeat, pages, seed_options):
+    for users in sorted(scales):
+        started = time.perf_counter()
+        requester, group = seed_benchmark_data(users, **seed_options)
+        logger.info(f"Seeded {users} benchmark users in {time.perf_counter() - started:.1f}s")
+        for path in paths:
+            try:
+                with leaderboard_path(path):
+                    for result in benchmark_leaderboards(requester, group, repeat, pages):
+                        yield {'users': users, 'path': path, **result}
+            except redis.RedisError as e:
+                logger.warning(f"Skipping the {path} path at {users} users: {e}")
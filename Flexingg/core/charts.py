@@ -0,0 +1,652 @@
+import hashlib
+import json
+import logging
+import random
+import uuid
+from datetime import date, timedelta
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
+from garminconnect.models import Garmin_Auth, UserDailyMetrics
+from .models import Friendship
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+# Step equivalents dictionary
+step_equivalents = {
+    "miles walked": 2000,  # Average steps per mile
+    "kilometers walked": 1250,  # Average steps per kilometer
+    "flights of stairs climbed": 20,  # Average steps per flight
+    "heights of the CN Tower": 500,  # CN Tower height in steps
+    "lengths of the Amazon River": 60000000,  # Amazon River length in steps
+    "widths of Australia": 400000000,  # Australia width in steps
+    "depths of Lake Baikal": 10000,  # Lake Baikal depth in steps
+    "spans of the Brooklyn Bridge": 500,  # Brooklyn Bridge span in steps
+    "lengths of a T-Rex": 150,  # T-Rex length in steps
+    "heights of the Leaning Tower of Pisa": 60,  # Leaning Tower height in steps
+    "widths of the English Channel": 3000000,  # English Channel width in steps
+    "distances to the North Pole": 200000000,  # North Pole distance in steps
+    "lengths of the Yangtze River": 60000000,  # Yangtze River length in steps
+    "depths of the Grand Canyon": 2000,  # Grand Canyon depth in steps
+    "spans of the Tacoma Narrows Bridge": 1000,  # Tacoma Narrows span in steps
+    "heights of the Washington Monument": 170,  # Washington Monument height in steps
+    "lengths of a school bus": 150,  # School bus length in steps
+    "distances to the South Pole": 250000000,  # South Pole distance in steps
+    "circumferences of Earth": 22500000,  # Earth's circumference in steps
+    "widths of the Pacific Ocean": 15000000000,  # Pacific Ocean width in steps
+    "heights of the Space Needle": 180,  # Space Needle height in steps
+    "lengths of the Mississippi River": 40000000,  # Mississippi River length in steps
+    "depths of the Challenger Deep": 10000,  # Challenger Deep depth in steps
+    "spans of the Verrazzano Bridge": 1500,  # Verrazzano Bridge span in steps
+}
+
+def relate_steps(steps):
+    """
+    Relates a given step count to random items from the step_equivalents dictionary,
+    ensuring the quantity is less than 100 and not rounded to 0.00.
+    """
+    if steps < 0:
+        return "How?"
+    else:
+        # Filter items so the resulting quantity is less than 100 and not rounded to 0.00
+        suitable_items = {
+            name: equiv for name, equiv in step_equivalents.items()
+            if equiv > 0 and steps / equiv < 100
+        }
+
+        if not suitable_items:
+            # If no suitable items are found, pick the item with the largest equivalent value
+            item_name, item_equiv = max(step_equivalents.items(), key=lambda item: item[1])
+            quantity = steps / item_equiv
+            return f"You've taken {steps} steps, which is equivalent to about {quantity:.2f} {item_name}."
+
+        else:
+            # Select items where the resulting quantity is not rounded to 0.00
+            displayable_items = {
+                name: equiv for name, equiv in suitable_items.items()
+                if f"{steps / equiv:.2f}" != "0.00"
+            }
+
+            if not displayable_items:
+                # If no displayable items are found, pick the item with the smallest equivalent value
+                item_name, item_equiv = min(suitable_items.items(), key=lambda item: item[1])
+                quantity = steps / item_equiv
+                return f"You've taken {steps} steps, which is equivalent to about {quantity:.2f} {item_name}."
+
+            else:
+                item_name, item_equiv = random.choice(list(displayable_items.items()))
+                quantity = steps / item_equiv
+                return f"You've taken {steps} steps, which is equivalent to about {quantity:.2f} {item_name}."
+
+
+# Energy equivalents dictionary (purely energy-based)
+calorie_equivalents = {
+    "energy to boil a cup of water": 10000,
+    "energy in a AA battery": 2000,
+    "energy to run a 100W lightbulb for 1 hour": 86000,
+    "energy to run a satellite for 5 minutes": 800000
+}
+
+def relate_calories(calories):
+    """
+    Relates a given calorie amount to random items from the calorie_equivalents dictionary,
+    ensuring the quantity is less than 100 and not rounded to 0.00.
+    """
+    if calories < 0:
+        return "How? "
+    else:
+        # Filter items so the resulting quantity is less than 100 and not rounded to 0.00
+        suitable_items = {
+            name: cal for name, cal in calorie_equivalents.items()
+            if cal > 0 and calories / cal < 100
+        }
+
+        if not suitable_items:
+            # If no suitable items are found, pick the item with the largest calorie value
+            item_name, item_calories = max(calorie_equivalents.items(), key=lambda item: item[1])
+            quantity = calories / item_calories
+            return f"You've burned {calories} calories, which is {quantity:.2f}x the {item_name}."
+
+        else:
+            # Select items where the resulting quantity is not rounded to 0.00
+            displayable_items = {
+                name: cal for name, cal in suitable_items.items()
+                if f"{calories / cal:.2f}" != "0.00"
+            }
+
+            if not displayable_items:
+                # If no displayable items are found, pick the item with the smallest calorie value
+                item_name, item_calories = min(suitable_items.items(), key=lambda item: item[1])
+                quantity = calories / item_calories
+                return f"You've burned {calories} calories, which is {quantity:.2f}x the {item_name}."
+
+            else:
+                item_name, item_calories = random.choice(list(displayable_items.items()))
+                quantity = calories / item_calories
+                return f"You've burned {calories} calories, which is {quantity:.2f}x the {item_name}."
+
+
+# Chart metrics served by /api/<metric>/chart-data/. Each entry reads one UserDailyMetrics
+# column; adding a metric is a new entry here.
+#   field:          UserDailyMetrics column summed per day
+#   key:            name of the value in each {'date': ..., key: ...} point and in podium entries
+#   dtype:          NumPy dtype used for the dense day arrays
+#   scale:          multiplier applied to the stored value (e.g. seconds -> minutes)
+#   sentence:       optional function turning the user's total into a stats sentence
+#   empty_sentence: sentence used when the user's total is zero
+CHART_METRICS = {
+    'steps': {'field': 'steps', 'key': 'steps', 'dtype': np.int64, 'scale': 1,
+              'sentence': relate_steps, 'empty_sentence': "No steps taken yet!"},
+    'calories': {'field': 'calories', 'key': 'calories', 'dtype': np.float64, 'scale': 1,
+                 'sentence': relate_calories, 'empty_sentence': "No calories burned yet!"},
+    'sweat-score': {'field': 'sweat_score', 'key': 'score', 'dtype': np.float64, 'scale': 1,
+                    'sentence': None, 'empty_sentence': None},
+    'active-minutes': {'field': 'active_seconds', 'key': 'minutes', 'dtype': np.float64, 'scale': 1 / 60,
+                       'sentence': None, 'empty_sentence': None},
+}
+
+
+def get_chart_range(range_param, today):
+    """Return (start_date, end_date) for a chart range name, defaulting to the current month."""
+    if range_param == 'last_month':
+        # Get last month
+        last_of_last_month = today.replace(day=1) - timedelta(days=1)
+        return last_of_last_month.replace(day=1), last_of_last_month
+    if range_param == 'last_3_months':
+        # Last 3 months including current
+        return (today.replace(day=1) - timedelta(days=60)).replace(day=1), today
+    if range_param == 'last_year':
+        return today.replace(year=today.year - 1, month=1, day=1), today
+    if range_param == 'alltime':
+        return date(2000, 1, 1), today
+    return today.replace(day=1), today
+
+
+def get_friend_ids(user_id):
+    """Return the IDs of the user's accepted friends, in request order."""
+    friendships = Friendship.objects.filter(
+        Q(from_user_id=user_id) | Q(to_user_id=user_id),
+        status='accepted'
+    ).values_list('from_user_id', 'to_user_id')
+    friend_ids = [to_id if from_id == user_id else from_id for from_id, to_id in friendships]
+    return list(dict.fromkeys(friend_ids))
+
+
+def get_chart_friends(user):
+    """Return [(friend_id, username), ...] for the user's accepted friendships, in request order."""
+    friend_ids = get_friend_ids(user.id)
+    usernames = dict(User.objects.filter(id__in=friend_ids).values_list('id', 'username'))
+    return [(friend_id, usernames[friend_id]) for friend_id in friend_ids if friend_id in usernames]
+
+
+def build_daily_matrices(user_ids, metrics, start_date, end_date):
+    """
+    Read the UserDailyMetrics columns of several chart metrics for a set of users in
+    one scan, as {metric: dense (len(user_ids), days) NumPy array}, zero-filled for
+    days without data.
+    """
+    days = (end_date - start_date).days + 1
+    configs = [CHART_METRICS[metric] for metric in metrics]
+    matrices = {
+        metric: np.zeros((len(user_ids), days), dtype=config['dtype'])
+        for metric, config in zip(metrics, configs)
+    }
+    fields = [config['field'] for config in configs]
+    has_data = Q()
+    for field in fields:
+        has_data |= Q(**{f'{field}__gt': 0})
+    rows = list(UserDailyMetrics.objects.filter(
+        has_data,
+        user_id__in=user_ids,
+        date__range=[start_date, end_date],
+    ).values_list('user_id', 'date', *fields).order_by())
+    if rows:
+        row_index = {user_id: i for i, user_id in enumerate(user_ids)}
+        columns = list(zip(*rows))
+        index = (
+            [row_index[user_id] for user_id in columns[0]],
+            [(day - start_date).days for day in columns[1]],
+        )
+        for metric, config, values in zip(metrics, configs, columns[2:]):
+            matrices[metric][index] = np.asarray(values, dtype=np.float64) * config['scale']
+    return matrices
+
+
+# Users read per UserDailyMetrics query while a streamed chart serializes its series
+CHART_STREAM_BLOCK_USERS = 50
+
+
+def iter_daily_rows(user_ids, metric, start_date, end_date, block_size=CHART_STREAM_BLOCK_USERS):
+    """
+    Yield each user's dense day array of one chart metric, in user_ids order, reading
+    block_size users per query so only one block of rows is in memory at a time.
+    """
+    for offset in range(0, len(user_ids), block_size):
+        block = user_ids[offset:offset + block_size]
+        yield from build_daily_matrices(block, [metric], start_date, end_date)[metric]
+
+
+# Long ranges are bucketed by default; nobody needs 9,000 points for a cumulative line
+DEFAULT_CHART_BUCKETS = {
+    'last_year': 'week',
+    'alltime': 'month',
+}
+CHART_BUCKETS = ('day', 'week', 'month')
+
+
+def parse_chart_options(params):
+    """
+    Normalize the payload options a chart request can ask for:
+      format=columnar  one shared date axis plus plain numeric arrays per series
+      quantize=1       round series values to integers
+      bucket=day|week|month
+                       one point per bucket (the running total at the bucket's last day);
+                       defaults by range through DEFAULT_CHART_BUCKETS
+      max_points=N     downsample the daily series to N points with LTTB instead
+    """
+    try:
+        max_points = max(int(params.get('max_points')), 3)
+    except (TypeError, ValueError):
+        max_points = None
+    bucket = params.get('bucket')
+    return {
+        'format': 'columnar' if params.get('format') == 'columnar' else 'rows',
+        'quantize': params.get('quantize') in ('1', 'true'),
+        'bucket': bucket if bucket in CHART_BUCKETS else 'auto',
+        'max_points': max_points,
+    }
+
+
+def lttb_indices(values, threshold):
+    """
+    Largest-Triangle-Three-Buckets: pick `threshold` indices of `values` (always keeping
+    the first and last point) that best preserve the visual shape of the line.
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=np.float64)
+    y = np.asarray(values, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        range_start = int(np.floor(i * every)) + 1
+        range_end = int(np.floor((i + 1) * every)) + 1
+        areas = np.abs(
+            (x[a] - avg_x) * (y[range_start:range_end] - y[a]) -
+            (x[a] - x[range_start:range_end]) * (avg_y - y[a])
+        )
+        a = range_start + int(np.argmax(areas))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def downsample_indices(days, start_date, range_param, options, combined_shape):
+    """
+    Return the indices to keep from `days` days of cumulative series, or None to keep
+    every day. All series share the same indices so they keep one date axis.
+    `combined_shape()` returns the sum of the series, each scaled to its own total so
+    a single large series does not decide the shape for everyone; only LTTB calls it.
+    """
+    if options['max_points']:
+        if days <= options['max_points']:
+            return None
+        return lttb_indices(combined_shape(), options['max_points'])
+
+    bucket = options['bucket']
+    if bucket == 'auto':
+        bucket = DEFAULT_CHART_BUCKETS.get(range_param, 'day')
+    if bucket == 'day':
+        return None
+
+    dates = np.datetime64(start_date) + np.arange(days)
+    if bucket == 'week':
+        # Weeks end on Sunday; datetime64 weeks start on Thursday, so shift by three days
+        periods = (dates + np.timedelta64(3, 'D')).astype('datetime64[W]')
+    else:
+        periods = dates.astype('datetime64[M]')
+    # Last day of each period, and always the final day so the running total ends on today
+    return np.append(np.flatnonzero(periods[1:] != periods[:-1]), days - 1)
+
+
+def chart_point_count(rows, start_date, end_date, range_param, options):
+    """Points a chart payload of `rows` series holds after downsampling, known before reading any data."""
+    days = (end_date - start_date).days + 1
+    if options['max_points']:
+        return rows * min(days, options['max_points'])
+    kept = downsample_indices(days, start_date, range_param, options, None)
+    return rows * (days if kept is None else len(kept))
+
+
+def _options_key(options):
+    return '&'.join(f'{name}={value}' for name, value in sorted(options.items()))
+
+
+def build_chart_data(user, metric, range_param, today, options=None):
+    """
+    Build the chart payload for one metric: cumulative daily series for the user
+    and each friend, podium, stats and the date range.
+
+    The default 'rows' format repeats {'date': ..., <key>: ...} for every point of every
+    series. The 'columnar' format sends the date axis once (start date, day step and
+    point count, plus per-point day offsets when downsampled) and each series as a
+    bare list of numbers.
+    """
+    return build_dashboard_data(user, [metric], range_param, today, options)[metric]
+
+
+def build_dashboard_data(user, metrics, range_param, today, options=None):
+    """
+    Build the chart payloads of several metrics at once, as {metric: payload}. The
+    friend list and the UserDailyMetrics scan are shared across all of them.
+    """
+    charts = build_chart_parts(user, metrics, range_param, today, options)
+    return {metric: _assemble_chart(parts) for metric, parts in charts.items()}
+
+
+def build_chart_parts(user, metrics, range_param, today, options=None):
+    """
+    Compute everything the chart payloads of `metrics` need, as {metric: parts}, without
+    materializing the per-point series lists. `parts['iter_series']()` builds the
+    series one row at a time (row 0 is the user, then friends), so a serializer can
+    emit one series at a time, and `parts['summary']()` returns the rest.
+
+    Payloads of at least CHART_STREAM_MIN_POINTS points in total are `streamed`: their
+    rows are only read, block by block, as the series are built.
+    """
+    options = options or parse_chart_options({})
+    start_date, end_date = get_chart_range(range_param, today)
+    friends = get_chart_friends(user)
+
+    user_ids = [user.id] + [friend_id for friend_id, _ in friends]
+    names = [user.username] + [username for _, username in friends]
+    points = len(metrics) * chart_point_count(len(user_ids), start_date, end_date, range_param, options)
+    if points >= getattr(settings, 'CHART_STREAM_MIN_POINTS', 200000):
+        return {
+            metric: _streamed_chart_parts(
+                CHART_METRICS[metric], metric, user_ids, names, start_date, end_date, range_param, options
+            )
+            for metric in metrics
+        }
+    matrices = build_daily_matrices(user_ids, metrics, start_date, end_date)
+    return {
+        metric: _chart_parts(CHART_METRICS[metric], names, matrices[metric], start_date, end_date, range_param, options)
+        for metric in metrics
+    }
+
+
+def _chart_summary(config, names, totals, start_date, end_date, kept, options):
+    """Podium, stats, date range and (columnar) axis of one chart, from each row's total."""
+    key = config['key']
+    # Rank everyone with a non-zero total; ties keep the user ahead of friends, friends in request order
+    ranked = sorted(
+        (row for row in range(len(names)) if totals[row] > 0),
+        key=lambda row: totals[row], reverse=True
+    )
+    podium_data = [{'name': names[row], key: int(totals[row])} for row in ranked[:3]]
+    user_rank = ranked.index(0) + 1 if 0 in ranked else None
+
+    friend_totals = totals[1:][totals[1:] != 0]
+    friends_average = float(friend_totals.mean()) if friend_totals.size else 0
+    user_total = int(totals[0])
+
+    stats = {
+        'user_total': user_total,
+        'friends_average': int(friends_average) if friends_average else 0,
+        'user_rank': user_rank,
+    }
+    if config['sentence']:
+        stats['sentence'] = config['sentence'](user_total) if user_total > 0 else config['empty_sentence']
+
+    summary = {
+        'podium_data': podium_data,
+        'stats': stats,
+        'date_range': {
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat()
+        }
+    }
+    if options['format'] == 'columnar':
+        summary['format'] = 'columnar'
+        summary['key'] = key
+        count = (end_date - start_date).days + 1 if kept is None else len(kept)
+        summary['axis'] = {'start': start_date.isoformat(), 'step_days': 1, 'count': count}
+        if kept is not None:
+            # Downsampled points are not evenly spaced; send each point's day offset from start
+            summary['axis']['offsets'] = kept.tolist()
+    return summary
+
+
+def _series_formatter(config, start_date, end_date, kept, options):
+    """Return a function turning one row's cumulative day array into its payload series."""
+    key = config['key']
+
+    def values(cumulative):
+        if kept is not None:
+            cumulative = cumulative[kept]
+        if options['quantize']:
+            cumulative = np.rint(cumulative).astype(np.int64)
+        return cumulative.tolist()
+
+    if options['format'] == 'columnar':
+        return values
+
+    date_keys = np.arange(
+        np.datetime64(start_date), np.datetime64(end_date) + np.timedelta64(1, 'D')
+    )
+    if kept is not None:
+        date_keys = date_keys[kept]
+    date_keys = date_keys.astype(str).tolist()
+    return lambda cumulative: [{'date': date_key, key: value} for date_key, value in zip(date_keys, values(cumulative))]
+
+
+def _chart_parts(config, names, daily, start_date, end_date, range_param, options):
+    """Turn one metric's daily matrix (row 0 is the user, then friends) into its chart parts."""
+    cumulative = np.cumsum(daily, axis=1)
+    kept = downsample_indices(
+        cumulative.shape[1], start_date, range_param, options,
+        lambda: (cumulative / np.maximum(cumulative[:, -1:], 1)).sum(axis=0)
+    )
+    format_series = _series_formatter(config, start_date, end_date, kept, options)
+    summary = _chart_summary(config, names, cumulative[:, -1], start_date, end_date, kept, options)
+    return {
+        'names': names,
+        'iter_series': lambda: (format_series(row) for row in cumulative),
+        'summary': lambda: summary,
+        'streamed': False,
+    }
+
+
+def _streamed_chart_parts(config, metric, user_ids, names, start_date, end_date, range_param, options):
+    """
+    Chart parts for a payload too large to build at once. The daily rows are read one
+    block of users at a time while the series are serialized, so memory holds one
+    block plus the per-row totals instead of the users x days matrix. The summary is
+    read after the series, once their totals are in. LTTB downsampling takes one
+    extra pass over the rows to find the shared shape.
+    """
+    days = (end_date - start_date).days + 1
+    totals = np.zeros(len(user_ids), dtype=config['dtype'])
+    kept = {}
+
+    def cumulative_rows():
+        for daily in iter_daily_rows(user_ids, metric, start_date, end_date):
+            yield np.cumsum(daily)
+
+    def combined_shape():
+        shape = np.zeros(days)
+        for cumulative in cumulative_rows():
+            shape += cumulative / max(cumulative[-1], 1)
+        return shape
+
+    def kept_indices():
+        if 'indices' not in kept:
+            kept['indices'] = downsample_indices(days, start_date, range_param, options, combined_shape)
+        return kept['indices']
+
+    def iter_series():
+        format_series = _series_formatter(config, start_date, end_date, kept_indices(), options)
+        for row, cumulative in enumerate(cumulative_rows()):
+            totals[row] = cumulative[-1]
+            yield format_series(cumulative)
+
+    return {
+        'names': names,
+        'iter_series': iter_series,
+        'summary': lambda: _chart_summary(config, names, totals, start_date, end_date, kept_indices(), options),
+        'streamed': True,
+    }
+
+
+def _assemble_chart(parts):
+    """Build the full chart payload dict from its parts."""
+    names = parts['names']
+    series = list(parts['iter_series']())
+    return {
+        'user_data': series[0],
+        # Always include friends, even if they have no data (they'll show as flat line at 0)
+        'friends_data': [{'name': name, 'data': data} for name, data in zip(names[1:], series[1:])],
+        **parts['summary'](),
+    }
+
+
+def _iter_chart_json(parts, encoder):
+    """
+    Serialize a chart payload piece by piece, holding only one series in memory at a
+    time. Produces the same text as json.dumps of _assemble_chart(parts).
+    """
+    names = parts['names']
+    series = parts['iter_series']()
+    yield '{"user_data": ' + encoder.encode(next(series)) + ', "friends_data": ['
+    for row, data in enumerate(series, start=1):
+        yield (', ' if row > 1 else '') + encoder.encode({'name': names[row], 'data': data})
+    yield ']'
+    for name, value in parts['summary']().items():
+        yield f', {encoder.encode(name)}: {encoder.encode(value)}'
+    yield '}'
+
+
+def iter_chart_json(parts):
+    """Serialize one chart's parts as JSON text chunks."""
+    yield from _iter_chart_json(parts, DjangoJSONEncoder())
+
+
+def iter_dashboard_json(charts):
+    """Serialize {metric: parts} as a JSON object of chart payloads, in text chunks."""
+    encoder = DjangoJSONEncoder()
+    yield '{'
+    for i, (metric, parts) in enumerate(charts.items()):
+        yield (', ' if i else '') + encoder.encode(metric) + ': '
+        yield from _iter_chart_json(parts, encoder)
+    yield '}'
+
+
+def get_chart_etag(user, chart_keys, range_param, today, options=None):
+    """
+    Cheap validator for chart payloads: the newest Garmin sync and rollup write across
+    the user and their friends, plus everything that shapes the payload. Two small
+    aggregates instead of building the chart.
+    """
+    start_date, end_date = get_chart_range(range_param, today)
+    user_ids = [user.id, *get_friend_ids(user.id)]
+    last_sync = Garmin_Auth.objects.filter(user_id__in=user_ids).aggregate(latest=Max('last_sync'))['latest']
+    last_write = UserDailyMetrics.objects.filter(
+        user_id__in=user_ids,
+        date__range=[start_date, end_date]
+    ).aggregate(latest=Max('updated_at'))['latest']
+    parts = [user_ids, list(chart_keys), range_param, _options_key(options or {}), today, last_sync, last_write]
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _chart_generation_key(user_id):
+    return f'chart-gen:{user_id}'
+
+
+def invalidate_chart_cache(user_ids):
+    """
+    Drop every cached chart payload for these users. Each user's cache keys embed a
+    generation token, so moving users to a fresh token orphans all their old entries.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    try:
+        cache.set_many({_chart_generation_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+    except Exception as e:
+        logger.warning(f"Could not invalidate chart cache for users {user_ids}: {e}")
+
+
+def invalidate_friends_chart_cache(user_id):
+    """Invalidate the charts of a user and of everyone whose chart shows them as a friend."""
+    invalidate_chart_cache([user_id, *get_friend_ids(user_id)])
+
+
+def _get_cached_json(user, name, range_param, today, options, build_parts, serialize):
+    """
+    Return the serialized payload for (user, name, range, options), from the cache when
+    nothing has changed since it was built. Falls back to building it if the cache is down.
+
+    Streamed payloads (at least CHART_STREAM_MIN_POINTS points) are returned as an
+    iterator of JSON chunks instead of a string, for a StreamingHttpResponse, which
+    reads and builds one block of users at a time. They are not cached, since caching
+    would mean holding the whole text in memory; ETag revalidation still spares
+    clients from downloading them again.
+    """
+    cache_key = None
+    try:
+        generation = cache.get_or_set(_chart_generation_key(user.id), uuid.uuid4().hex, None)
+        cache_key = f'chart:{user.id}:{generation}:{name}:{range_param}:{_options_key(options)}:{today.isoformat()}'
+        content = cache.get(cache_key)
+        if content is not None:
+            return content
+    except Exception as e:
+        logger.warning(f"Chart cache unavailable, building {name} for user {user.id} uncached: {e}")
+
+    charts = build_parts()
+    if any(parts['streamed'] for parts in charts.values()):
+        return serialize(charts)
+
+    content = ''.join(serialize(charts))
+    if cache_key is not None:
+        try:
+            cache.set(cache_key, content, getattr(settings, 'CHART_CACHE_TIMEOUT', 60 * 60))
+        except Exception as e:
+            logger.warning(f"Could not cache {name} for user {user.id}: {e}")
+    return content
+
+
+def get_chart_json(user, metric, range_param, today, options=None):
+    """
+    Return the serialized chart payload for one metric, cached per user, range and
+    options; an iterator of JSON chunks for very large payloads.
+    """
+    options = options or parse_chart_options({})
+    return _get_cached_json(
+        user, metric, range_param, today, options,
+        lambda: build_chart_parts(user, [metric], range_param, today, options),
+        lambda charts: iter_chart_json(charts[metric])
+    )
+
+
+def get_dashboard_json(user, metrics, range_param, today, options=None):
+    """Return the serialized {metric: payload} dashboard for several metrics, cached and streamed like single charts."""
+    options = options or parse_chart_options({})
+    return _get_cached_json(
+        user, f"dashboard={','.join(metrics)}", range_param, today, options,
+        lambda: build_chart_parts(user, metrics, range_param, today, options),
+        iter_dashboard_json
+    )
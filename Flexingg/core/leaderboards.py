@@ -0,0 +1,746 @@
+import json
+import logging
+import time
+from datetime import timedelta
+from itertools import islice
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils.dateparse import parse_date
+from garminconnect.models import UserDailyMetrics
+from social.models import GroupMembership
+from .models import DailyEarnings, LeaderboardSnapshot
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+# Leaderboards kept in Redis sorted sets (member = user ID, score = value).
+# 'daily' metrics mirror a UserDailyMetrics column: one set per day plus an all-time total.
+# 'currency' metrics rank the amount earned (DailyEarnings, the Transaction total): the
+# lifetime sum as the all-time set, plus the amount earned per day for the rolling periods.
+# Spending a balance does not move anyone on the boards.
+LEADERBOARD_METRICS = {
+    'steps': {'source': 'daily', 'field': 'steps'},
+    'calories': {'source': 'daily', 'field': 'calories'},
+    'sweat_score': {'source': 'daily', 'field': 'sweat_score'},
+    'cardio_coins': {'source': 'currency', 'field': 'cardio_coins'},
+    'gym_gems': {'source': 'currency', 'field': 'gym_gems'},
+}
+
+# Rolling periods, matching the views' cutoffs (today minus N days, inclusive)
+LEADERBOARD_PERIOD_DAYS = {
+    'week': 7,
+    'month': 30,
+}
+
+# Per-day sets only need to outlive the longest rolling period
+DAY_KEY_TIMEOUT = (max(LEADERBOARD_PERIOD_DAYS.values()) + 10) * 24 * 60 * 60
+# Period sets are unions of day sets, built once a day (by the rebuild, or the first read
+# of the day) and then kept current by the writers alongside the day sets
+PERIOD_KEY_TIMEOUT = 24 * 60 * 60
+READY_KEY = 'lb:ready'
+# Pub/sub channel the writers announce score changes on, for the live leaderboard streams
+UPDATES_CHANNEL = 'lb:updates'
+
+# Members are fixed-width complements of the user IDs. Redis orders equal scores by
+# member, reversed for highest-first reads, so this ranks ties by ascending user ID,
+# the same tie-break as the SQL queries.
+MEMBER_ID_SPACE = 10 ** 12
+
+# Write one member's score to each of KEYS that exists (ARGV: 'zadd' or 'zincrby', the
+# member, then one score per key). Sets that are not built are left for the next read,
+# which builds them from the day sets that already hold the new scores.
+UPDATE_BUILT_SETS_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('exists', key) == 1 then
+        redis.call(ARGV[1], key, ARGV[i + 2], ARGV[2])
+    end
+end
+"""
+
+_client = None
+
+
+def get_redis():
+    """Shared Redis client for the leaderboard sets."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.LEADERBOARD_REDIS_URL)
+    return _client
+
+
+def get_async_redis():
+    """A new asyncio Redis client for one live stream's subscription; the caller closes it."""
+    return redis.asyncio.Redis.from_url(settings.LEADERBOARD_REDIS_URL)
+
+
+def _member(user_id):
+    return f'{MEMBER_ID_SPACE - int(user_id):012d}'
+
+
+def _user_id(member):
+    return MEMBER_ID_SPACE - int(member)
+
+
+def _all_key(metric):
+    return f'lb:{metric}:all'
+
+
+def _day_key(metric, day):
+    return f'lb:{metric}:day:{day.isoformat()}'
+
+
+def _period_key(metric, period, today):
+    return f'lb:{metric}:{period}:{today.isoformat()}'
+
+
+def _period_days(period, today):
+    return [today - timedelta(days=offset) for offset in range(LEADERBOARD_PERIOD_DAYS[period] + 1)]
+
+
+def _window_start(today):
+    return today - timedelta(days=max(LEADERBOARD_PERIOD_DAYS.values()))
+
+
+def _members_key(group_id):
+    return f'lb:group:{group_id}:members'
+
+
+def _group_key(key, group_id):
+    return f'{key}:group:{group_id}'
+
+
+def _update_period_sets(pipe, command, user_id, metric, today, group_ids, values):
+    """
+    Queue a 'zadd' or 'zincrby' of a user's {period: value} on the built global and
+    group period sets, so they stay current without being rebuilt.
+    """
+    scores = {}
+    for period, value in values.items():
+        if value is None:
+            continue
+        key = _period_key(metric, period, today)
+        scores[key] = float(value)
+        for group_id in group_ids:
+            scores[_group_key(key, group_id)] = float(value)
+    if scores:
+        pipe.eval(UPDATE_BUILT_SETS_SCRIPT, len(scores), *scores, command, _member(user_id), *scores.values())
+
+
+def _build_period_set(pipe, metric, period, today):
+    key = _period_key(metric, period, today)
+    pipe.zunionstore(key, [_day_key(metric, day) for day in _period_days(period, today)])
+    pipe.expire(key, PERIOD_KEY_TIMEOUT)
+
+
+def _publish_update(pipe, user_id, metrics, periods=('all', *LEADERBOARD_PERIOD_DAYS)):
+    pipe.publish(UPDATES_CHANNEL, json.dumps({'user_id': user_id, 'metrics': list(metrics), 'periods': list(periods)}))
+
+
+def _user_group_ids(user_id):
+    return list(GroupMembership.objects.filter(user_id=user_id).values_list('group_id', flat=True))
+
+
+def _group_members():
+    """Return {group_id: [user_id, ...]} for every group."""
+    groups = {}
+    for group_id, user_id in GroupMembership.objects.values_list('group_id', 'user_id'):
+        groups.setdefault(group_id, []).append(user_id)
+    return groups
+
+
+def _built_group_boards(client, metrics, group_ids):
+    """Return {(metric, group_id): key} for the all-time group boards that have been built."""
+    keys = {(metric, group_id): _group_key(_all_key(metric), group_id) for metric in metrics for group_id in group_ids}
+    if not keys:
+        return {}
+    pipe = client.pipeline(transaction=False)
+    for key in keys.values():
+        pipe.exists(key)
+    return {target: key for (target, key), exists in zip(keys.items(), pipe.execute()) if exists}
+
+
+class RedisLeaderboard:
+    """
+    One leaderboard (metric and period) backed by a Redis sorted set. Counts, pages and
+    ranks are O(log n) reads; `scores` looks up a known set of users (friends, groups).
+    """
+
+    def __init__(self, client, key):
+        self.client = client
+        self.key = key
+
+    def count(self):
+        return self.client.zcard(self.key)
+
+    def page(self, start, stop):
+        """Return [(user_id, score), ...] for ranks start+1 .. stop, highest first."""
+        if stop <= start:
+            return []
+        rows = self.client.zrevrange(self.key, start, stop - 1, withscores=True)
+        return [(_user_id(member), score) for member, score in rows]
+
+    def rank(self, user_id):
+        """Return (rank, score) for the user, or None if they are not on the board."""
+        position = self.client.zrevrank(self.key, _member(user_id))
+        if position is None:
+            return None
+        return position + 1, self.client.zscore(self.key, _member(user_id))
+
+    def around(self, user_id, k):
+        """
+        Return (rank, first_rank, [(user_id, score), ...]) for the user and the k entries
+        either side of them, or None if they are not on the board.
+        """
+        position = self.client.zrevrank(self.key, _member(user_id))
+        if position is None:
+            return None
+        start = max(position - k, 0)
+        return position + 1, start + 1, self.page(start, position + k + 1)
+
+    def position(self, score, user_id, inclusive=False):
+        """
+        Return how many entries are ranked before (score, user_id), the keyset of a
+        leaderboard cursor: higher scores, then equal scores with lower user IDs. With
+        `inclusive` the user's own entry counts too when it still holds that score.
+        O(log n) while it does; once the user has moved, their old place is found from
+        the entries holding that score.
+        """
+        member = _member(user_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zscore(self.key, member)
+        pipe.zrevrank(self.key, member)
+        current, position = pipe.execute()
+        if current == score:
+            return position + 1 if inclusive else position
+        ties = self.client.zrangebyscore(self.key, score, score)
+        return self.client.zcount(self.key, f'({score}', '+inf') + sum(
+            1 for tie in ties if tie.decode() > member
+        )
+
+    def scores(self, user_ids):
+        """Return {user_id: score} for the given users that are on the board."""
+        user_ids = list(user_ids)
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zscore(self.key, _member(user_id))
+        return {
+            user_id: score
+            for user_id, score in zip(user_ids, pipe.execute())
+            if score is not None
+        }
+
+
+def hydrate_leaderboard(rows, first_rank=1):
+    """Turn [(user_id, score), ...] into UserProfile objects with rank and metric_value, in order."""
+    users = User.objects.in_bulk([user_id for user_id, _ in rows])
+    ranked = []
+    for rank, (user_id, score) in enumerate(rows, first_rank):
+        user = users.get(user_id)
+        if user is None:
+            # Deleted since the set was written; the next rebuild drops it
+            continue
+        user.rank = rank
+        user.metric_value = score
+        ranked.append(user)
+    return ranked
+
+
+def rank_members(board, users, default=None):
+    """
+    Rank a known set of users (a friends or group scope) by their scores on the board,
+    highest first with ties by user ID, as on the boards. Users without a score are left
+    out, or ranked with `default` when one is given.
+    """
+    members = {user.id: user for user in users}
+    scores = board.scores(members)
+    if default is not None:
+        scores = {user_id: scores.get(user_id, default) for user_id in members}
+    ranked = sorted(
+        (members[user_id] for user_id in scores),
+        key=lambda user: (-scores[user.id], user.id)
+    )
+    for rank, user in enumerate(ranked, 1):
+        user.rank = rank
+        user.metric_value = scores[user.id]
+    return ranked
+
+
+def get_leaderboard(metric, period, today, group_id=None):
+    """
+    Return the RedisLeaderboard for a metric and period ('all', 'week', 'month'), or a
+    group's board when group_id is given, or None when Redis is unavailable or the sets
+    have not been built yet, in which case callers fall back to SQL.
+
+    A group board is the global board intersected with the group's member set. It is
+    built on first read and then kept current by the writers below, so a group page
+    costs the same as a global one whatever the group's size.
+    """
+    try:
+        client = get_redis()
+        if not client.exists(READY_KEY):
+            return None
+        if period not in LEADERBOARD_PERIOD_DAYS:
+            key = _all_key(metric)
+        else:
+            key = _period_key(metric, period, today)
+            if not client.exists(key):
+                # First read of the day: the rebuild has not made today's set yet
+                pipe = client.pipeline()
+                _build_period_set(pipe, metric, period, today)
+                pipe.execute()
+        if group_id is None:
+            return RedisLeaderboard(client, key)
+
+        group_key = _group_key(key, group_id)
+        if not client.exists(group_key):
+            pipe = client.pipeline()
+            # Member set scores are weighted to 0, so members keep their board scores
+            pipe.zinterstore(group_key, {key: 1, _members_key(group_id): 0})
+            if period in LEADERBOARD_PERIOD_DAYS:
+                pipe.expire(group_key, PERIOD_KEY_TIMEOUT)
+            pipe.execute()
+        return RedisLeaderboard(client, group_key)
+    except redis.RedisError as e:
+        logger.warning(f"Leaderboard store unavailable, using SQL for {metric}/{period}: {e}")
+        return None
+
+
+def update_daily_leaderboards(user_id, dates, today):
+    """
+    Write a user's scores for the daily metrics after their UserDailyMetrics rows for
+    `dates` changed: the day sets for recent days, the built period sets and the
+    all-time totals. Scores are set, not incremented, so re-running a sync leaves the
+    sets correct.
+    """
+    metrics = {metric: config for metric, config in LEADERBOARD_METRICS.items() if config['source'] == 'daily'}
+    recent = [day for day in dates if day >= _window_start(today)]
+    rows = UserDailyMetrics.objects.filter(
+        user_id=user_id,
+        date__in=recent
+    ).values('date', *[config['field'] for config in metrics.values()])
+    totals = UserDailyMetrics.objects.filter(user_id=user_id).aggregate(
+        **{f'{metric}_all': Sum(config['field']) for metric, config in metrics.items()},
+        **{
+            f'{metric}_{period}': Sum(config['field'], filter=Q(date__range=[today - timedelta(days=days), today]))
+            for metric, config in metrics.items()
+            for period, days in LEADERBOARD_PERIOD_DAYS.items()
+        }
+    )
+    group_ids = _user_group_ids(user_id)
+    try:
+        client = get_redis()
+        group_boards = _built_group_boards(client, metrics, group_ids)
+        pipe = client.pipeline()
+        for row in rows:
+            for metric, config in metrics.items():
+                pipe.zadd(_day_key(metric, row['date']), {_member(user_id): row[config['field']]})
+                pipe.expire(_day_key(metric, row['date']), DAY_KEY_TIMEOUT)
+        for metric in metrics:
+            pipe.zadd(_all_key(metric), {_member(user_id): totals[f'{metric}_all'] or 0})
+            _update_period_sets(pipe, 'zadd', user_id, metric, today, group_ids, {
+                period: totals[f'{metric}_{period}'] for period in LEADERBOARD_PERIOD_DAYS
+            })
+        for (metric, _), key in group_boards.items():
+            pipe.zadd(key, {_member(user_id): totals[f'{metric}_all'] or 0})
+        _publish_update(pipe, user_id, metrics, ['all', *[
+            period for period, days in LEADERBOARD_PERIOD_DAYS.items()
+            if any(day >= today - timedelta(days=days) for day in dates)
+        ]])
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not update leaderboards for user {user_id}: {e}")
+
+
+def record_earning(user, currency_type, amount, today):
+    """
+    Add a currency earning to today's set, the built period sets and the user's
+    all-time earned total.
+    """
+    group_ids = _user_group_ids(user.id)
+    try:
+        client = get_redis()
+        group_boards = _built_group_boards(client, [currency_type], group_ids)
+        pipe = client.pipeline()
+        pipe.zincrby(_day_key(currency_type, today), float(amount), _member(user.id))
+        pipe.expire(_day_key(currency_type, today), DAY_KEY_TIMEOUT)
+        pipe.zincrby(_all_key(currency_type), float(amount), _member(user.id))
+        _update_period_sets(pipe, 'zincrby', user.id, currency_type, today, group_ids, {
+            period: amount for period in LEADERBOARD_PERIOD_DAYS
+        })
+        for key in group_boards.values():
+            pipe.zincrby(key, float(amount), _member(user.id))
+        _publish_update(pipe, user.id, [currency_type])
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not record {currency_type} earning for user {user.id}: {e}")
+
+
+def add_leaderboard_user(user):
+    """Put a new user on the all-time currency boards, where everyone is ranked (at 0 to start)."""
+    try:
+        pipe = get_redis().pipeline()
+        for metric, config in LEADERBOARD_METRICS.items():
+            if config['source'] == 'currency':
+                pipe.zadd(_all_key(metric), {_member(user.id): 0})
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not add user {user.id} to leaderboards: {e}")
+
+
+def remove_leaderboard_user(user_id, today):
+    """Drop a deleted user from every all-time, day and period set."""
+    try:
+        pipe = get_redis().pipeline()
+        for metric in LEADERBOARD_METRICS:
+            pipe.zrem(_all_key(metric), _member(user_id))
+            for offset in range((today - _window_start(today)).days + 1):
+                pipe.zrem(_day_key(metric, today - timedelta(days=offset)), _member(user_id))
+            for period in LEADERBOARD_PERIOD_DAYS:
+                pipe.zrem(_period_key(metric, period, today), _member(user_id))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not remove user {user_id} from leaderboards: {e}")
+
+
+def add_group_member(user_id, group_id, today):
+    """Put a new group member on the group's built boards with their current scores."""
+    try:
+        client = get_redis()
+        group_boards = _built_group_boards(client, LEADERBOARD_METRICS, [group_id])
+        pipe = client.pipeline(transaction=False)
+        for metric, _ in group_boards:
+            pipe.zscore(_all_key(metric), _member(user_id))
+        scores = dict(zip(group_boards, pipe.execute()))
+
+        pipe = client.pipeline()
+        pipe.sadd(_members_key(group_id), _member(user_id))
+        for target, key in group_boards.items():
+            if scores[target] is not None:
+                pipe.zadd(key, {_member(user_id): scores[target]})
+        for metric in LEADERBOARD_METRICS:
+            pipe.delete(*[
+                _group_key(_period_key(metric, period, today), group_id) for period in LEADERBOARD_PERIOD_DAYS
+            ])
+        _publish_update(pipe, user_id, LEADERBOARD_METRICS)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not add user {user_id} to group {group_id} leaderboards: {e}")
+
+
+def remove_group_member(user_id, group_id, today):
+    """Take a former member off the group's member set and every board built from it."""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.srem(_members_key(group_id), _member(user_id))
+        for metric in LEADERBOARD_METRICS:
+            pipe.zrem(_group_key(_all_key(metric), group_id), _member(user_id))
+            for period in LEADERBOARD_PERIOD_DAYS:
+                pipe.zrem(_group_key(_period_key(metric, period, today), group_id), _member(user_id))
+        _publish_update(pipe, user_id, LEADERBOARD_METRICS)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not remove user {user_id} from group {group_id} leaderboards: {e}")
+
+
+async def listen_leaderboard_updates(timeout, heartbeat=15):
+    """
+    Yield the update messages ({'user_id', 'metrics', 'periods'}) the writers publish,
+    for up to `timeout` seconds. Yields None once subscribed, so a stream can read its
+    starting state without missing an update, and after every `heartbeat` seconds
+    without a message so it can send a keep-alive. Waits on the event loop, so an open
+    stream holds no worker thread.
+    """
+    client = get_async_redis()
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(UPDATES_CHANNEL)
+        yield None
+        deadline = time.monotonic() + timeout
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None:
+                if time.monotonic() - last_sent >= heartbeat:
+                    last_sent = time.monotonic()
+                    yield None
+                continue
+            last_sent = time.monotonic()
+            yield json.loads(message['data'])
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+
+
+def rebuild_leaderboards(today):
+    """
+    Rebuild every leaderboard set from the database: all-time totals, the
+    day sets for the longest rolling period and today's period sets. Marks the store
+    ready, which switches the views from SQL to Redis.
+    """
+    window_start = _window_start(today)
+    days = [window_start + timedelta(days=offset) for offset in range((today - window_start).days + 1)]
+    sets = {}
+
+    for metric, config in LEADERBOARD_METRICS.items():
+        field = config['field']
+        if config['source'] == 'daily':
+            totals = UserDailyMetrics.objects.values('user_id').annotate(
+                value=Sum(field)
+            ).values_list('user_id', 'value').order_by()
+            day_rows = UserDailyMetrics.objects.filter(
+                date__range=[window_start, today]
+            ).values_list('date', 'user_id', field).order_by()
+        else:
+            # Every user is ranked on the currency boards, at 0 until they earn
+            totals = User.objects.annotate(
+                value=Sum('daily_earnings__amount', filter=Q(daily_earnings__currency_type=field))
+            ).values_list('id', 'value').order_by()
+            day_rows = DailyEarnings.objects.filter(
+                currency_type=field,
+                date__range=[window_start, today]
+            ).values_list('date', 'user_id', 'amount').order_by()
+
+        sets[_all_key(metric)] = {_member(user_id): float(value or 0) for user_id, value in totals}
+        for day in days:
+            sets[_day_key(metric, day)] = {}
+        for day, user_id, value in day_rows:
+            sets[_day_key(metric, day)][_member(user_id)] = float(value or 0)
+
+    groups = _group_members()
+
+    client = get_redis()
+    pipe = client.pipeline()
+    # Group member sets are rewritten and the group boards rebuilt from them on next read
+    for key in client.scan_iter(match='lb:*group:*'):
+        pipe.delete(key)
+    for group_id, member_ids in groups.items():
+        pipe.sadd(_members_key(group_id), *[_member(user_id) for user_id in member_ids])
+    for key, members in sets.items():
+        pipe.delete(key)
+        if members:
+            pipe.zadd(key, members)
+            if ':day:' in key:
+                pipe.expire(key, DAY_KEY_TIMEOUT)
+    for metric in LEADERBOARD_METRICS:
+        for period in LEADERBOARD_PERIOD_DAYS:
+            _build_period_set(pipe, metric, period, today)
+    pipe.set(READY_KEY, today.isoformat())
+    pipe.execute()
+    logger.info(f"Rebuilt {len(sets)} leaderboard sets")
+    return len(sets)
+
+
+def period_bounds(period, day):
+    """Return (start, end) of the calendar week (Monday to Sunday) or month containing `day`."""
+    if period == 'week':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    start = day.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
+def last_closed_period(period, today):
+    """Return (start, end) of the most recent week or month that ended before today."""
+    start, _ = period_bounds(period, today)
+    return period_bounds(period, start - timedelta(days=1))
+
+
+def closed_period_start(value, period, today):
+    """
+    Parse a ?start= date and return the first day of its week or month when that period
+    has closed (so it can be served from a snapshot), else None.
+    """
+    try:
+        day = parse_date(value or '')
+    except ValueError:
+        return None
+    if day is None:
+        return None
+    start, end = period_bounds(period, day)
+    return start if end < today else None
+
+
+def period_totals_query(metric, start=None, end=None, by_group=False):
+    """
+    Per-user totals of a metric from the pre-summed daily rows, as a values() queryset of
+    user_id / value. start and end are inclusive and open-ended when None. With
+    by_group, there is one row per group membership, with the group in `group_id`.
+    """
+    config = LEADERBOARD_METRICS[metric]
+    field = config['field']
+    if config['source'] == 'daily':
+        rows = UserDailyMetrics.objects.all()
+        value = Sum(field)
+    else:
+        rows = DailyEarnings.objects.filter(currency_type=field)
+        value = Sum('amount')
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+    if by_group:
+        rows = rows.filter(user__groupmembership__isnull=False).annotate(group_id=F('user__groupmembership__group_id'))
+        return rows.values('group_id', 'user_id').annotate(value=value).order_by()
+    return rows.values('user_id').annotate(value=value).order_by()
+
+
+def top_period_totals(metric, start=None, end=None, users=None, limit=10):
+    """
+    The top `limit` users (optionally within a `users` queryset) by a metric's total
+    between start and end, as ranked UserProfile objects with ties by user ID. One
+    grouped query over the pre-summed rows; users without rows fill any remaining
+    places with 0, as they would in a full ranking.
+    """
+    rows = period_totals_query(metric, start, end)
+    if users is not None:
+        rows = rows.filter(user__in=users)
+    rows = [
+        (user_id, float(value or 0))
+        for user_id, value in rows.order_by('-value', 'user_id').values_list('user_id', 'value')[:limit]
+    ]
+    if len(rows) < limit:
+        rest = User.objects.all() if users is None else users
+        rest = rest.exclude(id__in=[user_id for user_id, _ in rows]).order_by('id')
+        rows += [(user_id, 0.0) for user_id in rest.values_list('id', flat=True)[:limit - len(rows)]]
+    return hydrate_leaderboard(rows)
+
+
+# Standings read from the database and written per INSERT while snapshotting
+SNAPSHOT_BATCH_SIZE = 2000
+
+
+def _ranked_snapshot_rows(period, start, end, metric, rows):
+    """Turn ordered (group_id, user_id, value) rows into LeaderboardSnapshot rows, ranking each group from 1."""
+    current_group, rank = None, 0
+    for group_id, user_id, value in rows:
+        if group_id != current_group:
+            current_group, rank = group_id, 0
+        rank += 1
+        yield LeaderboardSnapshot(
+            period=period, period_start=start, period_end=end, metric=metric,
+            group_id=group_id, user_id=user_id, value=float(value or 0), rank=rank
+        )
+
+
+def _snapshot_rows(period, start, end, metric):
+    """
+    Yield the ranked LeaderboardSnapshot rows of one metric, the global board and then
+    group by group, ranked like the live boards (value descending, then user ID). Totals
+    are read in order from the database in chunks, so only one chunk is in memory.
+    """
+    global_rows = period_totals_query(metric, start, end).order_by('-value', 'user_id').values_list(
+        'user_id', 'value'
+    )
+    yield from _ranked_snapshot_rows(period, start, end, metric, (
+        (None, user_id, value) for user_id, value in global_rows.iterator(chunk_size=SNAPSHOT_BATCH_SIZE)
+    ))
+    group_rows = period_totals_query(metric, start, end, by_group=True).order_by(
+        'group_id', '-value', 'user_id'
+    ).values_list('group_id', 'user_id', 'value')
+    yield from _ranked_snapshot_rows(
+        period, start, end, metric, group_rows.iterator(chunk_size=SNAPSHOT_BATCH_SIZE)
+    )
+
+
+def snapshot_leaderboards(period, day):
+    """
+    Freeze the standings of the week or month containing `day` for every metric: the
+    global board and one board per group. Friends standings are read from the global
+    rows of the user and their friends. Re-running replaces that period's snapshot.
+    Rows are written SNAPSHOT_BATCH_SIZE at a time as they are read, so memory stays
+    flat however many users are ranked.
+    """
+    start, end = period_bounds(period, day)
+    written = 0
+    with transaction.atomic():
+        LeaderboardSnapshot.objects.filter(period=period, period_start=start).delete()
+        for metric in LEADERBOARD_METRICS:
+            rows = _snapshot_rows(period, start, end, metric)
+            while batch := list(islice(rows, SNAPSHOT_BATCH_SIZE)):
+                LeaderboardSnapshot.objects.bulk_create(batch)
+                written += len(batch)
+    logger.info(f"Snapshotted {written} leaderboard rows for the {period} of {start}")
+    return written
+
+
+def snapshot_periods(metric, period, limit=12):
+    """Start dates of the most recent snapshotted periods, newest first."""
+    return list(LeaderboardSnapshot.objects.filter(
+        metric=metric, period=period, group__isnull=True
+    ).values_list('period_start', flat=True).distinct().order_by('-period_start')[:limit])
+
+
+def get_snapshot_standings(metric, period, period_start, group_id=None, user_ids=None, first_rank=1, last_rank=None):
+    """
+    Ranked UserProfile objects (with `rank`, `metric_value` and `value`) from a closed
+    period's snapshot for ranks first_rank..last_rank: the global board, a group's board,
+    or, with `user_ids`, the global rows of those users re-ranked among themselves.
+    """
+    rows = LeaderboardSnapshot.objects.filter(
+        metric=metric, period=period, period_start=period_start, group_id=group_id
+    ).select_related('user').order_by('rank')
+    if user_ids is not None:
+        # A friends scope is small; rank it in full, then keep the requested ranks
+        rows = list(rows.filter(user_id__in=user_ids))
+        for rank, row in enumerate(rows, 1):
+            row.rank = rank
+        rows = [row for row in rows if row.rank >= first_rank and (last_rank is None or row.rank <= last_rank)]
+    else:
+        rows = rows.filter(rank__gte=first_rank)
+        if last_rank is not None:
+            rows = rows.filter(rank__lte=last_rank)
+
+    ranked = []
+    for row in rows:
+        user = row.user
+        user.rank = row.rank
+        user.metric_value = user.value = row.value
+        ranked.append(user)
+    return ranked
+
+
+def get_rank_history(user, metric, period, group_id=None, friend_ids=None, limit=12):
+    """
+    The user's rank in each of the last `limit` snapshotted periods, oldest first, as
+    [{'period_start', 'period_end', 'rank', 'value', 'ranked'}, ...]. With `friend_ids`
+    the rank is among the user and those friends, from the global rows.
+    """
+    snapshots = LeaderboardSnapshot.objects.filter(metric=metric, period=period, group_id=group_id)
+    own = list(snapshots.filter(user=user).values_list(
+        'period_start', 'period_end', 'rank', 'value'
+    ).order_by('-period_start')[:limit])[::-1]
+    starts = [period_start for period_start, _, _, _ in own]
+
+    if friend_ids is None:
+        ranks = {period_start: rank for period_start, _, rank, _ in own}
+        ranked = dict(snapshots.filter(period_start__in=starts).values('period_start').annotate(
+            ranked=Count('id')
+        ).values_list('period_start', 'ranked').order_by())
+    else:
+        # Position among the user and their friends, in global rank order
+        ranks, ranked = {}, {}
+        rows = snapshots.filter(
+            period_start__in=starts,
+            user_id__in=[user.id, *friend_ids]
+        ).values_list('period_start', 'user_id').order_by('period_start', 'rank')
+        for period_start, user_id in rows:
+            ranked[period_start] = ranked.get(period_start, 0) + 1
+            if user_id == user.id:
+                ranks[period_start] = ranked[period_start]
+
+    return [
+        {
+            'period_start': period_start,
+            'period_end': period_end,
+            'rank': ranks[period_start],
+            'value': value,
+            'ranked': ranked[period_start],
+        }
+        for period_start, period_end, _, value in own
+    ]
@@ -0,0 +1,99 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import (
+    BENCHMARK_PAGES, clear_benchmark_data, run_benchmark, targets_live_database, targets_live_leaderboards,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic users with Garmin, transaction and rollup data at the given scales and time "
+        "the leaderboard pages for every metric, period and scope (p50/p95 latency, queries, peak "
+        "memory). The users are written to the LEADERBOARD_BENCHMARK_DATABASE database (or --database; "
+        "migrate it first) and the Redis leaderboards rebuilt in LEADERBOARD_BENCHMARK_REDIS_URL (or "
+        "--redis-url), never in the live database or LEADERBOARD_REDIS_URL without --force."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, nargs='+', default=[10000],
+            help="User counts to benchmark at, e.g. --users 10000 100000 1000000 (default 10000)."
+        )
+        parser.add_argument('--days', type=int, default=35, help="Days of history per synthetic user (default 35).")
+        parser.add_argument('--friends', type=int, default=50, help="Friends of the requesting user (default 50).")
+        parser.add_argument('--group-size', type=int, default=1000, help="Members of the benchmark group (default 1000).")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per combination (default 20).")
+        parser.add_argument(
+            '--path', choices=['sql', 'redis'], action='append', dest='paths',
+            help="Leaderboard path to time (can be given twice; default both)."
+        )
+        parser.add_argument(
+            '--page', choices=list(BENCHMARK_PAGES), action='append', dest='pages',
+            help="Page to time (can be given more than once; default all)."
+        )
+        parser.add_argument(
+            '--redis-url', default=settings.LEADERBOARD_BENCHMARK_REDIS_URL,
+            help="Redis database for the synthetic leaderboards (default LEADERBOARD_BENCHMARK_REDIS_URL)."
+        )
+        parser.add_argument(
+            '--database', default=settings.LEADERBOARD_BENCHMARK_DATABASE,
+            help="Database alias for the synthetic users (default LEADERBOARD_BENCHMARK_DATABASE)."
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Run even when --database is the live 'default' database or --redis-url the live "
+                 "LEADERBOARD_REDIS_URL, adding the synthetic users to the live leaderboards."
+        )
+        parser.add_argument('--output', help="Also write the results to this JSON file.")
+        parser.add_argument('--clear', action='store_true', help="Delete the synthetic users and exit.")
+
+    def handle(self, *args, **options):
+        if options['database'] not in settings.DATABASES:
+            raise CommandError(
+                f"No database '{options['database']}' is configured. Set BENCHMARK_DB_NAME for the 'benchmark' "
+                "database, or pass --database with another alias."
+            )
+        if options['clear']:
+            deleted = clear_benchmark_data(options['database'])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} benchmark rows."))
+            return
+
+        if targets_live_database(options['database']) and not options['force']:
+            raise CommandError(
+                f"'{options['database']}' is the live database; the benchmark would add its synthetic users to the "
+                "live leaderboards and social pages. Point --database at another database or pass --force."
+            )
+        if targets_live_leaderboards(options['redis_url']) and not options['force']:
+            raise CommandError(
+                f"{options['redis_url']} is the live leaderboard database (LEADERBOARD_REDIS_URL); the benchmark "
+                "would overwrite the live boards. Point --redis-url at another database or pass --force."
+            )
+
+        results = []
+        self.stdout.write(
+            f"{'users':>8} {'path':<5} {'page':<12} {'metric':<11} {'period':<8} {'scope':<7} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'queries':>7} {'peak KiB':>9}"
+        )
+        for result in run_benchmark(
+            options['users'],
+            paths=options['paths'] or ['sql', 'redis'],
+            repeat=options['repeat'],
+            pages=options['pages'],
+            redis_url=options['redis_url'],
+            database=options['database'],
+            days=options['days'],
+            friends=options['friends'],
+            group_size=options['group_size'],
+        ):
+            results.append(result)
+            self.stdout.write(
+                f"{result['users']:>8} {result['path']:<5} {result['page']:<12} {result['metric']:<11} "
+                f"{result['period']:<8} {result['scope']:<7} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['queries']:>7} {result['peak_kib']:>9.0f}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Benchmarked {len(results)} page combinations."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.leaderboards import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis leaderboard sets from the database and switch the leaderboards over to them."
+
+    def handle(self, *args, **options):
+        sets = rebuild_leaderboards(timezone.localdate())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {sets} leaderboard sets."))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_alter_userprofile_avatar'),
+        ('social', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=10)),
+                ('period_start', models.DateField(help_text='First day of the period (Monday for weeks, the 1st for months).')),
+                ('period_end', models.DateField(help_text='Last day of the period.')),
+                ('metric', models.CharField(help_text='Metric name from core.leaderboards.LEADERBOARD_METRICS.', max_length=20)),
+                ('value', models.FloatField(help_text="The user's total for the period.")),
+                ('rank', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(blank=True, help_text='Group these standings are for; empty for the global leaderboard.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_snapshots', to='social.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['period', 'metric', '-period_start', 'rank'],
+                'indexes': [models.Index(fields=['period', 'metric', 'period_start', 'group', 'rank'], name='core_leader_period_c15bdf_idx'), models.Index(fields=['user', 'period', 'metric', 'period_start'], name='core_leader_user_id_1033cb_idx')],
+            },
+        ),
+    ]
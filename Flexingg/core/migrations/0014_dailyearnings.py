@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_earnings(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    DailyEarnings = apps.get_model('core', 'DailyEarnings')
+    rows = Transaction.objects.annotate(day=TruncDate('created_at')).values(
+        'user_id', 'day', 'currency_type'
+    ).annotate(total=Sum('amount')).order_by()
+
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(DailyEarnings(
+            user_id=row['user_id'],
+            date=row['day'],
+            currency_type=row['currency_type'],
+            amount=row['total']
+        ))
+        if len(batch) >= 2000:
+            DailyEarnings.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        DailyEarnings.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_leaderboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyEarnings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Local calendar day the currency was earned.')),
+                ('currency_type', models.CharField(choices=[('cardio_coins', 'Cardio Coins'), ('gym_gems', 'Gym Gems')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, help_text='Total earned that day.', max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_earnings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Earnings',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['currency_type', 'date'], name='core_dailye_currenc_32fb5d_idx')],
+                'unique_together': {('user', 'date', 'currency_type')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_earnings, migrations.RunPython.noop),
+    ]
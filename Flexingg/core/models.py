@@ -2,7 +2,8 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
 import uuid
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 
@@ -53,26 +54,36 @@ class UserProfile(AbstractUser):
 
 
     def earn_gym_gems(self, amount, garmin_activity=None) -> None:
-        from .models import Transaction
-        Transaction.objects.create(
-            user=self,
-            currency_type='gym_gems',
-            amount=amount,
-            garmin_activity=garmin_activity
-        )
-        self.gym_gems += amount
-        self.save()
+        self._earn('gym_gems', amount, garmin_activity)
 
     def earn_cardio_coins(self, amount, garmin_activity=None) -> None: 
-        from .models import Transaction
-        Transaction.objects.create(
-            user=self,
-            currency_type='cardio_coins',
-            amount=amount,
-            garmin_activity=garmin_activity
-        )
-        self.cardio_coins += amount
-        self.save()
+        self._earn('cardio_coins', amount, garmin_activity)
+
+    def _earn(self, currency_type, amount, garmin_activity=None) -> None:
+        """Log the transaction, add it to today's DailyEarnings row and the balance, all in one transaction."""
+        from .models import Transaction, DailyEarnings
+        from django.db.models import F
+        today = timezone.localdate()
+        with transaction.atomic():
+            Transaction.objects.create(
+                user=self,
+                currency_type=currency_type,
+                amount=amount,
+                garmin_activity=garmin_activity
+            )
+            # Increment in SQL so concurrent earnings on the same day add up
+            earnings, created = DailyEarnings.objects.get_or_create(
+                user=self,
+                date=today,
+                currency_type=currency_type,
+                defaults={'amount': amount}
+            )
+            if not created:
+                DailyEarnings.objects.filter(pk=earnings.pk).update(amount=F('amount') + amount)
+            setattr(self, currency_type, getattr(self, currency_type) + amount)
+            self.save()
+        from .leaderboards import record_earning
+        transaction.on_commit(lambda: record_earning(self, currency_type, amount, today))
 
 
 class ColorPreferences(models.Model):    
@@ -218,6 +229,24 @@ class Transaction(models.Model):
         return f"{self.user.username} earned {self.amount} {self.currency_type} on {self.created_at.date()}"
 
 
+class DailyEarnings(models.Model):
+    """Per-user, per-day total of each currency earned, kept by UserProfile.earn_* for the currency leaderboards."""
+    user = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name='daily_earnings')
+    date = models.DateField(help_text="Local calendar day the currency was earned.")
+    currency_type = models.CharField(max_length=20, choices=Transaction.CURRENCY_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Total earned that day.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.date}: {self.amount} {self.currency_type}"
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ('user', 'date', 'currency_type')
+        indexes = [models.Index(fields=['currency_type', 'date'])]
+        verbose_name_plural = "Daily Earnings"
+
+
 class SweatScoreWeights(models.Model):    
     """Stores configurable weights for sweat score calculation."""    
     ZONE_CHOICES = (
@@ -248,7 +277,74 @@ class SweatScoreWeights(models.Model):
         verbose_name_plural = "Sweat Score Weights"
 
 
+class LeaderboardSnapshot(models.Model):
+    """Frozen standing of one user on a closed weekly or monthly leaderboard."""
+    PERIOD_CHOICES = [
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField(help_text="First day of the period (Monday for weeks, the 1st for months).")
+    period_end = models.DateField(help_text="Last day of the period.")
+    metric = models.CharField(max_length=20, help_text="Metric name from core.leaderboards.LEADERBOARD_METRICS.")
+    group = models.ForeignKey(
+        'social.Group',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='leaderboard_snapshots',
+        help_text="Group these standings are for; empty for the global leaderboard."
+    )
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='leaderboard_snapshots')
+    value = models.FloatField(help_text="The user's total for the period.")
+    rank = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        scope = self.group.name if self.group_id else 'global'
+        return f"{self.user.username} #{self.rank} {self.metric} ({scope}, {self.period} of {self.period_start})"
+
+    class Meta:
+        ordering = ['period', 'metric', '-period_start', 'rank']
+        indexes = [
+            models.Index(fields=['period', 'metric', 'period_start', 'group', 'rank']),
+            models.Index(fields=['user', 'period', 'metric', 'period_start']),
+        ]
+
+
 @receiver(post_save, sender=UserProfile)
 def create_color_preferences(sender, instance, created, **kwargs):  
     if created:  
         ColorPreferences.objects.create(user=instance)
+
+
+@receiver(post_save, sender=UserProfile)
+def add_to_leaderboards(sender, instance, created, **kwargs):
+    if created:
+        from .leaderboards import add_leaderboard_user
+        transaction.on_commit(lambda: add_leaderboard_user(instance))
+
+
+@receiver(post_delete, sender=UserProfile)
+def remove_from_leaderboards(sender, instance, **kwargs):
+    from .leaderboards import remove_leaderboard_user
+    user_id = instance.id
+    transaction.on_commit(lambda: remove_leaderboard_user(user_id, timezone.localdate()))
+
+
+@receiver(post_save, sender=SweatScoreWeights)
+@receiver(post_delete, sender=SweatScoreWeights)
+def recompute_sweat_scores(sender, instance, **kwargs):
+    # Stored activity sweat scores depend on the weights, so recompute them in the background
+    # (once per burst of saves, e.g. the admin's editable weight list)
+    from garminconnect.tasks import queue_sweat_score_recompute
+    transaction.on_commit(queue_sweat_score_recompute)
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def invalidate_friendship_charts(sender, instance, **kwargs):
+    # Both users' charts list each other as friends, so drop their cached payloads
+    from .charts import invalidate_chart_cache
+    invalidate_chart_cache([instance.from_user_id, instance.to_user_id])
@@ -0,0 +1,32 @@
+from celery import shared_task
+from django.utils import timezone
+from datetime import date
+from .leaderboards import last_closed_period, rebuild_leaderboards, snapshot_leaderboards
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def rebuild_leaderboards_task():
+    """
+    Celery task for rebuilding the Redis leaderboard sets from the database. Runs
+    nightly from the beat schedule so any drift from missed incremental updates heals.
+    """
+    sets = rebuild_leaderboards(timezone.localdate())
+    return {'success': True, 'sets': sets}
+
+
+@shared_task
+def snapshot_leaderboards_task(period, period_start=None):
+    """
+    Celery task for freezing a closed week's or month's leaderboard standings. Runs from
+    the beat schedule right after each period ends; `period_start` (ISO date) snapshots
+    an earlier period instead.
+    """
+    if period_start:
+        day = date.fromisoformat(period_start)
+    else:
+        day, _ = last_closed_period(period, timezone.localdate())
+    rows = snapshot_leaderboards(period, day)
+    return {'success': True, 'period': period, 'period_start': day.isoformat(), 'rows': rows}
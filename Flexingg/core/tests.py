@@ -1,3 +1,253 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import leaderboards
+from core.charts import lttb_indices
+from core.models import Friendship as ChartFriendship, UserProfile
+from garminconnect.models import UserDailyMetrics
+from garminconnect.tests import LOCAL_CACHE
+from social.models import Friendship
+
+
+class LeaderboardStreamTests(TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        for patcher in (
+            mock.patch.object(leaderboards, '_client', fakeredis.FakeRedis(server=server)),
+            mock.patch.object(leaderboards, 'get_async_redis', lambda: fakeredis.FakeAsyncRedis(server=server)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        today = timezone.localdate()
+        self.me = UserProfile.objects.create_user('me', password='x')
+        UserDailyMetrics.objects.create(user=self.me, date=today, steps=50000)
+        for i in range(6):
+            friend = UserProfile.objects.create_user(f'friend{i}', password='x')
+            Friendship.objects.create(from_user=self.me, to_user=friend, status='accepted')
+            UserDailyMetrics.objects.create(user=friend, date=today - timedelta(days=1), steps=1000 * (i % 3))
+        leaderboards.rebuild_leaderboards(today)
+        self.client.force_login(self.me)
+        self.async_client.force_login(self.me)
+
+    async def next_event(self, events):
+        async for chunk in events:
+            chunk = chunk.decode()
+            if chunk.startswith('data: '):
+                return json.loads(chunk[len('data: '):])
+
+    async def read_first_event(self, url):
+        events = (await self.async_client.get(url)).streaming_content
+        try:
+            return await self.next_event(events)
+        finally:
+            await events.aclose()
+
+    async def test_friends_stream_slots_match_rendered_board(self):
+        response = await self.async_client.get(
+            reverse('fitness:leaderboards', kwargs={'metric': 'steps', 'period': 'week'}) + '?scope=friends'
+        )
+        rendered = [
+            (user.rank, user.id)
+            for user in list(response.context['top3']) + list(response.context['list_users'])
+        ]
+        self.assertNotIn(self.me.id, [user_id for _, user_id in rendered])
+
+        slots = await self.read_first_event(response.context['stream_url'])
+        self.assertEqual([(slot['rank'], slot['user_id']) for slot in slots], rendered)
+
+    @override_settings(LEADERBOARD_STREAM_TIMEOUT=2)
+    async def test_stream_reads_the_board_only_for_its_metric_and_period(self):
+        url = reverse('fitness:leaderboard-stream') + '?metric=steps&period=week&ranks=1-3'
+        with mock.patch('core.views.get_leaderboard', wraps=leaderboards.get_leaderboard) as get_leaderboard:
+            events = (await self.async_client.get(url)).streaming_content
+            await self.next_event(events)
+            reads = get_leaderboard.call_count
+
+            client = leaderboards.get_redis()
+            for metric, periods in (('cardio_coins', ['all', 'week', 'month']), ('steps', ['all', 'month'])):
+                client.publish(leaderboards.UPDATES_CHANNEL, json.dumps({
+                    'user_id': self.me.id, 'metrics': [metric], 'periods': periods
+                }))
+            friend = await UserProfile.objects.aget(username='friend0')
+            await UserDailyMetrics.objects.acreate(user=friend, date=timezone.localdate(), steps=90000)
+            await sync_to_async(leaderboards.update_daily_leaderboards)(
+                friend.id, [timezone.localdate()], timezone.localdate()
+            )
+            # Runs until the stream times out, after every message above was handled
+            slots = await self.next_event(events)
+            self.assertIsNone(await self.next_event(events))
+        self.assertEqual(get_leaderboard.call_count, reads + 1)
+        self.assertEqual([(slot['rank'], slot['user_id']) for slot in slots[:2]], [(1, friend.id), (2, self.me.id)])
+
+
+class CurrencyLeaderboardTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(leaderboards, '_client', fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.users = [UserProfile.objects.create_user(f'earner{i}', password='x') for i in range(3)]
+        leaderboards.rebuild_leaderboards(timezone.localdate())
+        # Earnings reach Redis on commit, one ZINCRBY each
+        with self.captureOnCommitCallbacks(execute=True):
+            for user, amount in zip(self.users, (30, 20, 10)):
+                user = UserProfile.objects.get(id=user.id)
+                user.earn_cardio_coins(Decimal(amount))
+        # Spending lowers the balance, not the amount earned
+        UserProfile.objects.filter(id=self.users[0].id).update(cardio_coins=Decimal(1))
+        self.client.force_login(self.users[0])
+
+    def social_ranking(self):
+        response = self.client.get(reverse('social:main') + '?category=coins&history=All+Time')
+        return [(user['name'], user['metric_value']) for user in response.context['users'][:3]]
+
+    def leaderboard_ranking(self):
+        response = self.client.get(reverse('fitness:leaderboards', kwargs={'metric': 'cardiocoins', 'period': 'all'}))
+        return [(user.username, float(user.metric_value)) for user in response.context['top3']]
+
+    def test_all_time_currency_boards_rank_earnings_on_both_paths(self):
+        earned = [('earner0', 30.0), ('earner1', 20.0), ('earner2', 10.0)]
+        self.assertEqual(self.social_ranking(), earned)
+        self.assertEqual(self.leaderboard_ranking(), earned)
+
+        leaderboards.get_redis().delete(leaderboards.READY_KEY)
+        self.assertEqual(self.social_ranking(), earned)
+        self.assertEqual(self.leaderboard_ranking(), earned)
+
+
+class LeaderboardCursorTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(leaderboards, '_client', fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        today = timezone.localdate()
+        # Three users share each value, so page boundaries fall between tied users
+        for i in range(26):
+            user = UserProfile.objects.create_user(f'runner{i:02d}')
+            UserDailyMetrics.objects.create(user=user, date=today, steps=1000 * (i // 3))
+        self.ranking = list(enumerate(
+            UserDailyMetrics.objects.order_by('-steps', 'user_id').values_list('user_id', flat=True), 1
+        ))
+        self.client.force_login(user)
+        leaderboards.rebuild_leaderboards(today)
+
+    def use_sql(self):
+        leaderboards.get_redis().delete(leaderboards.READY_KEY)
+
+    def get_page(self, **params):
+        response = self.client.get(
+            reverse('fitness:leaderboards', kwargs={'metric': 'steps', 'period': 'all'}), params
+        )
+        return response.context
+
+    def rows(self, users):
+        return [(user.rank, user.id) for user in users]
+
+    def pages(self, cursors):
+        return [self.rows(self.get_page(**cursor)['list_users']) for cursor in cursors]
+
+    def walk(self):
+        """Page forward from the first page with ?after=, then back from the last with ?before=."""
+        context = self.get_page()
+        forward = self.rows(context['top3']) + self.rows(context['list_users'])
+        cursors = []
+        while context['cursor_page']['next']:
+            cursors.append({'after': context['cursor_page']['next']})
+            context = self.get_page(**cursors[-1])
+            forward += self.rows(context['list_users'])
+        backward = self.rows(context['list_users'])
+        while context['cursor_page']['previous']:
+            cursors.append({'before': context['cursor_page']['previous']})
+            context = self.get_page(**cursors[-1])
+            backward = self.rows(context['list_users']) + backward
+        return forward, backward, cursors
+
+    def test_redis_pages_match_full_ranking(self):
+        forward, backward, _ = self.walk()
+        self.assertEqual(forward, self.ranking)
+        self.assertEqual(backward, self.ranking[3:])
+
+    def test_sql_pages_match_full_ranking(self):
+        self.use_sql()
+        forward, backward, _ = self.walk()
+        self.assertEqual(forward, self.ranking)
+        self.assertEqual(backward, self.ranking[3:])
+
+    def test_cursors_page_the_same_rows_on_both_paths(self):
+        # A cursor from one path keeps paging on the other when Redis comes or goes mid-walk
+        _, _, redis_cursors = self.walk()
+        redis_pages = self.pages(redis_cursors)
+        self.use_sql()
+        _, _, sql_cursors = self.walk()
+        sql_pages = self.pages(sql_cursors)
+        self.assertEqual(self.pages(redis_cursors), redis_pages)
+
+        leaderboards.rebuild_leaderboards(timezone.localdate())
+        self.assertEqual(self.pages(sql_cursors), sql_pages)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ChartDataTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(leaderboards, '_client', fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.today = timezone.localdate()
+        self.me = UserProfile.objects.create_user('me')
+        friend = UserProfile.objects.create_user('friend')
+        # Charts read core's friendships, the leaderboards social's
+        ChartFriendship.objects.create(from_user=self.me, to_user=friend, status='accepted')
+        for i in range(0, 400, 7):
+            UserDailyMetrics.objects.create(user=self.me, date=self.today - timedelta(days=i), steps=1000 + 37 * i)
+            UserDailyMetrics.objects.create(user=friend, date=self.today - timedelta(days=i + 3), steps=5000 - 11 * i)
+        self.client.force_login(self.me)
+        self.url = reverse('fitness:chart-data', kwargs={'metric': 'steps'})
+
+    def test_lttb_keeps_threshold_points_with_both_ends(self):
+        values = [(i * 7919) % 101 for i in range(1000)]
+        for threshold in (3, 10, 250, 999):
+            kept = lttb_indices(values, threshold)
+            self.assertEqual(len(kept), threshold)
+            self.assertEqual((kept[0], kept[-1]), (0, len(values) - 1))
+            self.assertEqual(list(kept), sorted(set(kept)))
+        self.assertEqual(list(lttb_indices(values[:20], 50)), list(range(20)))
+
+    def test_max_points_downsamples_every_series(self):
+        response = self.client.get(self.url, {'range': 'last_year', 'format': 'columnar', 'max_points': 30})
+        data = response.json()
+        days = (self.today - self.today.replace(year=self.today.year - 1, month=1, day=1)).days + 1
+        offsets = data['axis']['offsets']
+        self.assertEqual(data['axis']['count'], 30)
+        self.assertEqual((offsets[0], offsets[-1]), (0, days - 1))
+        for series in (data['user_data'], data['friends_data'][0]['data']):
+            self.assertEqual(len(series), 30)
+        # The last point is still the running total
+        self.assertEqual(data['user_data'][-1], data['stats']['user_total'])
+
+    def test_unchanged_chart_revalidates_with_304(self):
+        params = {'range': 'last_year', 'max_points': 30}
+        first = self.client.get(self.url, params)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        second = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+
+        UserDailyMetrics.objects.filter(user=self.me, date=self.today).update(
+            steps=99999, updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        third = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third['ETag'], etag)
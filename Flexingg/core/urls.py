@@ -12,12 +12,10 @@ urlpatterns = [
     
     path('steps-chart-data/', StepsChartDataView.as_view(), name='steps_chart_data'),
 
-    # Calories Chart Data URL
-    path('api/calories/chart-data/', get_calories_chart_data, name='calories-chart-data'),
-    # Steps Chart Data URL
-    path('api/steps/chart-data/', get_steps_chart_data, name='steps-chart-data'),
-    # Sweat Score Chart Data URL
-    path('api/sweat-score/chart-data/', get_sweat_score_chart_data, name='sweat-score-chart-data'),
+    # Chart Data URL for every metric in core.charts.CHART_METRICS (steps, calories, sweat-score, ...)
+    path('api/<str:metric>/chart-data/', get_chart_data, name='chart-data'),
+    # Several chart metrics in one response, e.g. ?metrics=steps,calories,sweat-score&range=current_month
+    path('api/dashboard/', get_dashboard_data, name='dashboard-data'),
 
     # Background Garmin Sync
     path('background-garmin-sync/', BackgroundGarminSyncView.as_view(), name='background_garmin_sync'),
@@ -25,5 +23,9 @@ urlpatterns = [
     # Leaderboards
     path('leaderboards/', lambda request: redirect('fitness:leaderboards', permanent=False, metric='cardiocoins', period='all'), name='leaderboards_default'),
     path('leaderboards/<str:metric>/<str:period>/', LeaderboardView.as_view(), name='leaderboards'),
+    # A user's rank in each closed week/month: ?metric=steps&period=week&scope=global|friends|group&group_id=
+    path('api/leaderboards/rank-history/', get_rank_history_data, name='rank-history'),
+    path('api/leaderboards/around-me/', get_leaderboard_around_me, name='around-me'),
+    path('api/leaderboards/stream/', get_leaderboard_stream, name='leaderboard-stream'),
     path('comingsoon/', ComingSoonView.as_view(), name='comingsoon'),
 ]
@@ -7,20 +7,32 @@ from django.utils import timezone
 from datetime import date, timedelta, datetime, timezone as dt_timezone
 from .forms import SignUpForm, LoginForm, ProfileForm
 from django.contrib.auth import authenticate, login, logout
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from django.views import View
 from .models import SweatScoreWeights, UserProfile, Friendship
-from garminconnect.models import Garmin_Auth, GarminDailySteps, GarminActivity
+from garminconnect.models import Garmin_Auth, GarminDailySteps, GarminActivity, UserDailyMetrics
+from .charts import CHART_METRICS, get_chart_etag, get_chart_json, get_dashboard_json, parse_chart_options
+from .leaderboards import (
+    LEADERBOARD_METRICS, LEADERBOARD_PERIOD_DAYS, closed_period_start, get_leaderboard,
+    get_rank_history, get_snapshot_standings, hydrate_leaderboard, listen_leaderboard_updates, rank_members,
+    snapshot_periods
+)
 from .models import *  # JWT, Notification, Relationship
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
 User = get_user_model()
 from django.utils import html
 from decimal import Decimal
-import random
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Sum
+from django.conf import settings
+from django.urls import reverse
+from urllib.parse import urlencode
+import json
 import os
+import redis
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -51,25 +63,20 @@ class HomeView(TemplateView):
                     # Trigger async sync
                     from garminconnect.tasks import garmin_sync_steps_task, garmin_sync_activities_task
                     garmin_sync_steps_task.delay(profile.id, start_date=garmin_auth.last_sync.date() + timedelta(days=1) if garmin_auth.last_sync else timezone.now().date() - timedelta(days=30), end_date=timezone.now().date())
-                    garmin_sync_activities_task.delay(profile.id, limit=500, start_date=garmin_auth.last_sync.date() if garmin_auth.last_sync else timezone.now().date() - timedelta(days=30), end_date=timezone.now().date())
+                    garmin_sync_activities_task.delay(profile.id, start_date=garmin_auth.last_sync.date() if garmin_auth.last_sync else timezone.now().date() - timedelta(days=30), end_date=timezone.now().date())
                     context['garmin_sync_triggered'] = True
         
                     # Set user for sync progress indicator
                     context['sync_user_id'] = profile.id
         
-            # Calculate today's total calories from the current user's Garmin activities
+            # Today's calories and steps come from the current user's daily rollup row
             today = timezone.localtime().date()
-            todays_calories = GarminActivity.objects.filter(
-                user=self.request.user,
-                start_time_utc__date=today
-            ).aggregate(total=Sum('calories'))['total'] or 0
-            context['todays_total_calories'] = todays_calories
-
-            todays_steps = GarminDailySteps.objects.filter(
+            todays_metrics = UserDailyMetrics.objects.filter(
                 user=self.request.user,
                 date=today
-            ).aggregate(total=Sum('steps'))['total'] or 0
-            context['todays_steps'] = todays_steps
+            ).values('calories', 'steps').first() or {}
+            context['todays_total_calories'] = todays_metrics.get('calories', 0)
+            context['todays_steps'] = todays_metrics.get('steps', 0)
 
             context['todays_lifting_calories'] = 0
 
@@ -193,873 +200,77 @@ class SettingsView(View):
         return render(request, self.template_name, context)
 
 
-# Step equivalents dictionary
-step_equivalents = {
-    "miles walked": 2000,  # Average steps per mile
-    "kilometers walked": 1250,  # Average steps per kilometer
-    "flights of stairs climbed": 20,  # Average steps per flight
-    "heights of the CN Tower": 500,  # CN Tower height in steps
-    "lengths of the Amazon River": 60000000,  # Amazon River length in steps
-    "widths of Australia": 400000000,  # Australia width in steps
-    "depths of Lake Baikal": 10000,  # Lake Baikal depth in steps
-    "spans of the Brooklyn Bridge": 500,  # Brooklyn Bridge span in steps
-    "lengths of a T-Rex": 150,  # T-Rex length in steps
-    "heights of the Leaning Tower of Pisa": 60,  # Leaning Tower height in steps
-    "widths of the English Channel": 3000000,  # English Channel width in steps
-    "distances to the North Pole": 200000000,  # North Pole distance in steps
-    "lengths of the Yangtze River": 60000000,  # Yangtze River length in steps
-    "depths of the Grand Canyon": 2000,  # Grand Canyon depth in steps
-    "spans of the Tacoma Narrows Bridge": 1000,  # Tacoma Narrows span in steps
-    "heights of the Washington Monument": 170,  # Washington Monument height in steps
-    "lengths of a school bus": 150,  # School bus length in steps
-    "distances to the South Pole": 250000000,  # South Pole distance in steps
-    "circumferences of Earth": 22500000,  # Earth's circumference in steps
-    "widths of the Pacific Ocean": 15000000000,  # Pacific Ocean width in steps
-    "heights of the Space Needle": 180,  # Space Needle height in steps
-    "lengths of the Mississippi River": 40000000,  # Mississippi River length in steps
-    "depths of the Challenger Deep": 10000,  # Challenger Deep depth in steps
-    "spans of the Verrazzano Bridge": 1500,  # Verrazzano Bridge span in steps
-}
-
-def relate_steps(steps):
-    """
-    Relates a given step count to random items from the step_equivalents dictionary,
-    ensuring the quantity is less than 100 and not rounded to 0.00.
-    """
-    if steps < 0:
-        return "How?"
-    else:
-        # Filter items so the resulting quantity is less than 100 and not rounded to 0.00
-        suitable_items = {
-            name: equiv for name, equiv in step_equivalents.items()
-            if equiv > 0 and steps / equiv < 100
-        }
-
-        if not suitable_items:
-            # If no suitable items are found, pick the item with the largest equivalent value
-            item_name, item_equiv = max(step_equivalents.items(), key=lambda item: item[1])
-            quantity = steps / item_equiv
-            return f"You've taken {steps} steps, which is equivalent to about {quantity:.2f} {item_name}."
-
-        else:
-            # Select items where the resulting quantity is not rounded to 0.00
-            displayable_items = {
-                name: equiv for name, equiv in suitable_items.items()
-                if f"{steps / equiv:.2f}" != "0.00"
-            }
-
-            if not displayable_items:
-                # If no displayable items are found, pick the item with the smallest equivalent value
-                item_name, item_equiv = min(suitable_items.items(), key=lambda item: item[1])
-                quantity = steps / item_equiv
-                return f"You've taken {steps} steps, which is equivalent to about {quantity:.2f} {item_name}."
-
-            else:
-                item_name, item_equiv = random.choice(list(displayable_items.items()))
-                quantity = steps / item_equiv
-                return f"You've taken {steps} steps, which is equivalent to about {quantity:.2f} {item_name}."
-
-
-# Energy equivalents dictionary (purely energy-based)
-calorie_equivalents = {
-    "energy to boil a cup of water": 10000,
-    "energy in a AA battery": 2000,
-    "energy to run a 100W lightbulb for 1 hour": 86000,
-    "energy to run a satellite for 5 minutes": 800000
-}
-
-def relate_calories(calories):
-    """
-    Relates a given calorie amount to random items from the calorie_equivalents dictionary,
-    ensuring the quantity is less than 100 and not rounded to 0.00.
-    """
-    if calories < 0:
-        return "How? "
-    else:
-        # Filter items so the resulting quantity is less than 100 and not rounded to 0.00
-        suitable_items = {
-            name: cal for name, cal in calorie_equivalents.items()
-            if cal > 0 and calories / cal < 100
-        }
+def chart_response(content):
+    """Wrap serialized chart JSON; large payloads come as an iterator of chunks and are streamed."""
+    if isinstance(content, str):
+        return HttpResponse(content, content_type='application/json', status=200)
+    return StreamingHttpResponse(content, content_type='application/json', status=200)
 
-        if not suitable_items:
-            # If no suitable items are found, pick the item with the largest calorie value
-            item_name, item_calories = max(calorie_equivalents.items(), key=lambda item: item[1])
-            quantity = calories / item_calories
-            return f"You've burned {calories} calories, which is {quantity:.2f}x the {item_name}."
 
-        else:
-            # Select items where the resulting quantity is not rounded to 0.00
-            displayable_items = {
-                name: cal for name, cal in suitable_items.items()
-                if f"{calories / cal:.2f}" != "0.00"
-            }
-
-            if not displayable_items:
-                # If no displayable items are found, pick the item with the smallest calorie value
-                item_name, item_calories = min(suitable_items.items(), key=lambda item: item[1])
-                quantity = calories / item_calories
-                return f"You've burned {calories} calories, which is {quantity:.2f}x the {item_name}."
-
-            else:
-                item_name, item_calories = random.choice(list(displayable_items.items()))
-                quantity = calories / item_calories
-                return f"You've burned {calories} calories, which is {quantity:.2f}x the {item_name}."
-
-
-def get_calories_chart_data(request):
-    """API endpoint for calories chart data with friends' data and podium rankings"""
-    if not request.user.is_authenticated:
-        return JsonResponse({"error": "Authentication required", "status_code": 401}, status=401)
-
-    # Get the requested range (default to current_month)
+def chart_data_etag(request, metric):
+    """ETag for get_chart_data; unchanged charts are answered with 304 before any payload is built."""
+    if not request.user.is_authenticated or metric not in CHART_METRICS:
+        return None
     range_param = request.GET.get('range', 'current_month')
+    options = parse_chart_options(request.GET)
+    return get_chart_etag(request.user, [metric], range_param, timezone.localdate(), options)
 
-    # Calculate date range based on the requested period
-    today = timezone.now().date()
-    if range_param == 'current_month':
-        start_date = today.replace(day=1)
-        end_date = today
-    elif range_param == 'last_month':
-        # Get last month
-        first_of_this_month = today.replace(day=1)
-        last_of_last_month = first_of_this_month - timedelta(days=1)
-        start_date = last_of_last_month.replace(day=1)
-        end_date = last_of_last_month
-    elif range_param == 'last_3_months':
-        # Last 3 months including current
-        start_date = (today.replace(day=1) - timedelta(days=60)).replace(day=1)
-        end_date = today
-    elif range_param == 'last_year':
-        # Last year
-        start_date = today.replace(year=today.year - 1, month=1, day=1)
-        end_date = today
-    elif range_param == 'alltime':
-        # All time
-        start_date = date(2000, 1, 1)
-        end_date = today
-    else:  # Default to current month
-        start_date = today.replace(day=1)
-        end_date = today
-
-    # Get user's calories data
-    from garminconnect.models import GarminActivity
-    user_activities = GarminActivity.objects.filter(
-        user=request.user,
-        start_time_utc__date__range=[start_date, end_date],
-        calories__isnull=False
-    ).exclude(calories=0)
-
-    # Aggregate user calories by date
-    user_calories_by_date = {}
-    for activity in user_activities:
-        date_key = activity.start_time_utc.date().isoformat()
-        user_calories_by_date[date_key] = user_calories_by_date.get(date_key, 0) + (activity.calories or 0)
-
-    # Make user data cumulative
-    cumulative_calories = 0
-    user_data = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_key = current_date.isoformat()
-        daily_calories = user_calories_by_date.get(date_key, 0)
-        cumulative_calories += daily_calories
-        user_data.append({'date': date_key, 'calories': cumulative_calories})
-        current_date += timedelta(days=1)
-
-    # Get friends' data
-    friendships_as_from = Friendship.objects.filter(
-        from_user=request.user,
-        status='accepted'
-    ).values_list('to_user', flat=True)
-    friendships_as_to = Friendship.objects.filter(
-        to_user=request.user,
-        status='accepted'
-    ).values_list('from_user', flat=True)
-    friend_user_ids = list(friendships_as_from) + list(friendships_as_to)
-    friends_data = []
-    all_users_calories = []  # For podium ranking
-    # Add user's total for ranking
-    user_total_calories = sum(activity.calories or 0 for activity in user_activities)
-    if user_total_calories > 0:
-        all_users_calories.append({
-            'user_id': request.user.id,
-            'name': request.user.username,
-            'calories': user_total_calories
-        })
-    # Get friends' data
-    for friend_id in friend_user_ids:
-        try:
-            friend = User.objects.get(id=friend_id)
-            friend_activities = GarminActivity.objects.filter(
-                user=friend,
-                start_time_utc__date__range=[start_date, end_date],
-                calories__isnull=False
-            ).exclude(calories=0)
-            friend_calories_by_date = {}
-            for activity in friend_activities:
-                date_key = activity.start_time_utc.date().isoformat()
-                friend_calories_by_date[date_key] = friend_calories_by_date.get(date_key, 0) + (activity.calories or 0)
-            # Always include friends, even if they have no data (they'll show as flat line at 0)
-            # Make friend data cumulative with all days in range
-            cumulative_calories = 0
-            friend_data = []
-            current_date = start_date
-            while current_date <= end_date:
-                date_key = current_date.isoformat()
-                daily_calories = friend_calories_by_date.get(date_key, 0)
-                cumulative_calories += daily_calories
-                friend_data.append({'date': date_key, 'calories': cumulative_calories})
-                current_date += timedelta(days=1)
-            friends_data.append({
-                'name': friend.username,
-                'data': friend_data
-            })
-            # Add to ranking (only if they have activities)
-            friend_total = sum(activity.calories or 0 for activity in friend_activities)
-            if friend_total > 0:
-                all_users_calories.append({
-                    'user_id': friend.id,
-                    'name': friend.username,
-                    'calories': friend_total
-                })
-        except User.DoesNotExist:
-            continue
-        # Calculate podium rankings
-        if all_users_calories:
-            all_users_calories.sort(key=lambda x: x['calories'], reverse=True)
-            podium_data = []
-            for i, user_info in enumerate(all_users_calories[:3]):
-                podium_data.append({
-                    'name': user_info['name'],
-                    'calories': int(user_info['calories'])
-                })
-            # Calculate stats - get the final cumulative value for each friend
-            friends_totals = []
-            for friend_data in friends_data:
-                if friend_data['data'] and friend_data['data'][-1]['calories']:
-                    friends_totals.append(friend_data['data'][-1]['calories'])
-            friends_average = sum(friends_totals) / len(friends_totals) if friends_totals else 0
-            # Find user's rank
-            user_rank = None
-            for i, user_info in enumerate(all_users_calories):
-                if user_info['user_id'] == request.user.id:
-                    user_rank = i + 1
-                    break
-            stats = {
-                'user_total': int(user_total_calories),
-                'friends_average': int(friends_average) if friends_average else 0,
-                'user_rank': user_rank,
-                'sentence': relate_calories(int(user_total_calories)) if user_total_calories > 0 else "No calories burned yet!"
-            }
-            return JsonResponse({
-                'user_data': user_data,
-                'friends_data': friends_data,
-                'podium_data': podium_data,
-                'stats': stats,
-                'date_range': {
-                    'start': start_date.isoformat(),
-                    'end': end_date.isoformat()
-                }
-            }, status=200)
-    else:
-        return JsonResponse({"error": "No friends found for the user", "status_code": 404}, status=404)
 
-
-def get_steps_chart_data(request):
-    """API endpoint for steps chart data with friends' data and podium rankings"""
+@condition(etag_func=chart_data_etag)
+def get_chart_data(request, metric):
+    """API endpoint for chart data of any registered metric, with friends' data and podium rankings"""
     if not request.user.is_authenticated:
         return JsonResponse({"error": "Authentication required", "status_code": 401}, status=401)
+    if metric not in CHART_METRICS:
+        return JsonResponse({"error": f"Unknown chart metric '{metric}'", "status_code": 404}, status=404)
 
     # Get the requested range (default to current_month)
     range_param = request.GET.get('range', 'current_month')
-
-    # Calculate date range based on the requested period
-    today = timezone.localtime().date()
-    if range_param == 'current_month':
-        start_date = today.replace(day=1)
-        end_date = today
-    elif range_param == 'last_month':
-        # Get last month
-        first_of_this_month = today.replace(day=1)
-        last_of_last_month = first_of_this_month - timedelta(days=1)
-        start_date = last_of_last_month.replace(day=1)
-        end_date = last_of_last_month
-    elif range_param == 'last_3_months':
-        # Last 3 months including current
-        start_date = (today.replace(day=1) - timedelta(days=60)).replace(day=1)
-        end_date = today
-    elif range_param == 'last_year':
-        # Last year
-        start_date = today.replace(year=today.year - 1, month=1, day=1)
-        end_date = today
-    elif range_param == 'alltime':
-        # All time
-        start_date = date(2000, 1, 1)
-        end_date = today
-    else:  # Default to current month
-        start_date = today.replace(day=1)
-        end_date = today
-
-    # Get user's steps data from GarminDailySteps
-    user_steps_records = GarminDailySteps.objects.filter(
-        user=request.user,
-        date__range=[start_date, end_date]
-    ).order_by('date')
-
-    # Aggregate user steps by date
-    user_steps_by_date = {}
-    for record in user_steps_records:
-        date_key = record.date.isoformat()
-        user_steps_by_date[date_key] = record.steps
-
-    # Make user data cumulative
-    cumulative_steps = 0
-    user_data = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_key = current_date.isoformat()
-        daily_steps = user_steps_by_date.get(date_key, 0)
-        cumulative_steps += daily_steps
-        user_data.append({'date': date_key, 'steps': cumulative_steps})
-        current_date += timedelta(days=1)
-
-    # Get friends' data
-    friendships_as_from = Friendship.objects.filter(
-        from_user=request.user,
-        status='accepted'
-    ).values_list('to_user', flat=True)
-
-    friendships_as_to = Friendship.objects.filter(
-        to_user=request.user,
-        status='accepted'
-    ).values_list('from_user', flat=True)
-
-    friend_user_ids = list(friendships_as_from) + list(friendships_as_to)
-
-    friends_data = []
-    all_users_steps = []  # For podium ranking
-
-    # Add user's total for ranking
-    user_total_steps = sum(record.steps for record in user_steps_records)
-    if user_total_steps > 0:
-        all_users_steps.append({
-            'user_id': request.user.id,
-            'name': request.user.username,
-            'steps': user_total_steps
-        })
-
-    # Get friends' data
-    for friend_id in friend_user_ids:
-        try:
-            friend = User.objects.get(id=friend_id)
-            friend_steps_records = GarminDailySteps.objects.filter(
-                user=friend,
-                date__range=[start_date, end_date]
-            )
-
-            friend_steps_by_date = {}
-            for record in friend_steps_records:
-                date_key = record.date.isoformat()
-                friend_steps_by_date[date_key] = record.steps
-
-            # Always include friends, even if they have no data (they'll show as flat line at 0)
-            # Make friend data cumulative with all days in range
-            cumulative_steps = 0
-            friend_data = []
-            current_date = start_date
-            while current_date <= end_date:
-                date_key = current_date.isoformat()
-                daily_steps = friend_steps_by_date.get(date_key, 0)
-                cumulative_steps += daily_steps
-                friend_data.append({'date': date_key, 'steps': cumulative_steps})
-                current_date += timedelta(days=1)
-
-            friends_data.append({
-                'name': friend.username,
-                'data': friend_data
-            })
-
-            # Add to ranking (only if they have steps)
-            friend_total = sum(record.steps for record in friend_steps_records)
-            if friend_total > 0:
-                all_users_steps.append({
-                    'user_id': friend.id,
-                    'name': friend.username,
-                    'steps': friend_total
-                })
-
-        except User.DoesNotExist:
-            continue
-
-    # Calculate podium rankings
-    all_users_steps.sort(key=lambda x: x['steps'], reverse=True)
-    podium_data = []
-    for i, user_info in enumerate(all_users_steps[:3]):
-        podium_data.append({
-            'name': user_info['name'],
-            'steps': int(user_info['steps'])
-        })
-
-    # Calculate stats - get the final cumulative value for each friend
-    friends_totals = []
-    for friend_data in friends_data:
-        if friend_data['data'] and friend_data['data'][-1]['steps']:
-            friends_totals.append(friend_data['data'][-1]['steps'])
-    friends_average = sum(friends_totals) / len(friends_totals) if friends_totals else 0
-
-    # Find user's rank
-    user_rank = None
-    for i, user_info in enumerate(all_users_steps):
-        if user_info['user_id'] == request.user.id:
-            user_rank = i + 1
-            break
-
-    stats = {
-        'user_total': int(user_total_steps),
-        'friends_average': int(friends_average) if friends_average else 0,
-        'user_rank': user_rank,
-        'sentence': relate_steps(int(user_total_steps)) if user_total_steps > 0 else "No steps taken yet!"
-    }
-
-    return JsonResponse({
-        'user_data': user_data,
-        'friends_data': friends_data,
-        'podium_data': podium_data,
-        'stats': stats,
-        'date_range': {
-            'start': start_date.isoformat(),
-            'end': end_date.isoformat()
-        }
-    }, status=200)
-
-
-def calculate_sweat_score(activity, weights_dict):
-    """
-    Calculate sweat score for a single activity based on HR zones and weights.
-    Returns the calculated score or fallback value.
-    """
-    # Try to get HR zone data from raw_data
-    if activity.raw_data and 'hrTimeInZone' in activity.raw_data:
-        hr_zones = activity.raw_data['hrTimeInZone']
-
-        # Extract time in each zone (convert from seconds to minutes)
-        t1 = hr_zones.get('hrTimeInZone_1', 0) / 60  # Zone 1
-        t2 = hr_zones.get('hrTimeInZone_2', 0) / 60  # Zone 2
-        t3 = hr_zones.get('hrTimeInZone_3', 0) / 60  # Zone 3
-        t4 = hr_zones.get('hrTimeInZone_4', 0) / 60  # Zone 4
-        t5 = hr_zones.get('hrTimeInZone_5', 0) / 60  # Zone 5
-
-        # Calculate T0 (time below zone 1)
-        total_duration = (activity.duration_seconds or 0) / 60  # Convert to minutes
-        t0 = max(0, total_duration - (t1 + t2 + t3 + t4 + t5))
-
-        # Calculate score using weights
-        score = (
-            (t0 * float(weights_dict.get(0, 1))) +
-            (t1 * float(weights_dict.get(1, 2))) +
-            (t2 * float(weights_dict.get(2, 3))) +
-            (t3 * float(weights_dict.get(3, 5))) +
-            (t4 * float(weights_dict.get(4, 8))) +
-            (t5 * float(weights_dict.get(5, 12)))
-        )
-
-        return score
-    else:
-        # Fallback: use calories / 2
-        if activity.calories:
-            return activity.calories / 2
-        return 0
+    # Optional payload shape: format=columnar, quantize=1
+    options = parse_chart_options(request.GET)
+    content = get_chart_json(request.user, metric, range_param, timezone.localdate(), options)
+    response = chart_response(content)
+    # Per-user data: keep it out of shared caches and have clients revalidate with If-None-Match
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def parse_dashboard_metrics(request):
+    """Return the metrics requested as ?metrics=steps,calories (all chart metrics when omitted), in request order."""
+    requested = request.GET.get('metrics')
+    if not requested:
+        return list(CHART_METRICS)
+    return list(dict.fromkeys(metric.strip() for metric in requested.split(',') if metric.strip()))
+
+
+def dashboard_data_etag(request):
+    """ETag for get_dashboard_data, built from the same validators as single charts."""
+    metrics = parse_dashboard_metrics(request)
+    if not request.user.is_authenticated or not all(metric in CHART_METRICS for metric in metrics):
+        return None
+    range_param = request.GET.get('range', 'current_month')
+    options = parse_chart_options(request.GET)
+    return get_chart_etag(request.user, ['dashboard', *metrics], range_param, timezone.localdate(), options)
 
 
-def get_sweat_score_chart_data(request):
-    """API endpoint for sweat score chart data with friends' data and podium rankings"""
+@condition(etag_func=dashboard_data_etag)
+def get_dashboard_data(request):
+    """API endpoint for the chart data of several metrics in one response, keyed by metric"""
     if not request.user.is_authenticated:
         return JsonResponse({"error": "Authentication required", "status_code": 401}, status=401)
+    metrics = parse_dashboard_metrics(request)
+    unknown = [metric for metric in metrics if metric not in CHART_METRICS]
+    if unknown:
+        return JsonResponse({"error": f"Unknown chart metrics: {', '.join(unknown)}", "status_code": 400}, status=400)
 
-    # Get the requested range (default to current_month)
+    # Same range and payload options as get_chart_data, applied to every metric
     range_param = request.GET.get('range', 'current_month')
+    options = parse_chart_options(request.GET)
+    content = get_dashboard_json(request.user, metrics, range_param, timezone.localdate(), options)
+    response = chart_response(content)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-    # Calculate date range based on the requested period
-    today = timezone.localtime().date()
-    if range_param == 'current_month':
-        start_date = today.replace(day=1)
-        end_date = today
-    elif range_param == 'last_month':
-        # Get last month
-        first_of_this_month = today.replace(day=1)
-        last_of_last_month = first_of_this_month - timedelta(days=1)
-        start_date = last_of_last_month.replace(day=1)
-        end_date = last_of_last_month
-    elif range_param == 'last_3_months':
-        # Last 3 months including current
-        start_date = (today.replace(day=1) - timedelta(days=60)).replace(day=1)
-        end_date = today
-    elif range_param == 'last_year':
-        # Last year
-        start_date = today.replace(year=today.year - 1, month=1, day=1)
-        end_date = today
-    elif range_param == 'alltime':
-        # All time
-        start_date = date(2000, 1, 1)
-        end_date = today
-    else:  # Default to current month
-        start_date = today.replace(day=1)
-        end_date = today
-
-    # Get sweat score weights
-    weights = SweatScoreWeights.objects.all()
-    weights_dict = {weight.zone: weight.weight for weight in weights}
-    weights_dict_dict = {int(k): Decimal(v) if Decimal(v).is_finite() else 0 for k, v in weights_dict.items()}  
-    logger.info(f"Sweat score weights: {weights_dict_dict}")
-
-
-    # Get user's activities data
-    from garminconnect.models import GarminActivity
-    user_activities = GarminActivity.objects.filter(
-        user=request.user,
-        start_time_utc__date__range=[start_date, end_date]
-    ).exclude(duration_seconds__isnull=True).exclude(duration_seconds=0)
-
-    # Aggregate user sweat scores by date
-    user_scores_by_date = {}
-    for activity in user_activities:
-        date_key = activity.start_time_utc.date().isoformat()
-        score = calculate_sweat_score(activity, weights_dict)
-        user_scores_by_date[date_key] = user_scores_by_date.get(date_key, 0) + score
-
-    # Make user data cumulative
-    cumulative_score = 0
-    user_data = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_key = current_date.isoformat()
-        daily_score = user_scores_by_date.get(date_key, 0)
-        cumulative_score += daily_score
-        user_data.append({'date': date_key, 'score': cumulative_score})
-        current_date += timedelta(days=1)
-
-    # Get friends' data
-    friendships_as_from = Friendship.objects.filter(
-        from_user=request.user,
-        status='accepted'
-    ).values_list('to_user', flat=True)
-
-    friendships_as_to = Friendship.objects.filter(
-        to_user=request.user,
-        status='accepted'
-    ).values_list('from_user', flat=True)
-
-    friend_user_ids = list(friendships_as_from) + list(friendships_as_to)
-
-    friends_data = []
-    all_users_scores = []  # For podium rankings
-
-    # Add user's total for ranking
-    user_total_score = sum(calculate_sweat_score(activity, weights_dict) for activity in user_activities)
-    if user_total_score > 0:
-        all_users_scores.append({
-            'user_id': request.user.id,
-            'name': request.user.username,
-            'score': user_total_score
-        })
-
-    # Get friends' data
-    for friend_id in friend_user_ids:
-        try:
-            friend = User.objects.get(id=friend_id)
-            friend_activities = GarminActivity.objects.filter(
-                user=friend,
-                start_time_utc__date__range=[start_date, end_date]
-            ).exclude(duration_seconds__isnull=True).exclude(duration_seconds=0)
-
-            friend_scores_by_date = {}
-            for activity in friend_activities:
-                date_key = activity.start_time_utc.date().isoformat()
-                score = calculate_sweat_score(activity, weights_dict)
-                friend_scores_by_date[date_key] = friend_scores_by_date.get(date_key, 0) + score
-
-            # Always include friends, even if they have no data (they'll show as flat line at 0)
-            # Make friend data cumulative with all days in range
-            cumulative_score = 0
-            friend_data = []
-            current_date = start_date
-            while current_date <= end_date:
-                date_key = current_date.isoformat()
-                daily_score = friend_scores_by_date.get(date_key, 0)
-                cumulative_score += daily_score
-                friend_data.append({'date': date_key, 'score': cumulative_score})
-                current_date += timedelta(days=1)
-
-            friends_data.append({
-                'name': friend.username,
-                'data': friend_data
-            })
-
-            # Add to ranking (only if they have activities)
-            friend_total = sum(calculate_sweat_score(activity, weights_dict) for activity in friend_activities)
-            if friend_total > 0:
-                all_users_scores.append({
-                    'user_id': friend.id,
-                    'name': friend.username,
-                    'score': friend_total
-                })
-
-        except User.DoesNotExist:
-            continue
-
-    # Calculate podium rankings
-    all_users_scores.sort(key=lambda x: x['score'], reverse=True)
-    podium_data = []
-    for i, user_info in enumerate(all_users_scores[:3]):
-        podium_data.append({
-            'name': user_info['name'],
-            'score': int(user_info['score'])
-        })
-
-    # Calculate stats - get the final cumulative value for each friend
-    friends_totals = []
-    for friend_data in friends_data:
-        if friend_data['data'] and friend_data['data'][-1]['score']:
-            friends_totals.append(friend_data['data'][-1]['score'])
-    friends_average = sum(friends_totals) / len(friends_totals) if friends_totals else 0
-
-    # Find user's rank
-    user_rank = None
-    for i, user_info in enumerate(all_users_scores):
-        if user_info['user_id'] == request.user.id:
-            user_rank = i + 1
-            break
-
-    stats = {
-        'user_total': int(user_total_score),
-        'friends_average': int(friends_average) if friends_average else 0,
-        'user_rank': user_rank
-    }
-
-    return JsonResponse({
-        'user_data': user_data,
-        'friends_data': friends_data,
-        'podium_data': podium_data,
-        'stats': stats,
-        'date_range': {
-            'start': start_date.isoformat(),
-            'end': end_date.isoformat()
-        }
-    }, status=200)
-
-
-    """
-    try:
-        garmin_auth = Garmin_Auth.objects.get(user=user)
-    except Garmin_Auth.DoesNotExist:
-        return {'success': False, 'error': 'No Garmin auth record found'}
-
-    steps_synced = 0
-
-    try:
-        # Configure client with tokens
-        oauth1_data = {
-            'oauth_token': garmin_auth.oauth_token,
-            'oauth_token_secret': garmin_auth.oauth_token_secret,
-            'mfa_token': getattr(garmin_auth, 'mfa_token', None),
-            'mfa_expiration_timestamp': getattr(garmin_auth, 'mfa_expiration_timestamp', None),
-            'domain': getattr(garmin_auth, 'domain', None),
-        }
-        oauth2_data = {
-            'scope': garmin_auth.scope,
-            'jti': garmin_auth.jti,
-            'token_type': garmin_auth.token_type,
-            'access_token': garmin_auth.access_token,
-            'refresh_token': garmin_auth.refresh_token,
-            'expires_in': garmin_auth.expires_in,
-            'expires_at': garmin_auth.expires_at,
-            'refresh_token_expires_in': getattr(garmin_auth, 'refresh_token_expires_in', None),
-            'refresh_token_expires_at': getattr(garmin_auth, 'refresh_token_expires_at', None),
-        }
-        oauth1_token = garth.auth_tokens.OAuth1Token(**oauth1_data)
-        oauth2_token = garth.auth_tokens.OAuth2Token(**oauth2_data)
-        garth.client.configure(oauth1_token=oauth1_token, oauth2_token=oauth2_token)
-
-        # Sync steps for each day in range
-        current_date = start_date
-        while current_date <= end_date:
-            try:
-                if current_date > timezone.now().date():
-                    current_date += timedelta(days=1)
-                    continue
-
-                # Fetch daily steps
-                url = f"/usersummary-service/stats/steps/daily/{current_date.isoformat()}/{current_date.isoformat()}"
-                try:
-                    daily_steps_data = garth.client.connectapi(url)
-                except Exception as api_err:
-                    logger.warning(f"Steps API failed for {current_date}: {api_err}")
-                    # Try alternative endpoint
-                    alt_url = f"/usersummary-service/usersummary/daily/{current_date.isoformat()}"
-                    daily_steps_data = garth.client.connectapi(alt_url)
-
-                if daily_steps_data and len(daily_steps_data) > 0:
-                    steps = daily_steps_data[0].get('totalSteps', 0)
-                    if steps is not None:
-                        obj, created = GarminDailySteps.objects.update_or_create(
-                            user=user,
-                            date=current_date,
-                            defaults={'steps': steps}
-                        )
-                        if created: steps_synced += 1
-
-                        # Also update DailySteps for general persistence
-                        distance_miles = (steps * 2.2) / 5280.0  # 2.2 ft per step, 5280 ft per mile
-                        daily_obj, daily_created = DailySteps.objects.update_or_create(
-                            user=user,
-                            calendar_date=current_date,
-                            defaults={
-                                'total_steps': steps,
-                                'total_distance': distance_miles
-                            }
-                        )
-                        if daily_created: steps_synced += 1  # Count for overall sync
-
-            except Exception as step_err:
-                logger.error(f"Error syncing steps for {current_date} for user {user.id}: {step_err}")
-                # Removed invalid measure call
-            current_date += timedelta(days=1)  # Update last_sync
-        garmin_auth.last_sync = timezone.now()
-        garmin_auth.save(update_fields=['last_sync'])
-
-        return {'success': True, 'steps_synced': steps_synced}
-
-    except Exception as e:
-        logger.error(f"Unexpected error during steps sync for user {user.id}: {e}")
-        return {'success': False, 'error': str(e)}
-
-    """
-    try:
-        garmin_auth = Garmin_Auth.objects.get(user=user)
-    except Garmin_Auth.DoesNotExist:
-        return {'success': False, 'error': 'No Garmin auth record found'}
-
-    activities_synced = 0
-
-    try:
-        # Configure client with tokens (same as steps)
-        oauth1_data = {
-            'oauth_token': garmin_auth.oauth_token,
-            'oauth_token_secret': garmin_auth.oauth_token_secret,
-            'mfa_token': getattr(garmin_auth, 'mfa_token', None),
-            'mfa_expiration_timestamp': getattr(garmin_auth, 'mfa_expiration_timestamp', None),
-            'domain': getattr(garmin_auth, 'domain', None),
-        }
-        oauth2_data = {
-            'scope': garmin_auth.scope,
-            'jti': garmin_auth.jti,
-            'token_type': garmin_auth.token_type,
-            'access_token': garmin_auth.access_token,
-            'refresh_token': garmin_auth.refresh_token,
-            'expires_in': garmin_auth.expires_in,
-            'expires_at': garmin_auth.expires_at,
-            'refresh_token_expires_in': getattr(garmin_auth, 'refresh_token_expires_in', None),
-            'refresh_token_expires_at': getattr(garmin_auth, 'refresh_token_expires_at', None),
-        }
-        oauth1_token = garth.auth_tokens.OAuth1Token(**oauth1_data)
-        oauth2_token = garth.auth_tokens.OAuth2Token(**oauth2_data)
-        garth.client.configure(oauth1_token=oauth1_token, oauth2_token=oauth2_token)
-
-        # Build URL with date filter if provided
-        url = f"/activitylist-service/activities/search/activities?start=0&limit={limit}"
-        if start_date and end_date:
-            from_str = f"{start_date.isoformat()}T00:00:00"
-            to_str = f"{end_date.isoformat()}T23:59:59"
-            url += f"&startDateLocalFrom={from_str}&startDateLocalTo={to_str}"
-        # Fetch activities
-        activities = garth.client.connectapi(url)
-
-        if not activities:
-            logger.info(f"No activities found for user {user.id}")
-            return {'success': True, 'activities_synced': 0}
-
-        # Process each activity
-        for activity in activities:
-            try:
-                activity_id = activity.get('activityId')
-                if not activity_id:
-                    logger.warning(f"Skipping activity with missing ID for user {user.id}: {activity}")
-                    continue
-
-                start_ts_gmt = activity.get('startTimeGMT')
-                start_time_utc = None
-                if start_ts_gmt:
-                    try:
-                        if isinstance(start_ts_gmt, str):
-                            if ' ' in start_ts_gmt and '-' in start_ts_gmt:
-                                # Parse datetime string
-                                start_time_utc = datetime.strptime(start_ts_gmt, '%Y-%m-%d %H:%M:%S')
-                                start_time_utc = start_time_utc.replace(tzinfo=dt_timezone.utc)
-                            else:
-                                # Unix timestamp string to float
-                                start_ts_gmt = float(start_ts_gmt)
-                                start_time_utc = datetime.fromtimestamp(start_ts_gmt / 1000, tz=dt_timezone.utc)
-                        elif isinstance(start_ts_gmt, (int, float)):
-                            # Unix timestamp in milliseconds
-                            start_time_utc = datetime.fromtimestamp(start_ts_gmt / 1000, tz=dt_timezone.utc)
-                        else:
-                            logger.warning(f"Unexpected start time type for activity {activity_id}: {type(start_ts_gmt)}")
-                            continue
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Invalid start time format for activity {activity_id}: {start_ts_gmt} - {e}")
-                        continue
-                else:
-                    logger.warning(f"Missing start time for activity {activity_id} for user {user.id}")
-                    continue
-
-                defaults = {
-                    'name': activity.get('activityName', 'Unnamed Activity'),
-                    'activity_type': activity.get('activityType', {}).get('typeKey', 'unknown'),
-                    'start_time_utc': start_time_utc,
-                    'duration_seconds': activity.get('duration'),
-                    'distance_meters': activity.get('distance'),
-                    'calories': activity.get('calories'),
-                    'average_hr': activity.get('averageHR'),
-                    'max_hr': activity.get('maxHR'),
-                    'raw_data': activity
-                }
-                # Filter None values
-                defaults = {k: v for k, v in defaults.items() if v is not None}
-
-                obj, created = GarminActivity.objects.update_or_create(
-                    user=user,
-                    activity_id=activity_id,
-                    defaults=defaults
-                )
-                if created: activities_synced += 1
-
-                # Integrate CardioCoin rewards
-                if obj.calories and obj.calories > 0:
-                    from .models import Transaction
-                    if not Transaction.objects.filter(
-                        user=user,
-                        currency_type='cardio_coins',
-                        garmin_activity=obj
-                    ).exists():
-                        join_month_start = user.date_joined.replace(day=1).date()
-                        one_week_after = (user.date_joined + timedelta(weeks=1)).date()
-                        activity_date = obj.start_time_utc.date()
-                        if join_month_start <= activity_date <= one_week_after:
-                            user.earn_cardio_coins(Decimal(str(obj.calories)), garmin_activity=obj)
-
-            except Exception as act_err:
-                logger.error(f"Error processing activity {activity.get('activityId', 'N/A')} for user {user.id}: {act_err}")
-
-        # Update last sync
-        garmin_auth.last_sync = timezone.now()
-        garmin_auth.save(update_fields=['last_sync'])
-
-        return {'success': True, 'activities_synced': activities_synced}
-
-    except Exception as e:
-        logger.error(f"Unexpected error during activities sync for user {user.id}: {e}")
-        return {'success': False, 'error': str(e)}
 
 class ConnectGarminView(View):
     template_name = 'settings.html'
@@ -1078,12 +289,8 @@ class ConnectGarminView(View):
                 existing_auth = Garmin_Auth.objects.filter(user=request.user)
                 if existing_auth.exists():
                     existing_auth.delete()
-                # Use Garth SSO login
-                garth.login(garmin_email, garmin_password)
-
-                # Get the OAuth tokens from Garth
-                oauth1_token = garth.client.oauth1_token
-                oauth2_token = garth.client.oauth2_token
+                # Use Garth SSO login on a client of this request's own
+                oauth1_token, oauth2_token = garth.Client().login(garmin_email, garmin_password)
 
                 if not oauth1_token or not oauth2_token:
                     raise ValueError("Failed to obtain OAuth tokens from Garth")
@@ -1150,9 +357,83 @@ class DisconnectGarminView(View):
         return redirect('fitness:settings')
 
 
-from django.db.models import F, Q
+from django.db.models import F, Q, Window
+from django.db.models.functions import Coalesce, Rank
 from social.models import Friendship as SocialFriendship, Group
 from django.shortcuts import get_object_or_404
+from bisect import bisect_left, bisect_right
+from asgiref.sync import sync_to_async
+
+
+LEADERBOARD_PAGE_SIZE = 10
+
+
+def parse_leaderboard_cursor(cursor):
+    """Parse a "<rank>:<value>:<user id>" leaderboard keyset cursor, or return None."""
+    try:
+        rank, value, user_id = cursor.split(':', 2)
+        return int(rank), Decimal(value), int(user_id)
+    except (AttributeError, ArithmeticError, ValueError):
+        return None
+
+
+def leaderboard_cursor(user):
+    return f'{user.rank}:{user.value}:{user.id}'
+
+
+def leaderboard_cursor_page(list_users, has_previous, has_next):
+    """Prev / next cursors and the shown rank range of a LeaderboardView page."""
+    return {
+        'previous': leaderboard_cursor(list_users[0]) if has_previous and list_users else None,
+        'next': leaderboard_cursor(list_users[-1]) if has_next and list_users else None,
+        'first_rank': list_users[0].rank if list_users else None,
+        'last_rank': list_users[-1].rank if list_users else None,
+    }
+
+
+def get_leaderboard_friend_ids(user):
+    """IDs of the user's accepted friends (social friendships), for the friends scope."""
+    friendships = SocialFriendship.objects.filter(
+        (Q(from_user=user) | Q(to_user=user)) &
+        Q(status='accepted')
+    ).values_list('from_user_id', 'to_user_id')
+    friend_ids = {user_id for pair in friendships for user_id in pair}
+    friend_ids.discard(user.id)
+    return list(friend_ids)
+
+
+def get_leaderboard_friends(user):
+    """
+    The users a friends-scope leaderboard ranks: the user's accepted friends, without the
+    user. LeaderboardView and the live stream both rank this set, so their ranks agree.
+    """
+    return UserProfile.objects.filter(id__in=get_leaderboard_friend_ids(user))
+
+
+# LeaderboardView metric names -> core.leaderboards.LEADERBOARD_METRICS
+LEADERBOARD_VIEW_METRICS = {
+    'steps': 'steps',
+    'calories': 'calories',
+    'sweatscore': 'sweat_score',
+    'cardiocoins': 'cardio_coins',
+    'gymgems': 'gym_gems',
+}
+
+
+def annotate_leaderboard_value(users, metric, cutoff):
+    """
+    Annotate `value` for a LeaderboardView metric: the rollup total since cutoff for
+    steps, calories and sweat score, the total earned for currencies (no date filter,
+    every user ranked, as on the Redis boards). Users without a value are left out.
+    """
+    field = LEADERBOARD_VIEW_METRICS[metric]
+    if metric in ('steps', 'calories', 'sweatscore'):
+        users = users.annotate(value=Sum(f'daily_metrics__{field}', filter=Q(daily_metrics__date__gte=cutoff)))
+    else:
+        users = users.annotate(value=Coalesce(
+            Sum('daily_earnings__amount', filter=Q(daily_earnings__currency_type=field)), Decimal(0)
+        ))
+    return users.filter(value__isnull=False)
 
 
 class LeaderboardView(LoginRequiredMixin, TemplateView):
@@ -1165,8 +446,7 @@ class LeaderboardView(LoginRequiredMixin, TemplateView):
         group_id = self.request.GET.get('group_id')
 
         # Validate metric
-        valid_metrics = ['steps', 'calories', 'cardiocoins', 'gymgems']
-        if metric not in valid_metrics:
+        if metric not in LEADERBOARD_VIEW_METRICS:
             # Redirect to default or raise 404
             from django.shortcuts import redirect
             return redirect('fitness:leaderboards', metric='cardiocoins', period='all')
@@ -1176,9 +456,9 @@ class LeaderboardView(LoginRequiredMixin, TemplateView):
         if period == 'all':
             cutoff = date(2000, 1, 1)
         elif period == 'week':
-            cutoff = now - timedelta(days=7)
+            cutoff = (now - timedelta(days=7)).date()
         elif period == 'month':
-            cutoff = now - timedelta(days=30)
+            cutoff = (now - timedelta(days=30)).date()
         else:
             # Invalid period, default to all
             cutoff = date(2000, 1, 1)
@@ -1189,20 +469,7 @@ class LeaderboardView(LoginRequiredMixin, TemplateView):
 
         # Filter by scope
         if scope == 'friends':
-            friendships = SocialFriendship.objects.filter(
-                (Q(from_user=self.request.user) | Q(to_user=self.request.user)) &
-                Q(status='accepted')
-            ).values_list('from_user_id', flat=True).distinct()
-            friend_ids = list(friendships) + list(
-                SocialFriendship.objects.filter(
-                    (Q(from_user=self.request.user) | Q(to_user=self.request.user)) &
-                    Q(status='accepted')
-                ).values_list('to_user_id', flat=True).distinct()
-            )
-            friend_ids = list(set(friend_ids))  # Remove duplicates
-            if self.request.user.id in friend_ids:
-                friend_ids.remove(self.request.user.id)
-            users = users.filter(id__in=friend_ids)
+            users = get_leaderboard_friends(self.request.user)
         elif scope == 'group' and group_id:
             group = get_object_or_404(Group, id=group_id)
             # Check if user is in group
@@ -1212,51 +479,507 @@ class LeaderboardView(LoginRequiredMixin, TemplateView):
                 return redirect('fitness:leaderboards', metric=metric, period=period)
             users = group.members.all()
 
-        # Annotate value based on metric
-        if metric == 'steps':
-            value_expr = Sum('garmin_daily_steps__steps', filter=Q(garmin_daily_steps__date__gte=cutoff))
-            users = users.annotate(value=value_expr)
-        elif metric == 'calories':
-            value_expr = Sum('garmin_activities__calories', filter=Q(garmin_activities__start_time_utc__gte=cutoff))
-            users = users.annotate(value=value_expr)
-        elif metric == 'cardiocoins':
-            users = users.annotate(value=F('cardio_coins'))
-        elif metric == 'gymgems':
-            users = users.annotate(value=F('gym_gems'))
-
-        # For balances, no date filter needed
-        # Filter out users with null value
-        users = users.filter(value__isnull=False).order_by('-value', 'username')
-
-        # Assign ranks
-        ranked_users = []
-        for i, user in enumerate(users, 1):
-            user_obj = user
-            user_obj.rank = i
-            user_obj.metric_value = user.value
-            ranked_users.append(user_obj)
-
-        # Pagination for list starting from 4th
-        from django.core.paginator import Paginator
-        list_users = ranked_users[3:]
-        paginator = Paginator(list_users, 10)
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-
-        top3 = ranked_users[:3]
+        # Pagination links keep the scope, group and closed period
+        params = self.request.GET.copy()
+        for key in ('page', 'after', 'before'):
+            params.pop(key, None)
 
         context = super().get_context_data(**kwargs)
         context.update({
-            'top3': top3,
-            'page_obj': page_obj,
             'metric': metric,
             'period': period,
             'scope': scope,
             'group_id': group_id,
+            'page_query': params.urlencode() + '&' if params else '',
         })
 
+        # Closed weeks and months are served from their frozen snapshots
+        if period != 'all':
+            context['snapshot_periods'] = snapshot_periods(LEADERBOARD_VIEW_METRICS[metric], period)
+            snapshot_start = closed_period_start(self.request.GET.get('start'), period, timezone.localdate())
+            if snapshot_start:
+                context['snapshot_start'] = snapshot_start
+                context.update(self.get_snapshot_leaderboard(
+                    LEADERBOARD_VIEW_METRICS[metric], period, snapshot_start,
+                    group_id if scope == 'group' else None,
+                    users.values_list('id', flat=True) if scope == 'friends' else None
+                ))
+                return context
+
+        # Currency totals have no date filter, so every period reads the all-time board. Groups
+        # have their own boards; friends are looked up on the global one.
+        board_period = period if metric in ('steps', 'calories', 'sweatscore') else 'all'
+        board = get_leaderboard(
+            LEADERBOARD_VIEW_METRICS[metric],
+            board_period,
+            timezone.localdate(),
+            group_id=group.id if scope == 'group' and group_id else None
+        )
+        if board is not None:
+            context.update(self.get_redis_leaderboard(board, users, scope == 'friends'))
+            context['stream_url'] = leaderboard_stream_url(
+                LEADERBOARD_VIEW_METRICS[metric], board_period, scope, group_id,
+                [user.rank for user in list(context['top3']) + list(context['list_users'])]
+            )
+            return context
+
+        users = annotate_leaderboard_value(users, metric, cutoff)
+        context.update(self.get_sql_leaderboard(users))
         return context
 
+    def get_sql_leaderboard(self, users):
+        """
+        Rank with RANK() OVER (ORDER BY value DESC, id) in the database (ties by user ID,
+        as on the Redis boards) and page the list with a keyset on (value, id), so a
+        request fetches only the podium, one page and the user's own row however many
+        users are ranked.
+
+        Cursors are "<rank>:<value>:<user id>" of the row next to the page. The window
+        runs over the rows past the cursor, so its rank is offset by the cursor's rank.
+        """
+        ordering = [F('value').desc(), F('id').asc()]
+        top3 = list(users.annotate(
+            window_rank=Window(Rank(), order_by=ordering)
+        ).order_by(*ordering)[:3])
+        for user in top3:
+            user.rank = user.window_rank
+            user.metric_value = user.value
+
+        before = parse_leaderboard_cursor(self.request.GET.get('before'))
+        after = parse_leaderboard_cursor(self.request.GET.get('after'))
+        if before:
+            # Walk back from the cursor: rows ranked above it, nearest first
+            rank, value, user_id = before
+            reverse = [F('value').asc(), F('id').desc()]
+            rows = list(users.filter(
+                Q(value__gt=value) | Q(value=value, id__lt=user_id)
+            ).annotate(
+                window_rank=Window(Rank(), order_by=reverse)
+            ).order_by(*reverse)[:LEADERBOARD_PAGE_SIZE + 1])
+            for user in rows:
+                user.rank = rank - user.window_rank
+            # The list starts after the podium
+            rows = [user for user in rows if user.rank > 3]
+            has_previous = len(rows) > LEADERBOARD_PAGE_SIZE
+            list_users = rows[:LEADERBOARD_PAGE_SIZE][::-1]
+            has_next = True
+        else:
+            # Without a cursor the list continues after the podium
+            if after is None and len(top3) == 3:
+                after = (3, top3[-1].value, top3[-1].id)
+            rank, rows = 0, users.none()
+            if after:
+                rank, value, user_id = after
+                rows = users.filter(Q(value__lt=value) | Q(value=value, id__gt=user_id))
+            rows = list(rows.annotate(
+                window_rank=Window(Rank(), order_by=ordering)
+            ).order_by(*ordering)[:LEADERBOARD_PAGE_SIZE + 1])
+            for user in rows:
+                user.rank = rank + user.window_rank
+            has_next = len(rows) > LEADERBOARD_PAGE_SIZE
+            list_users = rows[:LEADERBOARD_PAGE_SIZE]
+            has_previous = bool(list_users) and list_users[0].rank > 4
+        for user in list_users:
+            user.metric_value = user.value
+
+        return {
+            'top3': top3,
+            'list_users': list_users,
+            'cursor_page': leaderboard_cursor_page(list_users, has_previous, has_next),
+            'my_rank': self.get_sql_user_rank(users),
+        }
+
+    def get_sql_user_rank(self, users):
+        """The requesting user's row with its rank: one plus the rows ordered ahead of it."""
+        me = users.filter(id=self.request.user.id).first()
+        if me is None:
+            return None
+        me.rank = users.filter(
+            Q(value__gt=me.value) | Q(value=me.value, id__lt=me.id)
+        ).count() + 1
+        me.metric_value = me.value
+        return me
+
+    def get_snapshot_leaderboard(self, metric, period, period_start, group_id, friend_ids):
+        """
+        Podium, page and own row of a closed period from its snapshot. Snapshot ranks are
+        stored, so pages are plain rank ranges behind the same cursors as the SQL path.
+        """
+        def standings(first_rank, last_rank):
+            return get_snapshot_standings(
+                metric, period, period_start, group_id=group_id, user_ids=friend_ids,
+                first_rank=first_rank, last_rank=last_rank
+            )
+
+        top3 = standings(1, 3)
+        before = parse_leaderboard_cursor(self.request.GET.get('before'))
+        after = parse_leaderboard_cursor(self.request.GET.get('after'))
+        if before:
+            first_rank = max(before[0] - LEADERBOARD_PAGE_SIZE, 4)
+            list_users = standings(first_rank, before[0] - 1)
+            has_next = True
+        else:
+            first_rank = after[0] + 1 if after else 4
+            list_users = standings(first_rank, first_rank + LEADERBOARD_PAGE_SIZE)
+            has_next = len(list_users) > LEADERBOARD_PAGE_SIZE
+            list_users = list_users[:LEADERBOARD_PAGE_SIZE]
+        has_previous = first_rank > 4
+
+        my_rank = None
+        if friend_ids is None:
+            my_rank = next(iter(LeaderboardSnapshot.objects.filter(
+                metric=metric, period=period, period_start=period_start,
+                group_id=group_id, user=self.request.user
+            ).values_list('rank', 'value')), None)
+            if my_rank:
+                me = self.request.user
+                me.rank, me.metric_value = my_rank
+                my_rank = me
+
+        return {
+            'top3': top3,
+            'list_users': list_users,
+            'cursor_page': leaderboard_cursor_page(list_users, has_previous, has_next),
+            'my_rank': my_rank,
+        }
+
+    def get_redis_leaderboard(self, board, users, scoped):
+        """
+        Top 3 and the requested page from a Redis leaderboard, behind the same keyset
+        cursors as the SQL path. Global and group boards are read a page at a time, from
+        the cursor's place on the set; the friends scope looks up the friends' scores and
+        pages the ranked list.
+        """
+        if not scoped:
+            top3 = hydrate_leaderboard(board.page(0, 3))
+
+            def position(cursor, inclusive):
+                _, value, user_id = cursor
+                return board.position(float(value), user_id, inclusive)
+
+            def entries(start, stop):
+                return hydrate_leaderboard(board.page(start, stop), first_rank=start + 1)
+        else:
+            ranked_users = rank_members(board, users)
+            top3 = ranked_users[:3]
+            keys = [(-user.metric_value, user.id) for user in ranked_users]
+
+            def position(cursor, inclusive):
+                _, value, user_id = cursor
+                return (bisect_right if inclusive else bisect_left)(keys, (-float(value), user_id))
+
+            def entries(start, stop):
+                return ranked_users[start:stop]
+
+        before = parse_leaderboard_cursor(self.request.GET.get('before'))
+        after = parse_leaderboard_cursor(self.request.GET.get('after'))
+        if before:
+            stop = position(before, inclusive=False)
+            start = max(stop - LEADERBOARD_PAGE_SIZE, 3)
+            list_users = entries(start, stop)
+            has_next = True
+        else:
+            # Without a cursor the list continues after the podium
+            start = max(position(after, inclusive=True), 3) if after else 3
+            list_users = entries(start, start + LEADERBOARD_PAGE_SIZE + 1)
+            has_next = len(list_users) > LEADERBOARD_PAGE_SIZE
+            list_users = list_users[:LEADERBOARD_PAGE_SIZE]
+        has_previous = start > 3
+        for user in list(top3) + list(list_users):
+            user.value = user.metric_value
+
+        me = self.request.user
+        if not scoped:
+            own = board.rank(me.id)
+            my_rank = None
+            if own:
+                me.rank, me.metric_value = own
+                my_rank = me
+        else:
+            my_rank = next((user for user in ranked_users if user.id == me.id), None)
+        return {
+            'top3': top3,
+            'list_users': list_users,
+            'cursor_page': leaderboard_cursor_page(list_users, has_previous, has_next),
+            'my_rank': my_rank,
+        }
+
+
+def get_rank_history_data(request):
+    """API endpoint for the requesting user's rank in each closed week or month, from the leaderboard snapshots"""
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required", "status_code": 401}, status=401)
+    metric = request.GET.get('metric', 'steps')
+    period = request.GET.get('period', 'week')
+    scope = request.GET.get('scope', 'global')
+    if metric not in LEADERBOARD_VIEW_METRICS or period not in ('week', 'month'):
+        return JsonResponse({"error": "Unknown metric or period", "status_code": 400}, status=400)
+
+    group_id = None
+    friend_ids = None
+    if scope == 'group':
+        if not request.GET.get('group_id', '').isdigit():
+            return JsonResponse({"error": "group_id is required for the group scope", "status_code": 400}, status=400)
+        group = get_object_or_404(Group, id=request.GET['group_id'])
+        if not group.members.filter(id=request.user.id).exists():
+            return JsonResponse({"error": "Not a member of this group", "status_code": 403}, status=403)
+        group_id = group.id
+    elif scope == 'friends':
+        friend_ids = get_leaderboard_friend_ids(request.user)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 12)), 1), 104)
+    except ValueError:
+        limit = 12
+    history = get_rank_history(
+        request.user, LEADERBOARD_VIEW_METRICS[metric], period,
+        group_id=group_id, friend_ids=friend_ids, limit=limit
+    )
+    return JsonResponse({
+        'metric': metric,
+        'period': period,
+        'scope': scope,
+        'history': history,
+    })
+
+
+AROUND_ME_DEFAULT_K = 5
+AROUND_ME_MAX_K = 50
+
+
+def get_leaderboard_around_me(request):
+    """
+    API endpoint for the requesting user's absolute rank and the k users ranked just
+    above and below them, for a metric, live period and scope. Read from the Redis
+    board (a rank lookup and one range read), with an SQL fallback.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required", "status_code": 401}, status=401)
+    metric = request.GET.get('metric', 'steps')
+    period = request.GET.get('period', 'all')
+    scope = request.GET.get('scope', 'global')
+    if metric not in LEADERBOARD_VIEW_METRICS or period not in ('all', *LEADERBOARD_PERIOD_DAYS):
+        return JsonResponse({"error": "Unknown metric or period", "status_code": 400}, status=400)
+    try:
+        k = min(max(int(request.GET.get('k', AROUND_ME_DEFAULT_K)), 1), AROUND_ME_MAX_K)
+    except ValueError:
+        k = AROUND_ME_DEFAULT_K
+
+    me = request.user
+    users = UserProfile.objects.all()
+    group_id = None
+    if scope == 'group':
+        if not request.GET.get('group_id', '').isdigit():
+            return JsonResponse({"error": "group_id is required for the group scope", "status_code": 400}, status=400)
+        group = get_object_or_404(Group, id=request.GET['group_id'])
+        if not group.members.filter(id=me.id).exists():
+            return JsonResponse({"error": "Not a member of this group", "status_code": 403}, status=403)
+        group_id = group.id
+        users = group.members.all()
+    elif scope == 'friends':
+        users = users.filter(id__in=get_leaderboard_friend_ids(me) + [me.id])
+    else:
+        scope = 'global'
+
+    # Balances have no date filter, so every period reads the all-time board
+    if metric not in ('steps', 'calories', 'sweatscore'):
+        period = 'all'
+    board = get_leaderboard(LEADERBOARD_VIEW_METRICS[metric], period, timezone.localdate(), group_id=group_id)
+    if board is not None and scope != 'friends':
+        position = board.around(me.id, k)
+        rank, window = None, []
+        if position:
+            rank, first_rank, rows = position
+            window = hydrate_leaderboard(rows, first_rank=first_rank)
+    elif board is not None:
+        # A friends scope is small enough to rank in full
+        ranked_users = rank_members(board, users)
+        index = next((i for i, user in enumerate(ranked_users) if user.id == me.id), None)
+        rank = index + 1 if index is not None else None
+        window = ranked_users[max(index - k, 0):index + k + 1] if index is not None else []
+    else:
+        rank, window = get_sql_around_me(users, metric, period, me, k)
+
+    return JsonResponse({
+        'metric': metric,
+        'period': period,
+        'scope': scope,
+        'rank': rank,
+        'entries': [
+            {
+                'rank': user.rank,
+                'username': user.username,
+                'value': float(user.metric_value),
+                'is_me': user.id == me.id,
+            }
+            for user in window
+        ],
+    })
+
+
+def get_sql_around_me(users, metric, period, me, k):
+    """
+    SQL fallback for get_leaderboard_around_me: the user's rank from a count of the rows
+    ordered ahead of them, and keyset reads of the k rows either side, using the same
+    (value desc, id) order as the SQL leaderboard.
+    """
+    cutoff = date(2000, 1, 1)
+    if period in LEADERBOARD_PERIOD_DAYS:
+        cutoff = (timezone.now() - timedelta(days=LEADERBOARD_PERIOD_DAYS[period])).date()
+    users = annotate_leaderboard_value(users, metric, cutoff)
+    mine = users.filter(id=me.id).first()
+    if mine is None:
+        return None, []
+
+    ahead = Q(value__gt=mine.value) | Q(value=mine.value, id__lt=mine.id)
+    behind = Q(value__lt=mine.value) | Q(value=mine.value, id__gt=mine.id)
+    rank = users.filter(ahead).count() + 1
+    above = list(users.filter(ahead).order_by(F('value').asc(), F('id').desc())[:k])[::-1]
+    below = list(users.filter(behind).order_by(F('value').desc(), F('id').asc())[:k])
+
+    window = above + [mine] + below
+    for position, user in enumerate(window, rank - len(above)):
+        user.rank = position
+        user.metric_value = user.value
+    return rank, window
+
+LEADERBOARD_STREAM_RETRY_MS = 3000
+LEADERBOARD_STREAM_MAX_SLOTS = 50
+
+
+def leaderboard_stream_url(metric, period, scope, group_id, ranks):
+    """
+    URL of the live stream for the ranks a page shows (a LEADERBOARD_METRICS metric),
+    with the ranks sent as "first-last" ranges. None when the page shows no one.
+    """
+    ranges = []
+    for rank in sorted(ranks):
+        if ranges and rank == ranges[-1][1] + 1:
+            ranges[-1][1] = rank
+        else:
+            ranges.append([rank, rank])
+    if not ranges:
+        return None
+    params = {'metric': metric, 'period': period, 'ranks': ','.join(f'{first}-{last}' for first, last in ranges)}
+    if scope in ('friends', 'group'):
+        params['scope'] = scope
+    if scope == 'group' and group_id:
+        params['group_id'] = group_id
+    return f"{reverse('fitness:leaderboard-stream')}?{urlencode(params)}"
+
+
+def parse_stream_ranks(value):
+    """Parse "1-3,14-23" into [(1, 3), (14, 23)], or None when malformed or too many ranks."""
+    try:
+        ranges = [tuple(int(rank) for rank in part.split('-', 1)) for part in value.split(',')]
+    except (AttributeError, ValueError):
+        return None
+    if any(len(bounds) != 2 or not 1 <= bounds[0] <= bounds[1] for bounds in ranges):
+        return None
+    if sum(last - first + 1 for first, last in ranges) > LEADERBOARD_STREAM_MAX_SLOTS:
+        return None
+    return ranges
+
+
+async def get_leaderboard_stream(request):
+    """
+    Server-Sent Events stream of live changes to the leaderboard slots a page shows.
+    Listens for the writers' pub/sub messages; on one for this metric and period it
+    re-reads the page's ranks from the Redis board and sends only the slots whose entry
+    changed, as [{'rank', 'user_id', 'username', 'value', 'avatar'}, ...] (user_id null
+    for a slot that emptied). The first message is the full state. An async view: the
+    stream waits on the event loop and only borrows a thread to read the board. Streams
+    close after LEADERBOARD_STREAM_TIMEOUT seconds and the browser reconnects.
+    """
+    me = await request.auser()
+    if not me.is_authenticated:
+        return JsonResponse({"error": "Authentication required", "status_code": 401}, status=401)
+    metric = request.GET.get('metric')
+    period = request.GET.get('period', 'all')
+    scope = request.GET.get('scope', 'global')
+    ranges = parse_stream_ranks(request.GET.get('ranks', '1-3'))
+    if metric not in LEADERBOARD_METRICS or period not in ('all', *LEADERBOARD_PERIOD_DAYS) or ranges is None:
+        return JsonResponse({"error": "Unknown metric, period or ranks", "status_code": 400}, status=400)
+
+    group_id = None
+    members = None
+    if scope == 'group':
+        if not request.GET.get('group_id', '').isdigit():
+            return JsonResponse({"error": "group_id is required for the group scope", "status_code": 400}, status=400)
+        group = await sync_to_async(get_object_or_404)(Group, id=request.GET['group_id'])
+        if not await group.members.filter(id=me.id).aexists():
+            return JsonResponse({"error": "Not a member of this group", "status_code": 403}, status=403)
+        group_id = group.id
+    elif scope == 'friends':
+        members = [user async for user in await sync_to_async(get_leaderboard_friends)(me)]
+
+    if await sync_to_async(get_leaderboard)(metric, period, timezone.localdate(), group_id=group_id) is None:
+        # Nothing to push without the Redis boards; 204 stops the browser reconnecting
+        return HttpResponse(status=204)
+
+    slot_ranks = [rank for first, last in ranges for rank in range(first, last + 1)]
+    profiles = {user.id: user for user in members or []}
+
+    def read_slots():
+        # A period board missing since the last read is rebuilt, so look it up each time
+        board = get_leaderboard(metric, period, timezone.localdate(), group_id=group_id)
+        if board is None:
+            return None
+        entries = {}
+        if members is not None:
+            for user in rank_members(board, members):
+                entries[user.rank] = (user.id, user.metric_value)
+        else:
+            for first, last in ranges:
+                for rank, entry in enumerate(board.page(first - 1, last), first):
+                    entries[rank] = entry
+        missing = {user_id for user_id, _ in entries.values()} - profiles.keys()
+        if missing:
+            profiles.update(UserProfile.objects.in_bulk(missing))
+
+        slots = {}
+        for rank in slot_ranks:
+            user_id, score = entries.get(rank, (None, None))
+            user = profiles.get(user_id)
+            slots[rank] = {
+                'rank': rank,
+                'user_id': user.id if user else None,
+                'username': user.username if user else None,
+                'value': score if user else None,
+                'avatar': user.avatar.url if user and user.avatar else None,
+            }
+        return slots
+
+    async def events():
+        yield f'retry: {LEADERBOARD_STREAM_RETRY_MS}\n\n'
+        sent = None
+        try:
+            async for update in listen_leaderboard_updates(settings.LEADERBOARD_STREAM_TIMEOUT):
+                if update is None and sent is not None:
+                    yield ': keep-alive\n\n'
+                    continue
+                # Skip other boards' updates before touching Redis or the database
+                if update is not None and (
+                    metric not in update['metrics']
+                    or period not in update['periods']
+                    or (members is not None and update['user_id'] not in profiles)
+                ):
+                    continue
+                slots = await sync_to_async(read_slots)()
+                if slots is None:
+                    continue
+                changed = [slot for rank, slot in slots.items() if sent is None or sent.get(rank) != slot]
+                sent = slots
+                if changed:
+                    yield f'data: {json.dumps(changed)}\n\n'
+        except redis.RedisError as e:
+            logger.warning(f"Leaderboard stream for {metric}/{period} stopped: {e}")
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 
 class BackgroundGarminSyncView(LoginRequiredMixin, View):
     def post(self, request):
@@ -1276,7 +999,7 @@ class BackgroundGarminSyncView(LoginRequiredMixin, View):
                 start_date = garmin_auth.last_sync.date() + timedelta(days=1) if garmin_auth.last_sync else timezone.now().date() - timedelta(days=30)
                 end_date = timezone.now().date()
                 garmin_sync_steps_task.delay(profile.id, start_date=start_date, end_date=end_date)
-                garmin_sync_activities_task.delay(profile.id, limit=500, start_date=start_date, end_date=end_date)
+                garmin_sync_activities_task.delay(profile.id, start_date=start_date, end_date=end_date)
                 # Update last_sync immediately after queuing
                 garmin_auth.last_sync = timezone.now()
                 garmin_auth.save(update_fields=['last_sync'])
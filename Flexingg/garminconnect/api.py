@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Longest range the daily steps stats endpoint serves in one request (garth's DailySteps page size)
+STEPS_RANGE_DAYS = 28
+STEPS_RANGE_URL = "/usersummary-service/stats/steps/daily/{start}/{end}"
+DAILY_SUMMARY_URL = "/usersummary-service/usersummary/daily/{day}"
+
+
+def steps_range_chunks(start_date, end_date):
+    """Split [start_date, end_date] into consecutive (start, end) ranges of at most STEPS_RANGE_DAYS days."""
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=STEPS_RANGE_DAYS - 1), end_date)
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end + timedelta(days=1)
+
+
+def parse_daily_steps(rows):
+    """Map the stats endpoint's [{'calendarDate', 'totalSteps', ...}] rows to {date: steps}, skipping days without a total."""
+    steps = {}
+    for row in rows if isinstance(rows, list) else []:
+        if not isinstance(row, dict) or row.get('totalSteps') is None:
+            continue
+        steps[date.fromisoformat(row['calendarDate'])] = row['totalSteps']
+    return steps
+
+
+def _fetch_day_fallback(client, day):
+    # The daily summary endpoint returns one summary dict (older responses a one-item list)
+    data = client.connectapi(DAILY_SUMMARY_URL.format(day=day.isoformat()))
+    if isinstance(data, list):
+        data = data[0] if data else None
+    if isinstance(data, dict) and data.get('totalSteps') is not None:
+        return data['totalSteps']
+    return None
+
+
+def fetch_daily_steps(client, start_date, end_date):
+    """
+    Fetch daily step totals for a date range with a user's garth client, in
+    STEPS_RANGE_DAYS-day requests, and return {date: steps}. Days after today are not
+    requested. When a range request fails, its days are fetched one by one from the
+    daily summary endpoint instead.
+    """
+    end_date = min(end_date, timezone.now().date())
+    steps = {}
+    for chunk_start, chunk_end in steps_range_chunks(start_date, end_date):
+        url = STEPS_RANGE_URL.format(start=chunk_start.isoformat(), end=chunk_end.isoformat())
+        try:
+            steps.update(parse_daily_steps(client.connectapi(url)))
+            continue
+        except Exception as api_err:
+            logger.warning(f"Steps API failed for {chunk_start} to {chunk_end}: {api_err}")
+
+        day = chunk_start
+        while day <= chunk_end:
+            try:
+                day_steps = _fetch_day_fallback(client, day)
+                if day_steps is not None:
+                    steps[day] = day_steps
+            except Exception as day_err:
+                logger.error(f"Error fetching steps for {day}: {day_err}")
+            day += timedelta(days=1)
+    return steps
+
+
+ACTIVITY_LIST_URL = "/activitylist-service/activities/search/activities"
+# Activities requested per activity-list page
+ACTIVITY_PAGE_SIZE = 100
+
+
+def activity_page_url(start, page_size, start_date=None, end_date=None):
+    """Activity-list URL for one page, optionally limited to activities starting between two local days."""
+    url = f"{ACTIVITY_LIST_URL}?start={start}&limit={page_size}"
+    if start_date and end_date:
+        url += f"&startDateLocalFrom={start_date.isoformat()}T00:00:00&startDateLocalTo={end_date.isoformat()}T23:59:59"
+    return url
+
+
+HR_ZONES_URL = "/activity-service/activity/{activity_id}/hrTimeInZones"
+
+
+def parse_hr_zones(rows):
+    """Map the HR zones endpoint's [{'zoneNumber', 'secsInZone'}, ...] to the {'hrTimeInZone_N': seconds} the sweat score reads."""
+    zones = {}
+    for row in rows if isinstance(rows, list) else []:
+        if isinstance(row, dict) and row.get('zoneNumber') is not None:
+            zones[f"hrTimeInZone_{row['zoneNumber']}"] = row.get('secsInZone') or 0
+    return zones
+
+
+def add_hr_zones(client, activities):
+    """
+    Fetch the HR time-in-zone details of activity-list entries with a user's garth
+    client, one request each, and add them as 'hrTimeInZone' for the sweat score.
+    """
+    for activity in activities:
+        if 'hrTimeInZone' in activity:
+            continue
+        try:
+            zones = parse_hr_zones(client.connectapi(HR_ZONES_URL.format(activity_id=activity['activityId'])))
+        except Exception as e:
+            logger.warning(f"HR zones failed for activity {activity['activityId']}: {e}")
+            continue
+        if zones:
+            activity['hrTimeInZone'] = zones
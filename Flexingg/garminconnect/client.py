@@ -0,0 +1,56 @@
+import garth
+from garth.auth_tokens import OAuth1Token, OAuth2Token
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Keep-alive connections each user's client pools (a sync runs its requests one at a time)
+GARMIN_CLIENT_POOL_SIZE = 2
+
+OAUTH2_FIELDS = [
+    'scope', 'jti', 'token_type', 'access_token', 'refresh_token',
+    'expires_in', 'expires_at', 'refresh_token_expires_in', 'refresh_token_expires_at',
+]
+
+
+def garmin_tokens(garmin_auth):
+    """The stored OAuth1 and OAuth2 tokens of a Garmin_Auth as garth token objects."""
+    oauth1_token = OAuth1Token(
+        oauth_token=garmin_auth.oauth_token,
+        oauth_token_secret=garmin_auth.oauth_token_secret,
+        mfa_token=getattr(garmin_auth, 'mfa_token', None),
+        mfa_expiration_timestamp=getattr(garmin_auth, 'mfa_expiration_timestamp', None),
+        domain=getattr(garmin_auth, 'domain', None),
+    )
+    oauth2_token = OAuth2Token(**{field: getattr(garmin_auth, field, None) for field in OAUTH2_FIELDS})
+    return oauth1_token, oauth2_token
+
+
+def garmin_client(garmin_auth):
+    """
+    A garth.Client of its own for one user's Garmin_Auth, with its own keep-alive
+    session. Unlike the module-global garth.client, concurrent syncs in one process
+    (worker threads) cannot overwrite each other's tokens.
+    """
+    oauth1_token, oauth2_token = garmin_tokens(garmin_auth)
+    return garth.Client(
+        oauth1_token=oauth1_token,
+        oauth2_token=oauth2_token,
+        pool_connections=1,
+        pool_maxsize=GARMIN_CLIENT_POOL_SIZE,
+    )
+
+
+def save_client_tokens(garmin_auth, client):
+    """
+    Store the OAuth2 token of a client that exchanged it for a new one (garth does this
+    when it expires mid-sync). Returns True when the stored token changed.
+    """
+    token = client.oauth2_token
+    if not isinstance(token, OAuth2Token) or token.access_token == garmin_auth.access_token:
+        return False
+    for field in OAUTH2_FIELDS:
+        setattr(garmin_auth, field, getattr(token, field))
+    garmin_auth.save(update_fields=OAUTH2_FIELDS)
+    logger.info(f"Stored refreshed Garmin tokens for user {garmin_auth.user_id}")
+    return True
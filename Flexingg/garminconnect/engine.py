@@ -0,0 +1,232 @@
+"""
+Async Garmin fetch engine: syncs many users at once from one process. HTTP requests for
+every user share one httpx connection pool and one semaphore bounding the requests in
+flight; database work runs on Django's single sync thread, off the event loop.
+"""
+import asyncio
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from garth.http import USER_AGENT
+import httpx
+import logging
+from .api import (
+    ACTIVITY_PAGE_SIZE, DAILY_SUMMARY_URL, HR_ZONES_URL, STEPS_RANGE_URL,
+    activity_page_url, parse_daily_steps, parse_hr_zones, steps_range_chunks,
+)
+from .client import garmin_tokens
+from .ingest import ingest_activities, ingest_daily_steps, save_backfill_offset, stored_activity_ids
+from .models import Garmin_Auth
+from .rollups import refresh_daily_metrics
+from .scoring import load_sweat_score_weights
+from .views import ensure_valid_tokens
+
+logger = logging.getLogger(__name__)
+
+# Days synced for a user who has never synced
+FIRST_SYNC_DAYS = 30
+# Retries for rate-limited (429) and failed (5xx, network) requests, with exponential backoff
+REQUEST_RETRIES = 3
+REQUEST_BACKOFF = 0.5
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class GarminSyncError(Exception):
+    pass
+
+
+class UserSession:
+    """One user's view of the shared HTTP pool: their token and domain, behind the global semaphore."""
+
+    def __init__(self, http, semaphore, garmin_auth):
+        _, oauth2_token = garmin_tokens(garmin_auth)
+        self.http = http
+        self.semaphore = semaphore
+        self.base_url = f"https://connectapi.{garmin_auth.domain or 'garmin.com'}"
+        self.headers = {**USER_AGENT, 'Authorization': str(oauth2_token)}
+
+    async def get(self, path):
+        for attempt in range(REQUEST_RETRIES + 1):
+            try:
+                async with self.semaphore:
+                    response = await self.http.get(self.base_url + path, headers=self.headers)
+            except httpx.TransportError as e:
+                if attempt == REQUEST_RETRIES:
+                    raise GarminSyncError(f"{path}: {e}") from e
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == REQUEST_RETRIES:
+                    break
+            await asyncio.sleep(REQUEST_BACKOFF * 2 ** attempt)
+        if response.status_code == 204:
+            return None
+        if response.is_error:
+            raise GarminSyncError(f"{path}: HTTP {response.status_code}")
+        return response.json()
+
+
+async def fetch_daily_steps(session, start_date, end_date):
+    """Async fetch_daily_steps: all of the range's chunks are requested at once."""
+    end_date = min(end_date, timezone.now().date())
+    chunks = list(steps_range_chunks(start_date, end_date))
+    results = await asyncio.gather(*[
+        session.get(STEPS_RANGE_URL.format(start=chunk_start.isoformat(), end=chunk_end.isoformat()))
+        for chunk_start, chunk_end in chunks
+    ], return_exceptions=True)
+
+    steps = {}
+    fallback_days = []
+    for (chunk_start, chunk_end), result in zip(chunks, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Steps API failed for {chunk_start} to {chunk_end}: {result}")
+            fallback_days += [chunk_start + timedelta(days=offset) for offset in range((chunk_end - chunk_start).days + 1)]
+        else:
+            steps.update(parse_daily_steps(result))
+
+    summaries = await asyncio.gather(*[
+        session.get(DAILY_SUMMARY_URL.format(day=day.isoformat())) for day in fallback_days
+    ], return_exceptions=True)
+    for day, summary in zip(fallback_days, summaries):
+        if isinstance(summary, list):
+            summary = summary[0] if summary else None
+        if isinstance(summary, dict) and summary.get('totalSteps') is not None:
+            steps[day] = summary['totalSteps']
+        elif isinstance(summary, Exception):
+            logger.error(f"Error fetching steps for {day}: {summary}")
+    return steps
+
+
+async def add_hr_zones(session, activities):
+    """Async add_hr_zones: the HR zones of all the activities are requested at once."""
+    missing = [activity for activity in activities if 'hrTimeInZone' not in activity]
+    details = await asyncio.gather(*[
+        session.get(HR_ZONES_URL.format(activity_id=activity['activityId'])) for activity in missing
+    ], return_exceptions=True)
+    for activity, rows in zip(missing, details):
+        if isinstance(rows, Exception):
+            logger.warning(f"HR zones failed for activity {activity['activityId']}: {rows}")
+        elif parse_hr_zones(rows):
+            activity['hrTimeInZone'] = parse_hr_zones(rows)
+
+
+async def crawl_activities(session, garmin_auth, page_size=ACTIVITY_PAGE_SIZE):
+    """
+    Async crawl_activities: walks the activity list newest first, fetches HR zones for
+    the activities not stored yet, and upserts each page off the event loop, stopping
+    after the first page with activities already stored unless an unfinished crawl left
+    a backfill to resume (Garmin_Auth.activity_backfill_offset). Adds 'error' to the
+    counts when a page fails; the pages before it stay committed.
+    """
+    user = garmin_auth.user
+    weights_dict = await sync_to_async(load_sweat_score_weights)()
+    counts = {'created': 0, 'updated': 0, 'dates': set()}
+    resume_at = garmin_auth.activity_backfill_offset
+    stop_at_known = True
+    start = 0
+    finished = False
+    try:
+        while True:
+            page = await session.get(activity_page_url(start, page_size))
+            if not isinstance(page, list) or not page:
+                finished = True
+                break
+            known = await sync_to_async(stored_activity_ids)([activity.get('activityId') for activity in page])
+            await add_hr_zones(session, [
+                activity for activity in page
+                if activity.get('activityId') and activity['activityId'] not in known
+            ])
+            page_counts = await sync_to_async(ingest_activities)(user, page, weights_dict)
+            counts['created'] += page_counts['created']
+            counts['updated'] += page_counts['updated']
+            counts['dates'] |= page_counts['dates']
+            start += len(page)
+            if len(page) < page_size:
+                finished = True
+                break
+            if stop_at_known and known:
+                if resume_at is None:
+                    finished = True
+                    break
+                # Caught up with the stored activities: carry on from where the unfinished crawl stopped
+                start = max(start, resume_at)
+                resume_at = None
+                stop_at_known = False
+    except Exception as e:
+        # The pages upserted so far are committed; return their counts so their days are still rolled up
+        logger.error(f"Activity crawl for user {user.id} stopped after {start} activities: {e}")
+        counts['error'] = str(e)
+    await sync_to_async(save_backfill_offset)(garmin_auth, None if finished else start)
+    return counts
+
+
+def _finish_sync(garmin_auth, dates, complete=True):
+    refresh_daily_metrics(garmin_auth.user, dates)
+    if complete:
+        garmin_auth.last_sync = timezone.now()
+        garmin_auth.save(update_fields=['last_sync'])
+
+
+async def sync_user(http, semaphore, garmin_auth, days=None):
+    """Sync one user's steps since their last sync (or the last `days` days) and their new activities."""
+    user = garmin_auth.user
+    try:
+        # Token exchange goes through garth (sync); the requests below only need the access token
+        if not await sync_to_async(ensure_valid_tokens)(garmin_auth):
+            return {'success': False, 'error': 'Token refresh failed'}
+        session = UserSession(http, semaphore, garmin_auth)
+
+        end_date = timezone.now().date()
+        if days is not None:
+            start_date = end_date - timedelta(days=days)
+        elif garmin_auth.last_sync:
+            start_date = garmin_auth.last_sync.date()
+        else:
+            start_date = end_date - timedelta(days=FIRST_SYNC_DAYS)
+        steps, activity_counts = await asyncio.gather(
+            fetch_daily_steps(session, start_date, end_date),
+            crawl_activities(session, garmin_auth),
+        )
+        step_counts = await sync_to_async(ingest_daily_steps)(user, steps)
+        # A failed activity page still rolls up the days committed before it, but leaves
+        # last_sync alone so the next sync covers the same range again
+        await sync_to_async(_finish_sync)(
+            garmin_auth, step_counts['dates'] | activity_counts['dates'], 'error' not in activity_counts
+        )
+        if 'error' in activity_counts:
+            return {'success': False, 'error': activity_counts['error']}
+        return {
+            'success': True,
+            'steps_synced': step_counts['created'],
+            'steps_updated': step_counts['updated'],
+            'activities_synced': activity_counts['created'],
+            'activities_updated': activity_counts['updated'],
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error during async sync for user {user.id}: {e}")
+        return {'success': False, 'error': str(e)}
+
+
+async def _sync_all(garmin_auths, concurrency, days):
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(30.0)) as http:
+        results = await asyncio.gather(*[sync_user(http, semaphore, auth, days) for auth in garmin_auths])
+    await sync_to_async(close_old_connections)()
+    return {auth.user_id: result for auth, result in zip(garmin_auths, results)}
+
+
+def sync_garmin_users(user_ids=None, concurrency=None, days=None):
+    """
+    Sync every linked user (or the given user IDs) concurrently, with at most
+    `concurrency` (GARMIN_SYNC_CONCURRENCY) Garmin requests in flight at once.
+    `days` re-syncs that many days of steps instead of the days since each last sync.
+    Returns {user_id: result} with the per-user counts the sync tasks report.
+    """
+    garmin_auths = Garmin_Auth.objects.select_related('user')
+    if user_ids is not None:
+        garmin_auths = garmin_auths.filter(user_id__in=user_ids)
+    garmin_auths = list(garmin_auths)
+    if not garmin_auths:
+        return {}
+    return asyncio.run(_sync_all(garmin_auths, concurrency or settings.GARMIN_SYNC_CONCURRENCY, days))
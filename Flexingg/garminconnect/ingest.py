@@ -0,0 +1,273 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.fields.json import KeyTransform
+from django.utils import timezone
+from core.models import Transaction
+from .api import ACTIVITY_PAGE_SIZE, activity_page_url, add_hr_zones
+from .models import GarminActivity, GarminDailySteps
+from .scoring import load_sweat_score_weights, stored_sweat_score
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows written per INSERT ... ON CONFLICT statement, each batch in its own transaction
+INGEST_BATCH_SIZE = 500
+
+ACTIVITY_UPDATE_FIELDS = [
+    'name', 'activity_type', 'start_time_utc', 'duration_seconds', 'distance_meters',
+    'calories', 'average_hr', 'max_hr', 'sweat_score', 'raw_data', 'synced_at',
+]
+
+# Nullable columns a list entry can leave out: a stored value is kept rather than
+# overwritten with NULL, as the per-row saves did by dropping None values
+ACTIVITY_KEEP_STORED_FIELDS = ['duration_seconds', 'distance_meters', 'calories', 'average_hr', 'max_hr']
+
+
+def _empty_counts():
+    return {'created': 0, 'updated': 0, 'dates': set()}
+
+
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def ingest_daily_steps(user, steps_by_day, batch_size=INGEST_BATCH_SIZE):
+    """
+    Upsert GarminDailySteps rows from {date: steps}. Each batch is one lookup of the
+    days already stored plus one INSERT ... ON CONFLICT, in one transaction. Returns
+    {'created', 'updated', 'dates'}.
+    """
+    counts = _empty_counts()
+    rows = [GarminDailySteps(user=user, date=day, steps=steps) for day, steps in steps_by_day.items()]
+    for batch in _batches(rows, batch_size):
+        with transaction.atomic():
+            existing = set(GarminDailySteps.objects.filter(
+                user=user,
+                date__in=[row.date for row in batch]
+            ).values_list('date', flat=True))
+            GarminDailySteps.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['user', 'date'],
+                update_fields=['steps'],
+            )
+        counts['created'] += len(batch) - len(existing)
+        counts['updated'] += len(existing)
+        counts['dates'].update(row.date for row in batch)
+    return counts
+
+
+def parse_activity_start(activity):
+    """UTC start time of an activity-list entry ('startTimeGMT' as a string or epoch milliseconds), or None."""
+    activity_id = activity.get('activityId')
+    start_ts_gmt = activity.get('startTimeGMT')
+    if not start_ts_gmt:
+        logger.warning(f"Missing start time for activity {activity_id}")
+        return None
+    try:
+        if isinstance(start_ts_gmt, str):
+            if ' ' in start_ts_gmt and '-' in start_ts_gmt:
+                return datetime.strptime(start_ts_gmt, '%Y-%m-%d %H:%M:%S').replace(tzinfo=dt_timezone.utc)
+            # Unix timestamp string in milliseconds
+            return datetime.fromtimestamp(float(start_ts_gmt) / 1000, tz=dt_timezone.utc)
+        if isinstance(start_ts_gmt, (int, float)):
+            return datetime.fromtimestamp(start_ts_gmt / 1000, tz=dt_timezone.utc)
+        logger.warning(f"Unexpected start time type for activity {activity_id}: {type(start_ts_gmt)}")
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid start time format for activity {activity_id}: {start_ts_gmt} - {e}")
+    return None
+
+
+def build_activity(user, activity):
+    """
+    An unsaved GarminActivity for an activity-list entry, or None when it has no ID or
+    start time or a field does not fit its column (a non-numeric value, an oversized
+    name). Bad entries are skipped with a warning rather than failing the whole batch.
+    """
+    activity_id = activity.get('activityId')
+    if not activity_id:
+        logger.warning(f"Skipping activity with missing ID for user {user.id}: {activity}")
+        return None
+    start_time_utc = parse_activity_start(activity)
+    if start_time_utc is None:
+        return None
+
+    obj = GarminActivity(
+        user=user,
+        activity_id=activity_id,
+        name=activity.get('activityName') or 'Unnamed Activity',
+        activity_type=(activity.get('activityType') or {}).get('typeKey', 'unknown'),
+        start_time_utc=start_time_utc,
+        duration_seconds=activity.get('duration'),
+        distance_meters=activity.get('distance'),
+        calories=activity.get('calories'),
+        average_hr=activity.get('averageHR'),
+        max_hr=activity.get('maxHR'),
+        raw_data=activity,
+    )
+    try:
+        # Converts numeric strings and checks lengths, as the per-row saves used to
+        obj.clean_fields(exclude=['id', 'user', 'sweat_score'])
+    except ValidationError as e:
+        logger.warning(f"Skipping activity {activity_id} for user {user.id}: {e.message_dict}")
+        return None
+    return obj
+
+
+def _award_cardio_coins(user, activities):
+    """CardioCoin rewards for activities in the user's join window that have not been rewarded yet."""
+    join_month_start = user.date_joined.replace(day=1).date()
+    one_week_after = (user.date_joined + timedelta(weeks=1)).date()
+    eligible = [
+        obj for obj in activities
+        if obj.calories and obj.calories > 0
+        and join_month_start <= obj.start_time_utc.date() <= one_week_after
+    ]
+    if not eligible:
+        return
+    rewarded = set(Transaction.objects.filter(
+        user=user,
+        currency_type='cardio_coins',
+        garmin_activity__in=eligible
+    ).values_list('garmin_activity_id', flat=True))
+    for obj in eligible:
+        if obj.id not in rewarded:
+            user.earn_cardio_coins(Decimal(str(obj.calories)), garmin_activity=obj)
+
+
+def ingest_activities(user, activities, weights_dict=None, batch_size=INGEST_BATCH_SIZE):
+    """
+    Upsert GarminActivity rows from activity-list entries, keyed on the Garmin activity
+    ID, and award the join-window CardioCoins. Each batch is one lookup of the rows
+    already stored plus one INSERT ... ON CONFLICT, in one transaction. Values an entry
+    leaves out keep their stored value (ACTIVITY_KEEP_STORED_FIELDS), and so do the HR
+    zones in raw_data, which the sweat score is computed from. Returns
+    {'created', 'updated', 'dates'} with the local days the activities fall on.
+    """
+    if weights_dict is None:
+        weights_dict = load_sweat_score_weights()
+    counts = _empty_counts()
+    rows = {}
+    for activity in activities:
+        obj = build_activity(user, activity)
+        if obj is not None:
+            # A page can repeat an activity; the last copy wins, as with row-by-row upserts
+            rows[obj.activity_id] = obj
+
+    for batch in _batches(list(rows.values()), batch_size):
+        with transaction.atomic():
+            existing = {
+                row['activity_id']: row
+                for row in GarminActivity.objects.filter(
+                    activity_id__in=[obj.activity_id for obj in batch]
+                ).values(
+                    'activity_id', 'id', *ACTIVITY_KEEP_STORED_FIELDS,
+                    stored_hr_zones=KeyTransform('hrTimeInZone', 'raw_data')
+                )
+            }
+            for obj in batch:
+                stored = existing.get(obj.activity_id)
+                if stored:
+                    # Keep the stored primary key so rewards point at the existing row
+                    obj.id = stored['id']
+                    for field in ACTIVITY_KEEP_STORED_FIELDS:
+                        if getattr(obj, field) is None:
+                            setattr(obj, field, stored[field])
+                    # List entries carry no HR zones; keep the ones fetched when the activity was first stored
+                    if stored['stored_hr_zones'] is not None and 'hrTimeInZone' not in obj.raw_data:
+                        obj.raw_data = {**obj.raw_data, 'hrTimeInZone': stored['stored_hr_zones']}
+                obj.sweat_score = stored_sweat_score(obj, weights_dict)
+            GarminActivity.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['activity_id'],
+                update_fields=ACTIVITY_UPDATE_FIELDS,
+            )
+        counts['created'] += len(batch) - len(existing)
+        counts['updated'] += len(existing)
+        counts['dates'].update(timezone.localdate(obj.start_time_utc) for obj in batch)
+        _award_cardio_coins(user, batch)
+    return counts
+
+
+def stored_activity_ids(activity_ids):
+    """The Garmin activity IDs among activity_ids that are already stored."""
+    return set(GarminActivity.objects.filter(activity_id__in=activity_ids).values_list('activity_id', flat=True))
+
+
+def save_backfill_offset(garmin_auth, offset):
+    """Store where an unfinished crawl of the full activity list stopped, or None once one reaches its end."""
+    if garmin_auth.activity_backfill_offset != offset:
+        garmin_auth.activity_backfill_offset = offset
+        garmin_auth.save(update_fields=['activity_backfill_offset'])
+
+
+def crawl_activities(garmin_auth, client, start_date=None, end_date=None, page_size=ACTIVITY_PAGE_SIZE, limit=None,
+                     stop_at_known=True):
+    """
+    Walk the user's activity list page by page and upsert each page as it arrives, so
+    only one page is held in memory, with the HR zones of activities not stored yet
+    fetched for their sweat score. The list is newest first, so with stop_at_known
+    the crawl ends after the first page holding activities that were already stored,
+    unless an earlier crawl of the full list stopped short (a failed page or `limit`):
+    then it skips to the offset that crawl reached (Garmin_Auth.activity_backfill_offset)
+    and reads on to the oldest activity. `limit` caps the number of activities read.
+    Returns {'created', 'updated', 'dates'}, plus 'error' when a page failed; the pages
+    before it stay committed.
+    """
+    user = garmin_auth.user
+    weights_dict = load_sweat_score_weights()
+    counts = _empty_counts()
+    # Only a crawl of the full list (no date range) backfills history, so only it tracks where it stopped
+    backfill = start_date is None and end_date is None
+    resume_at = garmin_auth.activity_backfill_offset if backfill else None
+    offset = 0
+    fetched = 0
+    finished = False
+    try:
+        while limit is None or fetched < limit:
+            page = client.connectapi(activity_page_url(offset, page_size, start_date, end_date))
+            if not isinstance(page, list) or not page:
+                finished = True
+                break
+            finished = len(page) < page_size
+            if limit is not None and len(page) > limit - fetched:
+                page = page[:limit - fetched]
+                finished = False
+            # Only new activities need their HR zones; stored ones keep theirs (see ingest_activities)
+            known = stored_activity_ids([activity.get('activityId') for activity in page])
+            add_hr_zones(client, [
+                activity for activity in page
+                if activity.get('activityId') and activity['activityId'] not in known
+            ])
+            page_counts = ingest_activities(user, page, weights_dict)
+            counts['created'] += page_counts['created']
+            counts['updated'] += page_counts['updated']
+            counts['dates'] |= page_counts['dates']
+            fetched += len(page)
+            offset += len(page)
+            if finished:
+                break
+            if stop_at_known and page_counts['updated']:
+                if resume_at is None:
+                    finished = True
+                    break
+                # Caught up with the stored activities: carry on from where the unfinished crawl
+                # stopped. New activities push it down the list, so this re-reads a few stored
+                # activities rather than skipping any.
+                offset = max(offset, resume_at)
+                resume_at = None
+                stop_at_known = False
+    except Exception as e:
+        # The pages upserted so far are committed; return their counts so their days are still rolled up
+        logger.error(f"Activity crawl for user {user.id} stopped after {fetched} activities: {e}")
+        counts['error'] = str(e)
+    if backfill:
+        # The next sync resumes at the page that failed or the first one past `limit`
+        save_backfill_offset(garmin_auth, None if finished else offset)
+    logger.info(f"Crawled {fetched} activities for user {user.id}")
+    return counts
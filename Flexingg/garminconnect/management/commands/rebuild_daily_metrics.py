@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from garminconnect.rollups import rebuild_daily_metrics
+
+
+class Command(BaseCommand):
+    help = "Rebuild the UserDailyMetrics rollup from the raw Garmin steps and activity rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help="Only rebuild this user ID (can be given more than once)."
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_metrics(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily metric rows."))
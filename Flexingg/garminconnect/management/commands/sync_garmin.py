@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from garminconnect.engine import sync_garmin_users
+
+
+class Command(BaseCommand):
+    help = "Sync Garmin steps and activities for every linked user (or the given users) concurrently."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help="Only sync this user ID (can be given more than once)."
+        )
+        parser.add_argument(
+            '--concurrency', type=int,
+            help="Garmin requests in flight at once (default: GARMIN_SYNC_CONCURRENCY)."
+        )
+        parser.add_argument(
+            '--days', type=int,
+            help="Re-sync this many days of steps instead of the days since each user's last sync."
+        )
+
+    def handle(self, *args, **options):
+        results = sync_garmin_users(options['user_ids'], options['concurrency'], options['days'])
+        for user_id, result in results.items():
+            if result['success']:
+                self.stdout.write(
+                    f"User {user_id}: {result['steps_synced']} steps created, {result['steps_updated']} updated; "
+                    f"{result['activities_synced']} activities created, {result['activities_updated']} updated"
+                )
+            else:
+                self.stderr.write(f"User {user_id}: {result['error']}")
+        synced = sum(result['success'] for result in results.values())
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced} of {len(results)} users."))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('garminconnect', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Local calendar day this rollup covers.')),
+                ('steps', models.PositiveIntegerField(default=0, help_text='Total steps for the day.')),
+                ('calories', models.FloatField(default=0, help_text='Active calories from activities started on this day.')),
+                ('sweat_score', models.FloatField(default=0, help_text='Sweat score from activities started on this day.')),
+                ('activity_count', models.PositiveIntegerField(default=0, help_text='Number of activities started on this day.')),
+                ('active_seconds', models.FloatField(default=0, help_text='Total activity duration in seconds.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User Daily Metrics',
+                'ordering': ['-date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+    ]
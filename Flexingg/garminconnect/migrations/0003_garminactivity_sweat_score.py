@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+# Frozen copy of garminconnect.scoring.stored_sweat_score as of this migration, so later
+# changes to the live scoring code cannot change or break the backfill
+def stored_sweat_score(activity, weights_dict):
+    if not activity.duration_seconds:
+        return 0
+    if activity.raw_data and 'hrTimeInZone' in activity.raw_data:
+        hr_zones = activity.raw_data['hrTimeInZone']
+        zone_minutes = [hr_zones.get(f'hrTimeInZone_{zone}', 0) / 60 for zone in range(1, 6)]
+        t0 = max(0, activity.duration_seconds / 60 - sum(zone_minutes))
+        default_weights = {0: 1, 1: 2, 2: 3, 3: 5, 4: 8, 5: 12}
+        return sum(
+            minutes * float(weights_dict.get(zone, default_weights[zone]))
+            for zone, minutes in enumerate([t0] + zone_minutes)
+        )
+    if activity.calories:
+        return activity.calories / 2
+    return 0
+
+
+def backfill_sweat_scores(apps, schema_editor):
+    GarminActivity = apps.get_model('garminconnect', 'GarminActivity')
+    SweatScoreWeights = apps.get_model('core', 'SweatScoreWeights')
+    weights_dict = {weight.zone: weight.weight for weight in SweatScoreWeights.objects.all()}
+
+    batch = []
+    activities = GarminActivity.objects.only('id', 'raw_data', 'duration_seconds', 'calories')
+    for activity in activities.iterator(chunk_size=2000):
+        activity.sweat_score = stored_sweat_score(activity, weights_dict)
+        batch.append(activity)
+        if len(batch) >= 2000:
+            GarminActivity.objects.bulk_update(batch, ['sweat_score'])
+            batch = []
+    if batch:
+        GarminActivity.objects.bulk_update(batch, ['sweat_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_alter_userprofile_avatar'),
+        ('garminconnect', '0002_userdailymetrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garminactivity',
+            name='sweat_score',
+            field=models.FloatField(default=0, help_text='Sweat score computed at sync time from HR zones and SweatScoreWeights.'),
+        ),
+        migrations.RunPython(backfill_sweat_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('garminconnect', '0003_garminactivity_sweat_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garmin_auth',
+            name='activity_backfill_offset',
+            field=models.PositiveIntegerField(blank=True, help_text='Activity-list offset where an unfinished activity crawl stopped; the next sync resumes the backfill there.', null=True),
+        ),
+    ]
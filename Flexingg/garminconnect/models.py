@@ -24,6 +24,7 @@ class Garmin_Auth(models.Model):
     last_sync = models.DateTimeField(null=True, blank=True, help_text="Timestamp of the last successful data sync.")    # Formats automatically. Essential to monitor sync frequency!
     last_sync_attempt = models.DateTimeField(null=True, blank=True, help_text="Timestamp of the last sync attempt (successful or failed).") # Initial sync flow + error handling
     garmin_email = models.EmailField(blank=True, null=True, help_text="Garmin Connect email address used for linking.")
+    activity_backfill_offset = models.PositiveIntegerField(null=True, blank=True, help_text="Activity-list offset where an unfinished activity crawl stopped; the next sync resumes the backfill there.")
 
 
     def expired(self):        
@@ -86,9 +87,29 @@ class GarminActivity(models.Model):
     calories = models.FloatField(null=True, blank=True, help_text="Calories burned.")  
     average_hr = models.FloatField(null=True, blank=True, help_text="Average heart rate.")  
     max_hr = models.FloatField(null=True, blank=True, help_text="Maximum heart rate.")  
+    sweat_score = models.FloatField(default=0, help_text="Sweat score computed at sync time from HR zones and SweatScoreWeights.")
     # Store the full raw data from Garmin API for future use or debugging.
     raw_data = models.JSONField(null=True, blank=True, help_text="Raw JSON data from Garmin API.")  
     synced_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):  
-        return f"{self.user.username} - {self.name} ({self.activity_id}) on {self.start_time_utc.date()}"
\ No newline at end of file
+        return f"{self.user.username} - {self.name} ({self.activity_id}) on {self.start_time_utc.date()}"
+
+class UserDailyMetrics(models.Model):
+    """Per-user, per-day rollup of Garmin data, maintained by the sync tasks."""
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='daily_metrics')
+    date = models.DateField(help_text="Local calendar day this rollup covers.")
+    steps = models.PositiveIntegerField(default=0, help_text="Total steps for the day.")
+    calories = models.FloatField(default=0, help_text="Active calories from activities started on this day.")
+    sweat_score = models.FloatField(default=0, help_text="Sweat score from activities started on this day.")
+    activity_count = models.PositiveIntegerField(default=0, help_text="Number of activities started on this day.")
+    active_seconds = models.FloatField(default=0, help_text="Total activity duration in seconds.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.date}: {self.steps} steps, {self.calories:.0f} cal"
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ('user', 'date')
+        verbose_name_plural = "User Daily Metrics"
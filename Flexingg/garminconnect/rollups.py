@@ -0,0 +1,112 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import GarminDailySteps, GarminActivity, UserDailyMetrics
+from core.charts import invalidate_friends_chart_cache
+from core.leaderboards import update_daily_leaderboards
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FIELDS = ['steps', 'calories', 'sweat_score', 'activity_count', 'active_seconds']
+
+
+def _empty_day():
+    return {field: 0 for field in ROLLUP_FIELDS}
+
+
+def _activity_totals(activities):
+    """
+    Aggregate an activity queryset to one row per local day in SQL. Activities are
+    bucketed by the local day of their start time, the same day the chart and
+    leaderboard queries used when they aggregated the raw rows.
+    """
+    return activities.annotate(
+        day=TruncDate('start_time_utc')
+    ).values('day').annotate(
+        calories=Coalesce(Sum('calories'), 0.0),
+        sweat_score=Sum('sweat_score'),
+        activity_count=Count('id'),
+        active_seconds=Coalesce(Sum('duration_seconds'), 0.0),
+    ).order_by()
+
+
+def _collect_days(user_id, steps_rows, activity_rows):
+    """Fold raw steps rows and per-day activity totals into UserDailyMetrics rows for one user."""
+    days = defaultdict(_empty_day)
+    for day, steps in steps_rows:
+        days[day]['steps'] = steps or 0
+    for row in activity_rows:
+        metrics = days[row.pop('day')]
+        metrics.update(row)
+    return [
+        UserDailyMetrics(user_id=user_id, date=day, **metrics)
+        for day, metrics in days.items()
+    ]
+
+
+def _write_rows(rows):
+    UserDailyMetrics.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user', 'date'],
+        update_fields=ROLLUP_FIELDS + ['updated_at'],
+    )
+
+
+def refresh_daily_metrics(user, dates):
+    """
+    Recompute the UserDailyMetrics rows for the given user and days from the raw
+    GarminDailySteps / GarminActivity rows. Called by the sync tasks with the days
+    they touched, so each sync only rewrites a handful of narrow rows.
+    """
+    dates = set(dates)
+    if not dates:
+        return 0
+
+    steps_rows = GarminDailySteps.objects.filter(
+        user=user,
+        date__in=dates
+    ).values_list('date', 'steps')
+    activity_rows = _activity_totals(GarminActivity.objects.filter(
+        user=user,
+        start_time_utc__date__in=dates
+    ))
+
+    rows = _collect_days(user.id, steps_rows, activity_rows)
+    # Days that no longer have any raw data still get a row so stale totals are zeroed
+    seen = {row.date for row in rows}
+    rows += [UserDailyMetrics(user_id=user.id, date=day, **_empty_day()) for day in dates - seen]
+
+    with transaction.atomic():
+        _write_rows(rows)
+    invalidate_friends_chart_cache(user.id)
+    update_daily_leaderboards(user.id, dates, timezone.localdate())
+    return len(rows)
+
+
+def rebuild_daily_metrics(user_ids=None):
+    """
+    Rebuild UserDailyMetrics from scratch for the given users (all users with Garmin
+    data when omitted). Works one user at a time to keep memory bounded.
+    """
+    if user_ids is None:
+        user_ids = set(GarminDailySteps.objects.values_list('user_id', flat=True).distinct())
+        user_ids |= set(GarminActivity.objects.values_list('user_id', flat=True).distinct())
+        user_ids |= set(UserDailyMetrics.objects.values_list('user_id', flat=True).distinct())
+
+    rows_written = 0
+    for user_id in sorted(user_ids):
+        steps_rows = GarminDailySteps.objects.filter(user_id=user_id).values_list('date', 'steps')
+        activity_rows = _activity_totals(GarminActivity.objects.filter(user_id=user_id))
+        rows = _collect_days(user_id, steps_rows, activity_rows)
+        with transaction.atomic():
+            UserDailyMetrics.objects.filter(user_id=user_id).delete()
+            UserDailyMetrics.objects.bulk_create(rows, batch_size=1000)
+        invalidate_friends_chart_cache(user_id)
+        update_daily_leaderboards(user_id, [row.date for row in rows], timezone.localdate())
+        rows_written += len(rows)
+        logger.info(f"Rebuilt {len(rows)} daily metric rows for user {user_id}")
+    return rows_written
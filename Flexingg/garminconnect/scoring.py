@@ -0,0 +1,52 @@
+def load_sweat_score_weights():
+    """Return {zone: weight} from SweatScoreWeights."""
+    from core.models import SweatScoreWeights
+    return {weight.zone: weight.weight for weight in SweatScoreWeights.objects.all()}
+
+
+def calculate_sweat_score(activity, weights_dict):
+    """
+    Calculate sweat score for a single activity based on HR zones and weights.
+    Returns the calculated score or fallback value.
+    """
+    # Try to get HR zone data from raw_data
+    if activity.raw_data and 'hrTimeInZone' in activity.raw_data:
+        hr_zones = activity.raw_data['hrTimeInZone']
+
+        # Extract time in each zone (convert from seconds to minutes)
+        t1 = hr_zones.get('hrTimeInZone_1', 0) / 60  # Zone 1
+        t2 = hr_zones.get('hrTimeInZone_2', 0) / 60  # Zone 2
+        t3 = hr_zones.get('hrTimeInZone_3', 0) / 60  # Zone 3
+        t4 = hr_zones.get('hrTimeInZone_4', 0) / 60  # Zone 4
+        t5 = hr_zones.get('hrTimeInZone_5', 0) / 60  # Zone 5
+
+        # Calculate T0 (time below zone 1)
+        total_duration = (activity.duration_seconds or 0) / 60  # Convert to minutes
+        t0 = max(0, total_duration - (t1 + t2 + t3 + t4 + t5))
+
+        # Calculate score using weights
+        score = (
+            (t0 * float(weights_dict.get(0, 1))) +
+            (t1 * float(weights_dict.get(1, 2))) +
+            (t2 * float(weights_dict.get(2, 3))) +
+            (t3 * float(weights_dict.get(3, 5))) +
+            (t4 * float(weights_dict.get(4, 8))) +
+            (t5 * float(weights_dict.get(5, 12)))
+        )
+
+        return score
+    else:
+        # Fallback: use calories / 2
+        if activity.calories:
+            return activity.calories / 2
+        return 0
+
+
+def stored_sweat_score(activity, weights_dict):
+    """
+    Sweat score stored on GarminActivity.sweat_score. Activities without a duration
+    count as zero, the same as the sweat score chart has always treated them.
+    """
+    if not activity.duration_seconds:
+        return 0
+    return calculate_sweat_score(activity, weights_dict)
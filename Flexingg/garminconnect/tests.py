@@ -1,3 +1,200 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import httpx
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import leaderboards
+from core.models import SweatScoreWeights, UserProfile
+from garminconnect import engine, tasks
+from garminconnect.ingest import crawl_activities
+from garminconnect.models import Garmin_Auth, GarminActivity
+
+HR_ZONES = [{'zoneNumber': zone, 'secsInZone': 60 * zone} for zone in range(1, 6)]
+
+# Syncs refresh the chart cache and the leaderboards; keep both off the configured Redis
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class FakeGarmin:
+    """
+    Garmin Connect for one user: an activity list served newest first (all started
+    before the user's CardioCoin join window), HR zones for every activity and no steps. The activity-list page starting at `fail_at` fails
+    until it is cleared. Serves both a garth client (connectapi) and httpx (handle).
+    """
+
+    def __init__(self, activity_count):
+        self.now = timezone.now()
+        self.activity_ids = []
+        self.fail_at = None
+        self.add_activities(activity_count)
+
+    def add_activities(self, count):
+        newest = max(self.activity_ids, default=999)
+        self.activity_ids = list(range(newest + count, newest, -1)) + self.activity_ids
+
+    def activity(self, activity_id):
+        return {
+            'activityId': activity_id,
+            'activityName': 'Run',
+            'activityType': {'typeKey': 'running'},
+            'startTimeGMT': (self.now - timedelta(days=60, minutes=activity_id)).strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': 1800,
+            'calories': 500,
+        }
+
+    def respond(self, url):
+        if '/stats/steps/daily/' in url.path:
+            return 200, []
+        if 'activitylist' in url.path:
+            start, limit = int(url.params['start']), int(url.params['limit'])
+            if start == self.fail_at:
+                return 503, None
+            return 200, [self.activity(activity_id) for activity_id in self.activity_ids[start:start + limit]]
+        if 'hrTimeInZones' in url.path:
+            return 200, HR_ZONES
+        return 404, None
+
+    def connectapi(self, path):
+        status, data = self.respond(httpx.URL(path))
+        if status != 200:
+            raise ConnectionError(f"{path}: HTTP {status}")
+        return data
+
+    def handle(self, request):
+        status, data = self.respond(request.url)
+        return httpx.Response(status, json=data)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class GarminSyncTests(TransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(leaderboards, '_client', fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = UserProfile.objects.create_user('runner', password='x')
+        self.garmin_auth = Garmin_Auth.objects.create(
+            user=self.user, oauth_token='token', oauth_token_secret='secret', domain='garmin.com',
+            scope='connect', jti='jti', token_type='Bearer', access_token='access', refresh_token='refresh',
+            expires_in=3600, expires_at=int(time.time()) + 3600,
+            refresh_token_expires_in=7200, refresh_token_expires_at=int(time.time()) + 7200,
+        )
+        self.garmin = FakeGarmin(250)
+        async_client = httpx.AsyncClient
+        for patcher in (
+            mock.patch.object(engine, 'ensure_valid_tokens', lambda garmin_auth: True),
+            mock.patch.object(engine, 'REQUEST_BACKOFF', 0),
+            mock.patch.object(
+                httpx, 'AsyncClient',
+                lambda **kwargs: async_client(transport=httpx.MockTransport(self.garmin.handle), **kwargs)
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stored(self):
+        return {
+            activity_id: (raw_data.get('hrTimeInZone'), sweat_score)
+            for activity_id, raw_data, sweat_score in GarminActivity.objects.values_list(
+                'activity_id', 'raw_data', 'sweat_score'
+            )
+        }
+
+    def backfill_offset(self):
+        return Garmin_Auth.objects.get(user=self.user).activity_backfill_offset
+
+    def test_resync_keeps_hr_zones_and_sweat_scores(self):
+        self.garmin = FakeGarmin(3)
+        first = engine.sync_garmin_users([self.user.id])
+        self.assertEqual(first[self.user.id]['activities_synced'], 3)
+        stored = self.stored()
+        for hr_zones, sweat_score in stored.values():
+            self.assertEqual(hr_zones, {f'hrTimeInZone_{row["zoneNumber"]}': row['secsInZone'] for row in HR_ZONES})
+            self.assertNotEqual(sweat_score, 500 / 2)
+
+        second = engine.sync_garmin_users([self.user.id])
+        self.assertEqual(second[self.user.id]['activities_updated'], 3)
+        self.assertEqual(self.stored(), stored)
+
+    def test_sync_paths_store_the_same_sweat_scores(self):
+        self.garmin = FakeGarmin(3)
+        crawl_activities(self.garmin_auth, self.garmin)
+        crawled = self.stored()
+        self.assertEqual(len(crawled), 3)
+
+        GarminActivity.objects.all().delete()
+        engine.sync_garmin_users([self.user.id])
+        self.assertEqual(self.stored(), crawled)
+
+    def test_crawl_resumes_backfill_after_failed_page(self):
+        self.garmin.fail_at = 100
+        counts = crawl_activities(self.garmin_auth, self.garmin, page_size=100)
+        self.assertIn('error', counts)
+        self.assertEqual(GarminActivity.objects.count(), 100)
+        self.assertEqual(self.backfill_offset(), 100)
+
+        # The next sync starts on a page of stored activities, then backfills the rest
+        self.garmin.fail_at = None
+        self.garmin.add_activities(5)
+        counts = crawl_activities(self.garmin_auth, self.garmin, page_size=100)
+        self.assertNotIn('error', counts)
+        self.assertEqual(counts['created'], 155)
+        self.assertEqual(set(GarminActivity.objects.values_list('activity_id', flat=True)), set(self.garmin.activity_ids))
+        self.assertIsNone(self.backfill_offset())
+
+        # With the backfill done, a sync stops at the first page of stored activities
+        counts = crawl_activities(self.garmin_auth, self.garmin, page_size=100)
+        self.assertEqual((counts['created'], counts['updated']), (0, 100))
+
+    def test_engine_resumes_backfill_after_failed_page(self):
+        self.garmin.fail_at = 200
+        result = engine.sync_garmin_users([self.user.id])[self.user.id]
+        self.assertFalse(result['success'])
+        self.assertEqual(GarminActivity.objects.count(), 200)
+        self.assertEqual(self.backfill_offset(), 200)
+
+        self.garmin.fail_at = None
+        self.garmin.add_activities(5)
+        result = engine.sync_garmin_users([self.user.id])[self.user.id]
+        self.assertTrue(result['success'])
+        self.assertEqual(set(GarminActivity.objects.values_list('activity_id', flat=True)), set(self.garmin.activity_ids))
+        self.assertIsNone(self.backfill_offset())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SweatScoreRecomputeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(tasks.recompute_sweat_scores_task, 'apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def save_weights(self):
+        # The admin's editable list saves every zone row in one request
+        with self.captureOnCommitCallbacks(execute=True):
+            for zone in range(6):
+                SweatScoreWeights.objects.update_or_create(
+                    zone=zone, defaults={'name': f'Zone {zone}', 'perceived_effort': 'Any', 'weight': zone + 1}
+                )
+
+    def test_burst_of_weight_saves_queues_one_recompute(self):
+        self.save_weights()
+        self.apply_async.assert_called_once_with(countdown=tasks.RECOMPUTE_COUNTDOWN)
+
+        # Saves while that run is still queued share it; once it starts (and releases the lock) they queue another
+        self.save_weights()
+        self.assertEqual(self.apply_async.call_count, 1)
+        cache.delete(tasks.RECOMPUTE_QUEUED_KEY)
+        self.save_weights()
+        self.assertEqual(self.apply_async.call_count, 2)
+
+    def test_weight_saves_queue_a_recompute_without_the_cache(self):
+        with mock.patch.object(cache, 'add', side_effect=ConnectionError('cache down')):
+            self.save_weights()
+        self.assertEqual(self.apply_async.call_count, 6)
+        self.apply_async.assert_called_with(countdown=tasks.RECOMPUTE_COUNTDOWN)
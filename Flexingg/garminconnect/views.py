@@ -5,7 +5,11 @@ from django.http import JsonResponse
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib import messages
-from .models import Garmin_Auth, GarminDailySteps, GarminActivity
+from .models import Garmin_Auth
+from .api import ACTIVITY_PAGE_SIZE, fetch_daily_steps
+from .client import garmin_client, save_client_tokens
+from .ingest import crawl_activities, ingest_daily_steps
+from .rollups import refresh_daily_metrics
 from core.models import UserProfile
 from core.forms import ProfileForm
 from .forms import GarminConnectForm
@@ -16,7 +20,7 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def ensure_valid_tokens(garmin_auth):
+def ensure_valid_tokens(garmin_auth, client=None):
     """
     Ensure Garmin tokens are valid by refreshing if expired.
     Returns True if successful, False otherwise.
@@ -26,49 +30,10 @@ def ensure_valid_tokens(garmin_auth):
 
     logger.info(f"Tokens expired for user {garmin_auth.user.id}, refreshing...")
     try:
-        oauth1_data = {
-            'oauth_token': garmin_auth.oauth_token,
-            'oauth_token_secret': garmin_auth.oauth_token_secret,
-            'mfa_token': getattr(garmin_auth, 'mfa_token', None),
-            'mfa_expiration_timestamp': getattr(garmin_auth, 'mfa_expiration_timestamp', None),
-            'domain': getattr(garmin_auth, 'domain', None),
-        }
-        oauth2_data = {
-            'scope': garmin_auth.scope,
-            'jti': garmin_auth.jti,
-            'token_type': garmin_auth.token_type,
-            'access_token': garmin_auth.access_token,
-            'refresh_token': garmin_auth.refresh_token,
-            'expires_in': garmin_auth.expires_in,
-            'expires_at': garmin_auth.expires_at,
-            'refresh_token_expires_in': getattr(garmin_auth, 'refresh_token_expires_in', None),
-            'refresh_token_expires_at': getattr(garmin_auth, 'refresh_token_expires_at', None),
-        }
-
-        # Create token objects
-        oauth1_token = garth.auth_tokens.OAuth1Token(**oauth1_data)
-        oauth2_token = garth.auth_tokens.OAuth2Token(**oauth2_data)
-
-        # Refresh
-        oauth1_token.refresh()
-        oauth2_token.refresh()
-
-        # Update stored tokens
-        garmin_auth.oauth_token = oauth1_token.oauth_token
-        garmin_auth.oauth_token_secret = oauth1_token.oauth_token_secret
-        garmin_auth.mfa_token = getattr(oauth1_token, 'mfa_token', None)
-        garmin_auth.mfa_expiration_timestamp = getattr(oauth1_token, 'mfa_expiration_timestamp', None)
-        garmin_auth.domain = getattr(oauth1_token, 'domain', None)
-        garmin_auth.scope = oauth2_token.scope
-        garmin_auth.jti = oauth2_token.jti
-        garmin_auth.token_type = oauth2_token.token_type
-        garmin_auth.access_token = oauth2_token.access_token
-        garmin_auth.refresh_token = oauth2_token.refresh_token
-        garmin_auth.expires_in = oauth2_token.expires_in
-        garmin_auth.expires_at = oauth2_token.expires_at
-        garmin_auth.refresh_token_expires_in = getattr(oauth2_token, 'refresh_token_expires_in', None)
-        garmin_auth.refresh_token_expires_at = getattr(oauth2_token, 'refresh_token_expires_at', None)
-        garmin_auth.save()
+        # Exchange the OAuth1 token for a new OAuth2 token on the user's own client
+        client = client or garmin_client(garmin_auth)
+        client.refresh_oauth2()
+        save_client_tokens(garmin_auth, client)
         logger.info("Token refresh successful")
         return True
     except Exception as refresh_err:
@@ -85,92 +50,33 @@ def perform_garmin_sync_steps(user, start_date, end_date):
     except Garmin_Auth.DoesNotExist:
         return {'success': False, 'error': 'No Garmin auth record found'}
 
-    steps_synced = 0
-
     try:
+        # Each sync gets its own client, so concurrent syncs never share tokens
+        client = garmin_client(garmin_auth)
+
         # Ensure tokens are valid
-        if not ensure_valid_tokens(garmin_auth):
+        if not ensure_valid_tokens(garmin_auth, client):
             return {'success': False, 'error': 'Token refresh failed'}
 
-        # Configure client with tokens
-        oauth1_data = {
-            'oauth_token': garmin_auth.oauth_token,
-            'oauth_token_secret': garmin_auth.oauth_token_secret,
-            'mfa_token': getattr(garmin_auth, 'mfa_token', None),
-            'mfa_expiration_timestamp': getattr(garmin_auth, 'mfa_expiration_timestamp', None),
-            'domain': getattr(garmin_auth, 'domain', None),
-        }
-        oauth2_data = {
-            'scope': garmin_auth.scope,
-            'jti': garmin_auth.jti,
-            'token_type': garmin_auth.token_type,
-            'access_token': garmin_auth.access_token,
-            'refresh_token': garmin_auth.refresh_token,
-            'expires_in': garmin_auth.expires_in,
-            'expires_at': garmin_auth.expires_at,
-            'refresh_token_expires_in': getattr(garmin_auth, 'refresh_token_expires_in', None),
-            'refresh_token_expires_at': getattr(garmin_auth, 'refresh_token_expires_at', None),
-        }
-        oauth1_token = garth.auth_tokens.OAuth1Token(**oauth1_data)
-        oauth2_token = garth.auth_tokens.OAuth2Token(**oauth2_data)
-        garth.client.configure(oauth1_token=oauth1_token, oauth2_token=oauth2_token)
-
-        # Sync steps for each day in range
-        current_date = start_date
-        while current_date <= end_date:
-            try:
-                if current_date > timezone.now().date():
-                    current_date += timedelta(days=1)
-                    continue
-
-                # Fetch daily steps
-                url = f"/usersummary-service/stats/steps/daily/{current_date.isoformat()}/{current_date.isoformat()}"
-                try:
-                    daily_steps_data = garth.client.connectapi(url)
-                except Exception as api_err:
-                    logger.warning(f"Steps API failed for {current_date}: {api_err}")
-                    # Try alternative endpoint
-                    alt_url = f"/usersummary-service/usersummary/daily/{current_date.isoformat()}"
-                    daily_steps_data = garth.client.connectapi(alt_url)
-
-                if daily_steps_data and len(daily_steps_data) > 0:
-                    steps = daily_steps_data[0].get('totalSteps', 0)
-                    if steps is not None:
-                        obj, created = GarminDailySteps.objects.update_or_create(
-                            user=user,
-                            date=current_date,
-                            defaults={'steps': steps}
-                        )
-                        if created: steps_synced += 1
-
-                        # Also update DailySteps for general persistence
-                        distance_miles = (steps * 2.2) / 5280.0  # 2.2 ft per step, 5280 ft per mile
-                        daily_obj, daily_created = DailySteps.objects.update_or_create(
-                            user=user,
-                            calendar_date=current_date,
-                            defaults={
-                                'total_steps': steps,
-                                'total_distance': distance_miles
-                            }
-                        )
-                        if daily_created: steps_synced += 1  # Count for overall sync
-
-            except Exception as step_err:
-                logger.error(f"Error syncing steps for {current_date} for user {user.id}: {step_err}")
-
-            current_date += timedelta(days=1)  # Update last_sync
+        # Fetch the whole range in a few multi-day requests, then upsert it in batches
+        counts = ingest_daily_steps(user, fetch_daily_steps(client, start_date, end_date))
+        logger.info(f"Synced steps for user {user.id}: {counts['created']} created, {counts['updated']} updated")
+
+        refresh_daily_metrics(user, counts['dates'])
+        save_client_tokens(garmin_auth, client)
         garmin_auth.last_sync = timezone.now()
         garmin_auth.save(update_fields=['last_sync'])
 
-        return {'success': True, 'steps_synced': steps_synced}
+        return {'success': True, 'steps_synced': counts['created'], 'steps_updated': counts['updated']}
 
     except Exception as e:
         logger.error(f"Unexpected error during steps sync for user {user.id}: {e}")
         return {'success': False, 'error': str(e)}
 
-def perform_garmin_sync_activities(user, limit=500, start_date=None, end_date=None):
+def perform_garmin_sync_activities(user, limit=None, start_date=None, end_date=None, page_size=ACTIVITY_PAGE_SIZE):
     """
-    Sync recent Garmin activities for the user, optionally filtered by date range.
+    Sync Garmin activities for the user, optionally filtered by date range. Without
+    dates it crawls the whole activity history, as garmin_sync_activities_task does.
     Returns dict with success status and synced count.
     """
     try:
@@ -178,126 +84,36 @@ def perform_garmin_sync_activities(user, limit=500, start_date=None, end_date=No
     except Garmin_Auth.DoesNotExist:
         return {'success': False, 'error': 'No Garmin auth record found'}
 
-    activities_synced = 0
-
     try:
+        # Each sync gets its own client, so concurrent syncs never share tokens
+        client = garmin_client(garmin_auth)
+
         # Ensure tokens are valid
-        if not ensure_valid_tokens(garmin_auth):
+        if not ensure_valid_tokens(garmin_auth, client):
             return {'success': False, 'error': 'Token refresh failed'}
 
-        # Configure client with tokens (same as steps)
-        oauth1_data = {
-            'oauth_token': garmin_auth.oauth_token,
-            'oauth_token_secret': garmin_auth.oauth_token_secret,
-            'mfa_token': getattr(garmin_auth, 'mfa_token', None),
-            'mfa_expiration_timestamp': getattr(garmin_auth, 'mfa_expiration_timestamp', None),
-            'domain': getattr(garmin_auth, 'domain', None),
-        }
-        oauth2_data = {
-            'scope': garmin_auth.scope,
-            'jti': garmin_auth.jti,
-            'token_type': garmin_auth.token_type,
-            'access_token': garmin_auth.access_token,
-            'refresh_token': garmin_auth.refresh_token,
-            'expires_in': garmin_auth.expires_in,
-            'expires_at': garmin_auth.expires_at,
-            'refresh_token_expires_in': getattr(garmin_auth, 'refresh_token_expires_in', None),
-            'refresh_token_expires_at': getattr(garmin_auth, 'refresh_token_expires_at', None),
-        }
-        oauth1_token = garth.auth_tokens.OAuth1Token(**oauth1_data)
-        oauth2_token = garth.auth_tokens.OAuth2Token(**oauth2_data)
-        garth.client.configure(oauth1_token=oauth1_token, oauth2_token=oauth2_token)
-
-        # Build URL with date filter if provided
-        url = f"/activitylist-service/activities/search/activities?start=0&limit={limit}"
-        if start_date and end_date:
-            from_str = f"{start_date.isoformat()}T00:00:00"
-            to_str = f"{end_date.isoformat()}T23:59:59"
-            url += f"&startDateLocalFrom={from_str}&startDateLocalTo={to_str}"
-        # Fetch activities
-        activities = garth.client.connectapi(url)
-
-        if not activities:
-            logger.info(f"No activities found for user {user.id}")
-            return {'success': True, 'activities_synced': 0}
-
-        # Process each activity
-        for activity in activities:
-            try:
-                activity_id = activity.get('activityId')
-                if not activity_id:
-                    logger.warning(f"Skipping activity with missing ID for user {user.id}: {activity}")
-                    continue
-
-                start_ts_gmt = activity.get('startTimeGMT')
-                start_time_utc = None
-                if start_ts_gmt:
-                    try:
-                        if isinstance(start_ts_gmt, str):
-                            if ' ' in start_ts_gmt and '-' in start_ts_gmt:
-                                # Parse datetime string
-                                start_time_utc = datetime.strptime(start_ts_gmt, '%Y-%m-%d %H:%M:%S')
-                                start_time_utc = start_time_utc.replace(tzinfo=dt_timezone.utc)
-                            else:
-                                # Unix timestamp string to float
-                                start_ts_gmt = float(start_ts_gmt)
-                                start_time_utc = datetime.fromtimestamp(start_ts_gmt / 1000, tz=dt_timezone.utc)
-                        elif isinstance(start_ts_gmt, (int, float)):
-                            # Unix timestamp in milliseconds
-                            start_time_utc = datetime.fromtimestamp(start_ts_gmt / 1000, tz=dt_timezone.utc)
-                        else:
-                            logger.warning(f"Unexpected start time type for activity {activity_id}: {type(start_ts_gmt)}")
-                            continue
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Invalid start time format for activity {activity_id}: {start_ts_gmt} - {e}")
-                        continue
-                else:
-                    logger.warning(f"Missing start time for activity {activity_id} for user {user.id}")
-                    continue
-
-                defaults = {
-                    'name': activity.get('activityName', 'Unnamed Activity'),
-                    'activity_type': activity.get('activityType', {}).get('typeKey', 'unknown'),
-                    'start_time_utc': start_time_utc,
-                    'duration_seconds': activity.get('duration'),
-                    'distance_meters': activity.get('distance'),
-                    'calories': activity.get('calories'),
-                    'average_hr': activity.get('averageHR'),
-                    'max_hr': activity.get('maxHR'),
-                    'raw_data': activity
-                }
-                # Filter None values
-                defaults = {k: v for k, v in defaults.items() if v is not None}
-
-                obj, created = GarminActivity.objects.update_or_create(
-                    user=user,
-                    activity_id=activity_id,
-                    defaults=defaults
-                )
-                if created: activities_synced += 1
-
-                # Integrate CardioCoin rewards
-                if obj.calories and obj.calories > 0:
-                    from ..core.models import Transaction
-                    if not Transaction.objects.filter(
-                        user=user,
-                        currency_type='cardio_coins',
-                        garmin_activity=obj
-                    ).exists():
-                        join_month_start = user.date_joined.replace(day=1).date()
-                        one_week_after = (user.date_joined + timedelta(weeks=1)).date()
-                        activity_date = obj.start_time_utc.date()
-                        if join_month_start <= activity_date <= one_week_after:
-                            user.earn_cardio_coins(Decimal(str(obj.calories)), garmin_activity=obj)
-
-            except Exception as act_err:
-                logger.error(f"Error processing activity {activity.get('activityId', 'N/A')} for user {user.id}: {act_err}")
+        # Walk the activity list page by page, stopping at activities already stored once any backfill is done
+        counts = crawl_activities(garmin_auth, client, start_date, end_date, page_size=page_size, limit=limit)
+        logger.info(f"Synced activities for user {user.id}: {counts['created']} created, {counts['updated']} updated")
+
+        refresh_daily_metrics(user, counts['dates'])
+
+        save_client_tokens(garmin_auth, client)
+        if 'error' in counts:
+            # Days from the pages committed before the failure are rolled up; the next sync
+            # resumes the crawl at the failed page (Garmin_Auth.activity_backfill_offset)
+            return {
+                'success': False,
+                'error': counts['error'],
+                'activities_synced': counts['created'],
+                'activities_updated': counts['updated'],
+            }
 
         # Update last sync
         garmin_auth.last_sync = timezone.now()
         garmin_auth.save(update_fields=['last_sync'])
 
-        return {'success': True, 'activities_synced': activities_synced}
+        return {'success': True, 'activities_synced': counts['created'], 'activities_updated': counts['updated']}
 
     except Exception as e:
         logger.error(f"Unexpected error during activities sync for user {user.id}: {e}")
@@ -322,12 +138,8 @@ class ConnectGarminView(View):
                 existing_auth = Garmin_Auth.objects.filter(user=request.user)
                 if existing_auth.exists():
                     existing_auth.delete()
-                # Use Garth SSO login
-                garth.login(garmin_email, garmin_password)
-
-                # Get the OAuth tokens from Garth
-                oauth1_token = garth.client.oauth1_token
-                oauth2_token = garth.client.oauth2_token
+                # Use Garth SSO login on a client of this request's own
+                oauth1_token, oauth2_token = garth.Client().login(garmin_email, garmin_password)
 
                 if not oauth1_token or not oauth2_token:
                     raise ValueError("Failed to obtain OAuth tokens from Garth")
@@ -414,14 +226,13 @@ class SyncGarminView(LoginRequiredMixin, View):
         end_date = timezone.localtime().date()
         max_days = 30  # Limit for manual sync
         start_date = end_date.replace(day=1)
-        activity_limit = 500
 
         # Sync steps
         steps_result = perform_garmin_sync_steps(request.user, start_date, end_date)
         steps_synced = steps_result.get('steps_synced', 0) if steps_result.get('success') else 0
 
         # Sync activities
-        activities_result = perform_garmin_sync_activities(request.user, activity_limit)
+        activities_result = perform_garmin_sync_activities(request.user)
         activities_synced = activities_result.get('activities_synced', 0) if activities_result.get('success') else 0
 
         if steps_result.get('success') and activities_result.get('success'):
@@ -477,14 +288,13 @@ class BackgroundGarminSyncView(LoginRequiredMixin, View):
         # Default range for background sync: current month
         end_date = timezone.localtime().date()
         start_date = end_date.replace(day=1)
-        activity_limit = 500
 
         # Sync steps
         steps_result = perform_garmin_sync_steps(request.user, start_date, end_date)
         steps_synced = steps_result.get('steps_synced', 0) if steps_result.get('success') else 0
 
         # Sync activities
-        activities_result = perform_garmin_sync_activities(request.user, activity_limit)
+        activities_result = perform_garmin_sync_activities(request.user)
         activities_synced = activities_result.get('activities_synced', 0) if activities_result.get('success') else 0
 
         if steps_result.get('success') and activities_result.get('success'):
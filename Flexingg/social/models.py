@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 class Friendship(models.Model):
     STATUS_CHOICES = [
@@ -42,3 +45,18 @@ class Group(models.Model):
      
     def __str__(self): 
         return self.name
+
+
+@receiver(post_save, sender=GroupMembership)
+def add_to_group_leaderboards(sender, instance, created, **kwargs):
+    if created:
+        from core.leaderboards import add_group_member
+        user_id, group_id = instance.user_id, instance.group_id
+        transaction.on_commit(lambda: add_group_member(user_id, group_id, timezone.localdate()))
+
+
+@receiver(post_delete, sender=GroupMembership)
+def remove_from_group_leaderboards(sender, instance, **kwargs):
+    from core.leaderboards import remove_group_member
+    user_id, group_id = instance.user_id, instance.group_id
+    transaction.on_commit(lambda: remove_group_member(user_id, group_id, timezone.localdate()))
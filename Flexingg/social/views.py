@@ -4,6 +4,11 @@ from core.models import UserProfile
 from django.urls import reverse
 from django.db.models import Q
 from .models import Friendship, Group, GroupMembership
+from core.views import leaderboard_stream_url
+from core.leaderboards import (
+    closed_period_start, get_leaderboard, get_snapshot_standings, hydrate_leaderboard, rank_members,
+    snapshot_periods, top_period_totals
+)
 from django import forms
 
 class GroupForm(forms.ModelForm):
@@ -154,14 +159,25 @@ def leave_group(request, group_id):
         membership.delete()
     return redirect('social:group_list')
 
+# social_main categories and history filters -> core.leaderboards metrics and periods
+SOCIAL_LEADERBOARD_METRICS = {
+    'steps': 'steps',
+    'calories': 'calories',
+    'sweat': 'sweat_score',
+    'coins': 'cardio_coins',
+    'gems': 'gym_gems',
+}
+SOCIAL_LEADERBOARD_PERIODS = {
+    'All Time': 'all',
+    'Weekly': 'week',
+    'Monthly': 'month',
+}
+
 @login_required
 def social_main(request):
     from core.models import UserProfile
-    from garminconnect.models import GarminDailySteps, GarminActivity
-    from django.db.models import Sum, F, Value, IntegerField, DecimalField
+    from django.db.models import Value, IntegerField
     from django.db.models.functions import Coalesce
-    from django.db.models import FloatField
-    from core.models import Transaction
     from datetime import timedelta, date
     from django.utils import timezone
 
@@ -182,6 +198,7 @@ def social_main(request):
         cutoff = date(2000, 1, 1)
 
     # Base users queryset based on scope
+    board_group_id = None
     if current_scope == 'friends':
         users = UserProfile.objects.filter(
             Q(friendship_requests_sent__to_user=request.user, friendship_requests_sent__status='accepted') |
@@ -194,16 +211,20 @@ def social_main(request):
             # Redirect to global or error, but for now, use all
             users = UserProfile.objects.none()
         else:
-            users = UserProfile.objects.filter(member_groups__group=group)
+            users = UserProfile.objects.filter(member_groups=group)
+            board_group_id = group.id
     else:
         users = UserProfile.objects.all()
 
+    # Categories in SOCIAL_LEADERBOARD_METRICS are ranked from the leaderboard totals;
+    # the others have no data yet and are annotated with their constant value
     available_metrics = {
-        'steps': {'field': Sum('garmin_daily_steps__steps', filter=Q(garmin_daily_steps__date__gte=cutoff)), 'label': 'Steps', 'default': 0, 'output_field': IntegerField()},
+        'steps': {'label': 'Steps', 'default': 0},
         'lifts': {'field': Value(0), 'label': 'Lifts', 'default': 0, 'output_field': IntegerField()},
-        'calories': {'field': Sum('garmin_activities__calories', filter=Q(garmin_activities__start_time_utc__date__gte=cutoff)), 'label': 'Calories Burned', 'default': 0.0, 'output_field': FloatField()},
-        'coins': {'field': Sum('transactions__amount', filter=Q(transactions__currency_type='cardio_coins', transactions__created_at__date__gte=cutoff)), 'label': 'Coins', 'default': 0.0, 'output_field': DecimalField()},
-        'gems': {'field': Sum('transactions__amount', filter=Q(transactions__currency_type='gym_gems', transactions__created_at__date__gte=cutoff)), 'label': 'Gems', 'default': 0.0, 'output_field': DecimalField()},
+        'calories': {'label': 'Calories Burned', 'default': 0.0},
+        'sweat': {'label': 'Sweat Score', 'default': 0.0},
+        'coins': {'label': 'Coins', 'default': 0.0},
+        'gems': {'label': 'Gems', 'default': 0.0},
         'sleep': {'field': Value(0), 'label': 'Sleep', 'default': 0, 'output_field': IntegerField()},
         'consumed': {'field': Value(0), 'label': 'Consumed', 'default': 0, 'output_field': IntegerField()},
         'water': {'field': Value(0), 'label': 'Water', 'default': 0, 'output_field': IntegerField()},
@@ -214,35 +235,65 @@ def social_main(request):
 
     info = available_metrics[current_category]
 
-    # Annotate once
-    annotated_users = users.annotate(
-        metric_value=Coalesce(info['field'], Value(info['default']), output_field=info['output_field'])
-    ).order_by('-metric_value')
+    # Closed weeks/months (?start=) are served from the frozen snapshots, the open
+    # period from the Redis leaderboard sets when they are available
+    metric = SOCIAL_LEADERBOARD_METRICS.get(current_category)
+    period = SOCIAL_LEADERBOARD_PERIODS.get(current_history, 'all')
+    scoped = current_scope == 'friends' or (current_scope == 'group' and group_id)
+    snapshot_start = None
+    closed_periods = []
+    if metric and period != 'all':
+        snapshot_start = closed_period_start(request.GET.get('start'), period, timezone.localdate())
+        closed_periods = snapshot_periods(metric, period)
 
-    # Top 5 for podium
-    users_query = annotated_users[:5]
-    users = [
-        {
-            'rank': i + 1,
-            'name': u.username,
-            'metric_value': float(u.metric_value) if u.metric_value is not None else float(info['default']),
-            'avatar': u.avatar.url if u.avatar else None
-        }
-        for i, u in enumerate(users_query)
-    ]
+    board = None
+    if metric and not snapshot_start:
+        board = get_leaderboard(metric, period, timezone.localdate(), group_id=board_group_id)
+
+    if snapshot_start:
+        ranked_users = get_snapshot_standings(
+            metric, period, snapshot_start,
+            group_id=group_id if current_scope == 'group' else None,
+            user_ids=list(users.values_list('id', flat=True)) if scoped else None,
+            last_rank=10
+        )
+    elif board is not None:
+        if scoped and not board_group_id:
+            ranked_users = rank_members(board, users, default=info['default'])[:10]
+        else:
+            ranked_users = hydrate_leaderboard(board.page(0, 10))
+    elif metric:
+        # One grouped query over the pre-summed daily rows for the top 10
+        ranked_users = top_period_totals(
+            metric, None if period == 'all' else cutoff, users=users if scoped else None
+        )
+    else:
+        ranked_users = list(users.annotate(
+            metric_value=Coalesce(info['field'], Value(info['default']), output_field=info['output_field'])
+        ).order_by('-metric_value')[:10])
+        for rank, u in enumerate(ranked_users, 1):
+            u.rank = rank
+
+    # Live updates for the slots on screen, read from the same Redis board. The friends
+    # scope here comes from core friendships, which the stream does not follow.
+    stream_url = None
+    if board is not None and not (scoped and not board_group_id):
+        stream_url = leaderboard_stream_url(
+            metric, period, current_scope, board_group_id, [u.rank for u in ranked_users]
+        )
 
-    # Top 10 for list
-    list_users_query = annotated_users[:10]
     list_users = [
         {
-            'rank': i + 1,
+            'rank': u.rank,
             'name': u.username,
             'metric_value': float(u.metric_value) if u.metric_value is not None else float(info['default']),
             'avatar': u.avatar.url if u.avatar else None
         }
-        for i, u in enumerate(list_users_query)
+        for u in ranked_users
     ]
-    list_users = list_users[3:] if len(list_users) > 3 else []
+    # Top 5 for podium, the rest of the top 10 for the list
+    users = list_users[:5]
+    list_users = list_users[3:]
 
     # Pass user groups for group selection
     user_groups = list(request.user.member_groups.values('id', 'name')) if current_scope == 'group' and not group_id else []
@@ -256,6 +307,9 @@ def social_main(request):
         'current_history': current_history,
         'current_scope': current_scope,
         'group_id': group_id,
+        'snapshot_start': snapshot_start,
+        'snapshot_periods': closed_periods,
+        'stream_url': stream_url,
         'available_categories': list(available_metrics.keys()),
         'user_groups': user_groups
     })
\ No newline at end of file
@@ -0,0 +1,45 @@
+// Live leaderboard updates: the stream sends the slots (ranks) whose entry changed,
+// and each one is written into the element marked data-leaderboard-slot="<rank>".
+function applyLeaderboardSlot(entry) {
+    const slot = document.querySelector(`[data-leaderboard-slot="${entry.rank}"]`);
+    if (!slot) {
+        return;
+    }
+    if (entry.user_id === null) {
+        slot.classList.add('hidden');
+        return;
+    }
+    slot.classList.remove('hidden');
+
+    const name = slot.querySelector('[data-slot-name]');
+    if (name) {
+        name.textContent = entry.username;
+    }
+    const value = slot.querySelector('[data-slot-value]');
+    if (value) {
+        value.textContent = Math.round(entry.value);
+    }
+    const avatar = slot.querySelector('[data-slot-avatar]');
+    if (avatar) {
+        avatar.src = entry.avatar || avatar.dataset.placeholder + entry.username.charAt(0).toUpperCase();
+        avatar.alt = `${entry.username} avatar`;
+    }
+}
+
+function connectLeaderboardStream(url) {
+    if (!window.EventSource) {
+        return null;
+    }
+    const source = new EventSource(url);
+    source.addEventListener('message', (event) => {
+        let entries;
+        try {
+            entries = JSON.parse(event.data);
+        } catch (e) {
+            console.error('Bad leaderboard update', e);
+            return;
+        }
+        entries.forEach(applyLeaderboardSlot);
+    });
+    return source;
+}